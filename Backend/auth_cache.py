@@ -0,0 +1,46 @@
+import hashlib
+from collections import OrderedDict
+from time import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError
+
+
+class TokenVerifier:
+    """
+    Verifies user JWTs, caching the verified claims in a bounded LRU keyed by a digest of the
+    token. A cached token is only trusted until its own `exp`; after that it is dropped and
+    reported as expired, exactly as jwt.decode would. Invalid tokens are never cached.
+    """
+
+    def __init__(self, secret: str, algorithms: List[str], max_entries: int = 10000):
+        self.secret = secret
+        self.algorithms = algorithms
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[bytes, Tuple[Optional[float], Dict[str, Any]]]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the token's claims. Raises JWTError if it is invalid or expired."""
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self._cache.get(key)
+        if entry is not None:
+            expires_at, claims = entry
+            if expires_at is not None and expires_at <= time():
+                del self._cache[key]
+                raise ExpiredSignatureError("Signature has expired.")
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return claims
+
+        self.stats["misses"] += 1
+        claims = jwt.decode(token, self.secret, algorithms=self.algorithms)
+        exp = claims.get("exp")
+        self._cache[key] = (float(exp) if exp is not None else None, claims)
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return claims
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "entries": len(self._cache)}
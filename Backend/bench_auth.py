@@ -0,0 +1,56 @@
+"""
+Micro-benchmark: cost of authenticating a request.
+
+    python bench_auth.py [--requests 100000] [--users 100]
+
+Signs `--users` tokens the way /signin does and authenticates `--requests` requests spread
+over them, first with a jwt.decode per request (as every route did before) and then through
+the shared TokenVerifier cache used by get_current_user. Prints the mean cost per request.
+"""
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+
+from jose import jwt
+
+from auth_cache import TokenVerifier
+
+SECRET_KEY = "bench-secret"
+ALGORITHM = "HS256"
+
+
+def _tokens(users: int):
+    expire = datetime.now(timezone.utc) + timedelta(minutes=30)
+    return [
+        jwt.encode({"sub": f"user{i}@example.com", "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+        for i in range(users)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=100, help="distinct tokens in use")
+    args = parser.parse_args()
+
+    tokens = _tokens(args.users)
+    stream = [random.choice(tokens) for _ in range(args.requests)]
+
+    started = perf_counter()
+    for token in stream:
+        jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    before = (perf_counter() - started) / args.requests
+
+    verifier = TokenVerifier(SECRET_KEY, [ALGORITHM])
+    started = perf_counter()
+    for token in stream:
+        verifier.verify(token)
+    after = (perf_counter() - started) / args.requests
+
+    print(f"{'jwt.decode':>14}: {before * 1e6:8.2f}us per request")
+    print(f"{'TokenVerifier':>14}: {after * 1e6:8.2f}us per request  ({before / after:.0f}x, {verifier.snapshot()})")
+
+
+if __name__ == "__main__":
+    main()
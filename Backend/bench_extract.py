@@ -0,0 +1,139 @@
+"""
+Micro-benchmark: pulling the answer text out of Langflow run responses.
+
+    python bench_extract.py [--steps 3000] [--repeat 20] [--fixtures bench_fixtures/langflow_responses]
+
+Each fixture in `--fixtures` is a synthetic Langflow/Astra run response with the answer in one
+of the known shapes (or in none of them, for unknown_shape.json). The empty `contents`/`steps`
+list in each is filled with `--steps` tool-trace steps, the way an agent response carries its
+tool calls, and the result is timed two ways:
+
+    decode   json.loads vs. response_extract.loads (orjson when installed)
+    extract  the previous recursive walk vs. LangflowClient.extract_response_text
+
+Both extractors' output is printed in short so a change in what is returned is visible too.
+"""
+import argparse
+import json
+import os
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Union
+
+from langflow import LangflowClient
+from response_extract import loads, orjson
+
+TRACE_KEYS = ("contents", "steps")
+
+
+def _tool_step(i: int) -> Dict[str, Any]:
+    return {
+        "type": "tool_use",
+        "name": "search_hotels" if i % 2 else "search_transport",
+        "tool_input": {"query": f"hotels near landmark {i}", "page": i % 5},
+        "output": {"results": [
+            {"title": f"Option {i}.{j}", "text": f"Result {i}.{j}: 4.{j} stars, from Rs {1500 + j * 250} per night"}
+            for j in range(3)
+        ]},
+        "duration": 120 + i % 400,
+    }
+
+
+def _inflate(obj: Any, steps: int) -> bool:
+    """Fill the first empty trace list in `obj` with tool steps. False if there is none."""
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key in TRACE_KEYS and value == []:
+                value.extend(_tool_step(i) for i in range(steps))
+                return True
+            if _inflate(value, steps):
+                return True
+    elif isinstance(obj, list):
+        return any(_inflate(item, steps) for item in obj)
+    return False
+
+
+def previous_extract(response: Dict[str, Any]) -> str:
+    """extract_response_text as it was: one known path, then a recursive walk of the whole tree."""
+
+    def collect_text(obj: Union[Dict[str, Any], List[Any], Any], acc: List[str]):
+        if isinstance(obj, dict):
+            if "results" in obj and isinstance(obj["results"], dict):
+                msg = obj["results"].get("message") or obj["results"].get("text")
+                if isinstance(msg, dict):
+                    text_val = msg.get("text") or msg.get("content")
+                    if text_val:
+                        acc.append(str(text_val))
+                elif isinstance(msg, str):
+                    acc.append(msg)
+            if "text" in obj and isinstance(obj["text"], str):
+                acc.append(obj["text"])
+            for v in obj.values():
+                collect_text(v, acc)
+        elif isinstance(obj, list):
+            for item in obj:
+                collect_text(item, acc)
+
+    if "outputs" in response and response["outputs"]:
+        outputs = response["outputs"]
+        if isinstance(outputs, list) and outputs:
+            first_output = outputs[0]
+            if "outputs" in first_output and first_output["outputs"]:
+                nested_outputs = first_output["outputs"]
+                if isinstance(nested_outputs, list) and nested_outputs:
+                    maybe = nested_outputs[0].get("results", {}).get("message", {}).get("text")
+                    if maybe:
+                        return str(maybe)
+    acc: List[str] = []
+    collect_text(response, acc)
+    acc = [s.strip() for s in acc if s and s.strip()]
+    return "\n\n".join(dict.fromkeys(acc))
+
+
+def _time(fn: Callable[[Any], Any], arg: Any, repeat: int) -> float:
+    started = perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    return (perf_counter() - started) / repeat
+
+
+def _fmt(seconds: float) -> str:
+    return f"{seconds * 1e3:9.3f}ms" if seconds >= 1e-3 else f"{seconds * 1e6:9.1f}us"
+
+
+def _short(text: str) -> str:
+    return f"{len(text)} chars, {text[:40]!r}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=3000, help="tool-trace steps added to each fixture")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(__file__) or ".", "bench_fixtures", "langflow_responses"))
+    args = parser.parse_args()
+
+    client = LangflowClient()
+    print(f"{args.steps} tool steps per response, orjson {'installed' if orjson else 'not installed'}")
+    for name in sorted(os.listdir(args.fixtures)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(args.fixtures, name), encoding="utf-8") as fh:
+            response = json.load(fh)
+        if not _inflate(response, args.steps):
+            print(f"{name}: no empty contents/steps list to fill, skipped")
+            continue
+        body = json.dumps(response).encode()
+
+        json_loads = _time(json.loads, body, args.repeat)
+        fast_loads = _time(loads, body, args.repeat)
+        before = _time(previous_extract, response, args.repeat)
+        after = _time(client.extract_response_text, response, args.repeat)
+
+        print(f"{name} ({len(body) / 1e6:.1f} MB)")
+        print(f"  decode   json {_fmt(json_loads)}  loads {_fmt(fast_loads)}  ({json_loads / fast_loads:.1f}x)")
+        print(f"  extract  previous {_fmt(before)}  now {_fmt(after)}  ({before / after:.1f}x)")
+        print(f"    previous: {_short(previous_extract(response))}")
+        print(f"    now:      {_short(client.extract_response_text(response))}")
+
+
+if __name__ == "__main__":
+    main()
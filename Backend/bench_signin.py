@@ -0,0 +1,108 @@
+"""
+Load test: latency of other endpoints during a sign-in storm.
+
+    python bench_signin.py [--seconds 5] [--storm 50] [--probe-interval-ms 10]
+
+Runs the app in-process (httpx ASGITransport, no server or MongoDB needed) and keeps probing a
+cheap endpoint while `--storm` concurrent sign-ins verify a bcrypt password, then prints the
+probe latency percentiles for three phases:
+
+    idle    no sign-in traffic
+    inline  passlib called directly on the event loop, as /signin did before
+    pool    the app's PasswordHasher (PASSWORD_HASH_WORKERS threads, bounded queue)
+
+Sign-ins rejected by the pool's queue bound (503 on /signin) are counted, not retried.
+"""
+import argparse
+import asyncio
+import os
+from time import perf_counter
+from typing import List, Optional
+
+import httpx
+
+PASSWORD = "correct horse battery staple"
+PROBE_PATH = "/metrics"
+
+
+async def _probe(client: httpx.AsyncClient, stop: asyncio.Event, interval: float) -> List[float]:
+    timings = []
+    while not stop.is_set():
+        started = perf_counter()
+        response = await client.get(PROBE_PATH)
+        response.raise_for_status()
+        timings.append((perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+    return timings
+
+
+async def _storm(app_main, mode: str, hashed: str, stop: asyncio.Event, counts: dict) -> None:
+    from password_hasher import PasswordHasherBusy
+
+    while not stop.is_set():
+        if mode == "inline":
+            app_main.pwd_context.verify_and_update(PASSWORD, hashed)
+        else:
+            try:
+                await app_main.verify_password(PASSWORD, hashed)
+            except PasswordHasherBusy:
+                counts["rejected"] += 1
+                await asyncio.sleep(0.05)
+                continue
+        counts["signins"] += 1
+        await asyncio.sleep(0)
+
+
+def _percentile(timings: List[float], q: float) -> float:
+    return timings[min(int(len(timings) * q), len(timings) - 1)]
+
+
+async def _phase(app_main, client, name: str, mode: Optional[str], storm: int, seconds: float,
+                 interval: float, hashed: str) -> None:
+    stop = asyncio.Event()
+    counts = {"signins": 0, "rejected": 0}
+    stormers = [asyncio.create_task(_storm(app_main, mode, hashed, stop, counts)) for _ in range(storm if mode else 0)]
+    probe = asyncio.create_task(_probe(client, stop, interval))
+    started = perf_counter()
+    await asyncio.sleep(seconds)
+    stop.set()
+    timings = sorted(await probe)
+    await asyncio.gather(*stormers)
+    # A blocked loop overshoots the phase length, so rates use the real duration
+    elapsed = perf_counter() - started
+    print(
+        f"{name:>6}: probes={len(timings):>5} p50={_percentile(timings, 0.5):7.1f}ms "
+        f"p99={_percentile(timings, 0.99):7.1f}ms max={timings[-1]:7.1f}ms  "
+        f"signins={counts['signins'] / elapsed:6.1f}/s rejected={counts['rejected']} elapsed={elapsed:.1f}s"
+    )
+
+
+async def run(seconds: float, storm: int, interval: float) -> None:
+    os.environ.setdefault("MONGODB_URL", "mongodb://127.0.0.1:27017")
+    os.environ.setdefault("DB_NAME", "wanderpal_bench")
+    os.environ["TRACING"] = "false"
+    os.environ["LOOP_MONITOR"] = "false"
+    import main as app_main
+
+    hashed = app_main.pwd_context.hash(PASSWORD)
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{storm} concurrent sign-ins, {app_main.password_hasher.workers} hash threads, "
+              f"probing GET {PROBE_PATH} every {interval * 1000:.0f}ms for {seconds:.0f}s per phase")
+        await _phase(app_main, client, "idle", None, storm, seconds, interval, hashed)
+        await _phase(app_main, client, "inline", "inline", storm, seconds, interval, hashed)
+        await _phase(app_main, client, "pool", "pool", storm, seconds, interval, hashed)
+    app_main.password_hasher.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--storm", type=int, default=50, help="concurrent sign-in loops")
+    parser.add_argument("--probe-interval-ms", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.seconds, args.storm, args.probe_interval_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Memory benchmark for the in-memory chat task backend.
+
+    python bench_tasks.py [--tasks 1000000] [--batch 1000] [--max-tasks 10000] [--ttl 900]
+
+Pushes simulated chat tasks through MemoryTaskBackend (enqueue, run a trivial handler,
+complete, and have a waiter read each result) and prints the process's peak RSS and the
+number of tasks held at regular checkpoints (Unix only). The previous implementation, a plain
+dict that never evicts, runs afterwards for comparison unless --skip-dict is given; its peak
+RSS starts from wherever the TaskStore run left it.
+"""
+import argparse
+import asyncio
+import resource
+import uuid
+from time import perf_counter
+from typing import Dict
+
+from task_queue import MemoryTaskBackend
+from task_store import TaskStore
+
+RESULT = "Here is a 3 day itinerary for Jaipur: Amber Fort, City Palace, Hawa Mahal. " * 4
+
+
+async def _handler(task_id: str, payload: dict) -> str:
+    return RESULT
+
+
+def _checkpoint(name: str, done: int, held: int, started: float) -> None:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(f"{name:>5}: {done:>9} tasks  held={held:>9}  peak_rss={peak_rss:8.1f}MiB  "
+          f"elapsed={perf_counter() - started:6.1f}s")
+
+
+async def bench_store(tasks: int, batch: int, max_tasks: int, ttl: float, every: int) -> None:
+    backend = MemoryTaskBackend(TaskStore(max_tasks=max_tasks, finished_ttl=ttl), concurrency=batch)
+    await backend.start(_handler)
+    started = perf_counter()
+    for done in range(batch, tasks + 1, batch):
+        ids = [await backend.enqueue({"message": "Plan a trip", "conversation_id": "c"}) for _ in range(batch)]
+        await asyncio.gather(*(backend.wait(task_id, timeout=5) for task_id in ids))
+        if done % every == 0:
+            _checkpoint("store", done, len(backend.store), started)
+    await backend.stop()
+
+
+async def bench_dict(tasks: int, batch: int, every: int) -> None:
+    """The previous `_tasks` global: one dict entry per task, kept forever."""
+    store: Dict[str, dict] = {}
+    lock = asyncio.Lock()
+    started = perf_counter()
+    for done in range(batch, tasks + 1, batch):
+        for _ in range(batch):
+            task_id = str(uuid.uuid4())
+            async with lock:
+                store[task_id] = {"status": "pending", "result": None, "error": None}
+            async with lock:
+                store[task_id].update(status="done", result=await _handler(task_id, {}))
+        if done % every == 0:
+            _checkpoint("dict", done, len(store), started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=1_000, help="tasks in flight at once")
+    parser.add_argument("--max-tasks", type=int, default=10_000, help="TaskStore size cap (MAX_TASKS)")
+    parser.add_argument("--ttl", type=float, default=900, help="finished task TTL (TASK_RESULT_TTL_SECONDS)")
+    parser.add_argument("--checkpoints", type=int, default=10)
+    parser.add_argument("--skip-dict", action="store_true", help="only run the TaskStore backend")
+    args = parser.parse_args()
+    every = max(args.tasks // args.checkpoints // args.batch, 1) * args.batch
+
+    asyncio.run(bench_store(args.tasks, args.batch, args.max_tasks, args.ttl, every))
+    if not args.skip_dict:
+        asyncio.run(bench_dict(args.tasks, args.batch, every))
+
+
+if __name__ == "__main__":
+    main()
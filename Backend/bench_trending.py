@@ -0,0 +1,153 @@
+"""
+Benchmark /trending against a local stub OpenTripMap server.
+
+    python bench_trending.py [--requests 20] [--detail-latency-ms 150] [--jitter-ms 100]
+
+Starts a stub of the two OpenTripMap endpoints /trending uses (`places/radius` returning 10
+places, `places/xid/{xid}` answering after the given latency plus random jitter), then times:
+
+    sequential  the previous implementation: details fetched one after another over a new client
+    concurrent  the current /trending handler: pooled client, details fetched concurrently
+
+The trending cache is disabled for the run, so every request goes to the stub. No API key,
+MongoDB or network access is needed.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+from time import perf_counter
+from typing import List
+
+import httpx
+import uvicorn
+
+PLACES = 10
+
+
+def _stub_app(detail_latency: float, jitter: float):
+    """Minimal ASGI app answering like OpenTripMap's radius and xid endpoints."""
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        path = scope["path"]
+        if path.endswith("/places/radius"):
+            body = {"type": "FeatureCollection", "features": [
+                {"type": "Feature", "properties": {"xid": f"N{i}", "name": f"Place {i}"}} for i in range(PLACES)
+            ]}
+        elif "/places/xid/" in path:
+            await asyncio.sleep(detail_latency + random.uniform(0, jitter))
+            xid = path.rsplit("/", 1)[-1]
+            body = {
+                "xid": xid,
+                "name": f"Place {xid}",
+                "kinds": "historic,architecture",
+                "address": {"city": "Jaipur"},
+                "preview": {"source": f"https://example.invalid/{xid}.jpg"},
+                "wikipedia_extracts": {"text": "A well known landmark. " * 20},
+                "otm": f"https://opentripmap.com/en/card/{xid}",
+            }
+        else:
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        payload = httpx.Response(200, json=body).content
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": payload})
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _sequential_trending(base_url: str, lat: float, lon: float, radius: int) -> dict:
+    """The /trending implementation before concurrent detail fetching, for comparison."""
+    async with httpx.AsyncClient() as client:
+        resp = await client.get(f"{base_url}places/radius", params={
+            "apikey": "bench", "radius": radius, "lon": lon, "lat": lat, "rate": 3, "format": "geojson", "limit": 10,
+        })
+        features = resp.json().get("features")
+    trending = []
+    async with httpx.AsyncClient() as client:
+        for feat in features:
+            xid = feat.get("properties", {}).get("xid")
+            detail_resp = await client.get(f"{base_url}places/xid/{xid}", params={"apikey": "bench"})
+            if detail_resp.status_code == 200:
+                detail = detail_resp.json()
+                trending.append({"name": detail.get("name"), "xid": xid})
+    return {"trending": trending}
+
+
+def _report(name: str, timings: List[float]) -> None:
+    timings.sort()
+    print(
+        f"{name:>10}: p50={timings[len(timings) // 2]:.0f}ms "
+        f"p95={timings[min(int(len(timings) * 0.95), len(timings) - 1)]:.0f}ms "
+        f"mean={sum(timings) / len(timings):.0f}ms"
+    )
+
+
+async def run(requests: int, detail_latency: float, jitter: float) -> None:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}/0.1/en/"
+    server = uvicorn.Server(uvicorn.Config(
+        _stub_app(detail_latency, jitter), host="127.0.0.1", port=port, log_level="warning",
+    ))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    # Point the app at the stub with caching off, before it reads its configuration
+    os.environ["OPENTRIPMAP_BASE_URL"] = base_url
+    os.environ["OPENTRIPMAP_API_KEY"] = "bench"
+    os.environ["TRENDING_RADIUS_TTL_SECONDS"] = "0"
+    os.environ["TRENDING_DETAIL_TTL_SECONDS"] = "0"
+    os.environ.setdefault("MONGODB_URL", "mongodb://127.0.0.1:27017")
+    os.environ.setdefault("DB_NAME", "wanderpal_bench")
+    import main
+
+    try:
+        print(f"{requests} requests, {PLACES} places each, "
+              f"detail latency {detail_latency * 1000:.0f}ms + up to {jitter * 1000:.0f}ms jitter")
+        for name, handler in (
+            ("sequential", lambda: _sequential_trending(base_url, 26.9, 75.8, 30000)),
+            ("concurrent", lambda: main.trending(26.9, 75.8, 30000)),
+        ):
+            timings = []
+            for _ in range(requests):
+                started = perf_counter()
+                result = await handler()
+                timings.append((perf_counter() - started) * 1000)
+                assert len(result["trending"]) == PLACES, result
+            _report(name, timings)
+    finally:
+        if main._otm_client is not None:
+            await main._otm_client.aclose()
+        server.should_exit = True
+        await serve
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--detail-latency-ms", type=float, default=150)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.detail_latency_ms / 1000, args.jitter_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+In-process pre-router for chat messages.
+
+Trivial messages ("hi", "thanks", "what can you do?") don't need a Langflow agent run. The
+router matches the normalized message against compiled whole-message patterns first; if
+nothing matches and a local classifier is plugged in, short messages are offered to it too.
+A match returns a canned reply; anything else (`None`) goes to the agent as before. Patterns
+must cover the whole message, so "hi, plan 3 days in Goa" is never swallowed by the greeting.
+
+FAQ entries are loaded from a JSON file (INTENT_FAQ_PATH) of the form
+    [{"name": "refunds", "patterns": ["how do refunds work", "refund policy"], "reply": "..."}]
+"""
+import importlib
+import json
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from log_config import get_logger
+from metrics import counter
+from response_cache import normalize_query
+
+logger = get_logger("intent_router")
+
+INTENT_ROUTES = counter(
+    "wanderpal_chat_intent_routes_total",
+    "Chat messages by pre-router decision: a local intent, or 'agent' for a Langflow run.",
+    ("intent",),
+)
+
+# Returns (intent name, confidence in [0, 1]) or (None, 0.0)
+Classifier = Callable[[str], Tuple[Optional[str], float]]
+
+
+class IntentRule(NamedTuple):
+    name: str
+    patterns: Tuple[str, ...]
+    reply: str
+
+
+class IntentMatch(NamedTuple):
+    intent: str
+    reply: str
+    source: str  # "pattern" or "classifier"
+
+
+BUILTIN_RULES: Tuple[IntentRule, ...] = (
+    IntentRule(
+        "greeting",
+        (r"(hi+|hello+|hey+|heya|hiya|yo|howdy|namaste|greetings)( there)?( wanderpal)?",
+         r"good (morning|afternoon|evening)( wanderpal)?"),
+        "Hi! I'm WanderPal, your travel companion. Tell me where you'd like to go, your dates "
+        "and budget, and I'll help you plan the trip.",
+    ),
+    IntentRule(
+        "thanks",
+        (r"(thanks?|thank you|thankyou|thx|ty)( (so|very) much| a lot)?( wanderpal)?",
+         # A bare "ok" or "great" is usually an answer to the agent's last question, not thanks
+         r"(great|awesome|perfect|cool|ok|okay) (thanks?|thank you)"),
+        "You're welcome! Let me know if there's anything else you'd like to plan.",
+    ),
+    IntentRule(
+        "goodbye",
+        (r"(bye+|goodbye|good bye|see you|see ya|cya)( later| soon)?",),
+        "Goodbye, and happy travels! Come back any time you want to plan a trip.",
+    ),
+    IntentRule(
+        "help",
+        (r"help( me)?", r"what can you do", r"how (does|do) (this|you) work", r"who are you",
+         r"what are you", r"how can you help( me)?"),
+        "I can plan trips end to end: day-by-day itineraries, hotels for your dates, trains, "
+        "buses and flights between cities, restaurants, and what's worth seeing. Try something "
+        "like \"Plan a 3-day trip to Jaipur from Delhi next weekend under 15000 rupees\".",
+    ),
+)
+
+
+class IntentRouter:
+    def __init__(
+        self,
+        rules: Iterable[IntentRule] = BUILTIN_RULES,
+        classifier: Optional[Classifier] = None,
+        min_confidence: float = 0.85,
+        classifier_max_words: int = 6,
+    ):
+        self.rules = list(rules)
+        self.replies: Dict[str, str] = {rule.name: rule.reply for rule in self.rules}
+        # One alternation with a named group per rule: a single regex pass per message
+        self._pattern = re.compile(
+            "|".join(f"(?P<r{i}>(?:{'|'.join(rule.patterns)}))" for i, rule in enumerate(self.rules))
+        ) if self.rules else None
+        self.classifier = classifier
+        self.min_confidence = min_confidence
+        self.classifier_max_words = classifier_max_words
+
+    def route(self, message: str) -> Optional[IntentMatch]:
+        """The local answer for `message`, or None if it should go to the agent."""
+        text = normalize_query(message)
+        match = self._match(text)
+        if match is None:
+            INTENT_ROUTES.inc(intent="agent")
+        else:
+            INTENT_ROUTES.inc(intent=match.intent)
+        return match
+
+    def _match(self, text: str) -> Optional[IntentMatch]:
+        if not text:
+            return None
+        if self._pattern is not None:
+            found = self._pattern.fullmatch(text)
+            if found is not None:
+                rule = self.rules[int(found.lastgroup[1:])]
+                return IntentMatch(rule.name, rule.reply, "pattern")
+        # The classifier only sees short messages: longer ones almost always carry a real request
+        if self.classifier is not None and len(text.split()) <= self.classifier_max_words:
+            try:
+                intent, confidence = self.classifier(text)
+            except Exception as e:
+                # A broken classifier must not break chat: the message goes to the agent
+                logger.error("Intent classifier failed: %s", e)
+                return None
+            if intent in self.replies and confidence >= self.min_confidence:
+                return IntentMatch(intent, self.replies[intent], "classifier")
+        return None
+
+
+def load_faq_rules(path: str) -> List[IntentRule]:
+    """FAQ rules from a JSON file; patterns are matched against the normalized message
+    (lowercase, no punctuation), so write them that way."""
+    with open(path, encoding="utf-8") as fh:
+        entries = json.load(fh)
+    return [
+        IntentRule(f"faq:{entry['name']}", tuple(entry["patterns"]), entry["reply"])
+        for entry in entries
+    ]
+
+
+def load_classifier(spec: str) -> Classifier:
+    """Import a classifier given as "package.module:function"."""
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
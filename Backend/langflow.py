@@ -1,9 +1,551 @@
 import httpx
 import os
-from typing import Dict, Any, Optional, Union, List
-import json
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Tuple
 from urllib.parse import urljoin
 import asyncio
+import hashlib
+import uuid
+import math
+import re
+from collections import deque
+from contextlib import asynccontextmanager
+from time import monotonic
+from urllib.parse import urlsplit
+
+from intent_router import BUILTIN_RULES, IntentRouter, load_classifier, load_faq_rules
+from log_config import get_logger
+from metrics import UPSTREAM_REQUEST_SECONDS, counter, status_outcome
+from response_cache import ResponseCache
+from response_extract import collect_text, known_shape_text, loads
+from token_counter import TokenCounter, fit_history
+from tracing import span
+
+logger = get_logger("langflow")
+
+LANGFLOW_RETRIES = counter(
+    "wanderpal_langflow_retries_total", "Langflow run attempts retried, by reason.", ("reason",)
+)
+LANGFLOW_TIMEOUTS = counter("wanderpal_langflow_timeouts_total", "Langflow requests that timed out.")
+LANGFLOW_AUTH_PROBES = counter(
+    "wanderpal_langflow_auth_probes_total",
+    "Alternate auth header shapes tried after a 401, by outcome.",
+    ("outcome",),
+)
+LANGFLOW_HEDGES = counter("wanderpal_langflow_hedges_total", "Hedged Langflow requests, fired and won.", ("result",))
+
+
+# --- Shared HTTP connection pool ---
+# One long-lived AsyncClient per process so consecutive chat turns reuse the same
+# TCP/TLS connection to Langflow/Astra instead of re-handshaking on every message.
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 is opt-in and needs the optional `h2` package (pip install httpx[http2])."""
+    if os.getenv("LANGFLOW_HTTP2", "false").lower() != "true":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("LANGFLOW_HTTP2=true but the 'h2' package is not installed; falling back to HTTP/1.1")
+        return False
+    return True
+
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """Get or create the process-wide pooled httpx client used for upstream Langflow calls."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("LANGFLOW_HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("LANGFLOW_HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("LANGFLOW_HTTP_KEEPALIVE_EXPIRY", "60")),
+        )
+        # Per-request timeouts are always passed explicitly; this is only the fallback.
+        timeout = httpx.Timeout(float(os.getenv("LANGFLOW_TIMEOUT_SECONDS", "180")))
+        _http_client = httpx.AsyncClient(
+            limits=limits,
+            timeout=timeout,
+            http2=_http2_enabled(),
+            follow_redirects=False,
+        )
+    return _http_client
+
+
+async def close_shared_http_client() -> None:
+    """Close the pooled client. Call this from the application shutdown hook."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# --- Admission control for upstream Langflow calls ---
+class LangflowOverloaded(Exception):
+    """Raised when the Langflow admission queue is full; carries a Retry-After hint in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Langflow is overloaded; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Adaptive concurrency limiter (AIMD) with a bounded wait queue.
+
+    At most `limit` Langflow calls run at once and at most `max_queue` more wait for a slot;
+    beyond that callers are rejected immediately with LangflowOverloaded. The limit grows by
+    roughly one per limit's worth of successful calls and halves (at most once per average call
+    duration) when the upstream answers 429/502/503/504 or times out.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        max_queue: int = 32,
+        queue_timeout: float = 30.0,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_latency = 10.0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    @property
+    def current_limit(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def has_capacity(self, backlog: int = 0) -> bool:
+        """Whether another call could get a slot or a queue place. `backlog` counts calls that
+        are already committed but haven't reached the controller yet (e.g. queued chat tasks)."""
+        return self.in_flight + self.waiting + backlog < self.current_limit + self.max_queue
+
+    def retry_after(self, backlog: int = 0) -> int:
+        """Rough time until a queued caller would get a slot."""
+        return max(1, math.ceil(self.avg_latency * (self.waiting + backlog + 1) / self.current_limit))
+
+    def observe(self, status_code: int) -> None:
+        if status_code in (429, 502, 503, 504):
+            self.on_overload()
+        elif status_code < 500:
+            self.on_success()
+
+    def on_success(self) -> None:
+        self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def on_overload(self) -> None:
+        now = monotonic()
+        if now - self._last_decrease < self.avg_latency:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit / 2)
+        logger.info("Langflow overload signal; concurrency limit now %d", self.current_limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        if not self.has_capacity():
+            raise LangflowOverloaded(self.retry_after())
+        # Reserve the queue place before the first await so concurrent callers see it
+        self.waiting += 1
+        try:
+            with span("langflow.admission_wait", limit=self.current_limit):
+                async with self._cond:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(lambda: self.in_flight < self.current_limit),
+                        self.queue_timeout,
+                    )
+                    self.in_flight += 1
+        except asyncio.TimeoutError:
+            raise LangflowOverloaded(self.retry_after())
+        finally:
+            self.waiting -= 1
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.avg_latency = 0.8 * self.avg_latency + 0.2 * (monotonic() - start)
+            async with self._cond:
+                self.in_flight -= 1
+                # The limit may have grown while this call ran; wake as many waiters as now fit
+                self._cond.notify(max(1, self.current_limit - self.in_flight))
+
+
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create the process-wide admission controller for Langflow calls."""
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController(
+            initial_limit=int(os.getenv("LANGFLOW_CONCURRENCY", "8")),
+            min_limit=int(os.getenv("LANGFLOW_MIN_CONCURRENCY", "1")),
+            max_limit=int(os.getenv("LANGFLOW_MAX_CONCURRENCY", "64")),
+            max_queue=int(os.getenv("LANGFLOW_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("LANGFLOW_QUEUE_TIMEOUT_SECONDS", "30")),
+        )
+    return _admission
+
+
+# --- Circuit breaking and hedging per upstream endpoint ---
+class CircuitOpen(LangflowOverloaded):
+    """Raised without calling upstream while an endpoint's circuit breaker is open."""
+
+    def __init__(self, endpoint: str, retry_after: int):
+        Exception.__init__(self, f"Langflow upstream {endpoint} is unavailable; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for one upstream endpoint.
+
+    After `failure_threshold` consecutive failures (5xx gateway errors, timeouts, connection
+    errors) the breaker opens and calls fail immediately with CircuitOpen. Once `reset_timeout`
+    has passed, a single probe call is let through (half-open): success closes the breaker,
+    failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, endpoint: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def before_call(self) -> None:
+        if self.state == self.OPEN:
+            remaining = self.reset_timeout - (monotonic() - self.opened_at)
+            if remaining > 0:
+                self.short_circuited += 1
+                raise CircuitOpen(self.endpoint, math.ceil(remaining))
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.short_circuited += 1
+                raise CircuitOpen(self.endpoint, 1)
+            self._probe_in_flight = True
+
+    def record_status(self, status_code: int) -> None:
+        if status_code in (502, 503, 504):
+            self.record_failure()
+        elif status_code < 500:
+            self.record_success()
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != self.CLOSED:
+            logger.info("Circuit for %s closed", self.endpoint)
+        self.state = self.CLOSED
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning("Circuit for %s opened after %d failures", self.endpoint, self.failures)
+            self.state = self.OPEN
+            self.opened_at = monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Free the half-open probe slot if a call ended without recording an outcome."""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+class EndpointStats:
+    """Recent latencies and hedging counters for one upstream endpoint."""
+
+    def __init__(self, window: int = 200):
+        self.latencies: deque = deque(maxlen=window)
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "p95_seconds": self.p95(),
+            "hedges_fired": self.hedges_fired,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": (self.hedge_wins / self.hedges_fired) if self.hedges_fired else None,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_endpoint_stats: Dict[str, EndpointStats] = {}
+
+
+def _endpoint_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+def get_circuit_breaker(url: str) -> CircuitBreaker:
+    key = _endpoint_key(url)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        breaker = _breakers[key] = CircuitBreaker(
+            key,
+            failure_threshold=int(os.getenv("LANGFLOW_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("LANGFLOW_BREAKER_RESET_SECONDS", "30")),
+        )
+    return breaker
+
+
+def get_endpoint_stats(url: str) -> EndpointStats:
+    key = _endpoint_key(url)
+    stats = _endpoint_stats.get(key)
+    if stats is None:
+        stats = _endpoint_stats[key] = EndpointStats()
+    return stats
+
+
+def _hedge_enabled(url: str) -> bool:
+    """Hedging is only safe for idempotent flows; operators opt in per path via LANGFLOW_HEDGE_PATHS."""
+    paths = [p.strip() for p in os.getenv("LANGFLOW_HEDGE_PATHS", "").split(",") if p.strip()]
+    path = urlsplit(url).path
+    return any(path.endswith(p) or path == p for p in paths)
+
+
+def _record_upstream_status(url: str, status_code: int) -> None:
+    get_admission_controller().observe(status_code)
+    get_circuit_breaker(url).record_status(status_code)
+
+
+def _record_upstream_failure(url: str) -> None:
+    get_admission_controller().on_overload()
+    get_circuit_breaker(url).record_failure()
+
+
+
+
+async def _post(client: httpx.AsyncClient, url: str, timeout: float, **kwargs: Any) -> httpx.Response:
+    """POST to a Langflow run endpoint, recording the attempt in the upstream latency histogram."""
+    start = monotonic()
+    try:
+        with span("langflow.http_post", endpoint=_endpoint_key(url)) as current:
+            response = await _post_hedged(client, url, timeout, **kwargs)
+            if current is not None:
+                current.set(status=response.status_code)
+    except httpx.TimeoutException:
+        UPSTREAM_REQUEST_SECONDS.observe(monotonic() - start, upstream="langflow_run", outcome="timeout")
+        raise
+    except Exception:
+        UPSTREAM_REQUEST_SECONDS.observe(monotonic() - start, upstream="langflow_run", outcome="error")
+        raise
+    UPSTREAM_REQUEST_SECONDS.observe(
+        monotonic() - start, upstream="langflow_run", outcome=status_outcome(response.status_code)
+    )
+    return response
+
+
+async def _post_hedged(client: httpx.AsyncClient, url: str, timeout: float, **kwargs: Any) -> httpx.Response:
+    """
+    POST to upstream, recording latency. For hedge-enabled paths, a second identical request
+    is fired if the first hasn't answered within the endpoint's recent p95 latency, and
+    whichever completes first wins; the other is cancelled.
+    """
+    stats = get_endpoint_stats(url)
+    start = monotonic()
+    if not _hedge_enabled(url):
+        response = await client.post(url, timeout=timeout, **kwargs)
+        stats.latencies.append(monotonic() - start)
+        return response
+
+    delay = stats.p95() or float(os.getenv("LANGFLOW_HEDGE_DELAY_SECONDS", "5"))
+    primary = asyncio.create_task(client.post(url, timeout=timeout, **kwargs))
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            stats.latencies.append(monotonic() - start)
+            return primary.result()
+
+        stats.hedges_fired += 1
+        LANGFLOW_HEDGES.inc(result="fired")
+        hedge = asyncio.create_task(client.post(url, timeout=timeout, **kwargs))
+        tasks.append(hedge)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue
+                if task.exception() is None:
+                    if task is hedge:
+                        stats.hedge_wins += 1
+                        LANGFLOW_HEDGES.inc(result="won")
+                    stats.latencies.append(monotonic() - start)
+                    return task.result()
+                error = task.exception()
+        raise error or asyncio.CancelledError()
+    finally:
+        # The loser, or both requests if the caller was cancelled: don't leave them running
+        # against Langflow holding pooled connections
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+# --- Auth header shapes ---
+# Hosted Langflow deployments disagree on where the token goes. The client starts with
+# "bearer" and, on a 401, probes the other shapes once, remembering what worked.
+AUTH_SHAPES = ("bearer", "authorization-raw", "x-api-key", "x-astra-token")
+
+
+def _auth_headers(shape: str, token: str, with_alternates: bool = False) -> Dict[str, str]:
+    headers: Dict[str, str] = {"Content-Type": "application/json"}
+    if shape == "bearer":
+        headers["Authorization"] = f"Bearer {token}"
+        if with_alternates:
+            # Also provide common alternate header names that some hosted endpoints expect
+            headers["x-api-key"] = token
+            headers["x-astra-token"] = token
+    elif shape == "authorization-raw":
+        headers["Authorization"] = token
+    else:
+        headers[shape] = token
+    return headers
+
+
+class AuthShapeCache:
+    """
+    Remembers which auth header shape each (endpoint, token) pair accepts, for `ttl` seconds.
+    Pairs for which no shape was accepted are remembered for as long, so a bad token costs one
+    upstream call per message instead of one per shape.
+    """
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self._shapes: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._rejected: Dict[Tuple[str, str], float] = {}
+        self.stats: Dict[str, int] = {"probes": 0, "learned": 0, "learned_hits": 0, "rejected_hits": 0}
+
+    @staticmethod
+    def _key(url: str, token: str) -> Tuple[str, str]:
+        # Key on a digest so raw tokens are never kept as dict keys
+        return _endpoint_key(url), hashlib.sha256(token.encode()).hexdigest()[:16]
+
+    def get(self, url: str, token: str) -> Optional[str]:
+        key = self._key(url, token)
+        entry = self._shapes.get(key)
+        if entry is None:
+            return None
+        shape, expires_at = entry
+        if expires_at <= monotonic():
+            del self._shapes[key]
+            return None
+        return shape
+
+    def remember(self, url: str, token: str, shape: str) -> None:
+        self._shapes[self._key(url, token)] = (shape, monotonic() + self.ttl)
+        self.stats["learned"] += 1
+        logger.info("Learned auth shape %s for %s", shape, _endpoint_key(url))
+
+    def forget(self, url: str, token: str) -> None:
+        self._shapes.pop(self._key(url, token), None)
+
+    def rejected(self, url: str, token: str) -> bool:
+        """Whether every shape was refused for this pair within the last `ttl` seconds."""
+        key = self._key(url, token)
+        expires_at = self._rejected.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= monotonic():
+            del self._rejected[key]
+            return False
+        return True
+
+    def remember_rejected(self, url: str, token: str) -> None:
+        self._rejected[self._key(url, token)] = monotonic() + self.ttl
+        logger.warning("No auth header shape accepted by %s; not probing again for %ds", _endpoint_key(url), self.ttl)
+
+    def forget_rejected(self, url: str, token: str) -> None:
+        self._rejected.pop(self._key(url, token), None)
+
+
+_auth_shapes = AuthShapeCache(ttl=float(os.getenv("LANGFLOW_AUTH_SHAPE_TTL_SECONDS", "3600")))
+
+
+def _mask(t: Optional[str]) -> str:
+    if not t:
+        return "<none>"
+    return t[:8] + "..." + t[-8:] if len(t) > 16 else "<token>"
+
+
+def _build_payload(message: str, tweaks: Optional[Dict[str, Any]], session_id: Optional[str]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "input_value": message,
+        "output_type": "chat",
+        "input_type": "chat",
+    }
+    if tweaks:
+        payload["tweaks"] = tweaks
+    if session_id:
+        payload["session_id"] = session_id
+    return payload
+
+
+def _json_or_raw(response: httpx.Response) -> Dict[str, Any]:
+    try:
+        return loads(response.content)
+    except ValueError:
+        # Non-JSON response (HTML or plain text). Return raw text under a key the extractor understands.
+        return {"_raw_text": response.text}
+
+
+def get_upstream_stats() -> Dict[str, Any]:
+    """Breaker state and hedging counters per upstream endpoint, plus auth-shape probe counters."""
+    keys = set(_breakers) | set(_endpoint_stats)
+    return {
+        "endpoints": {
+            key: {
+                **(_breakers[key].snapshot() if key in _breakers else {}),
+                **(_endpoint_stats[key].snapshot() if key in _endpoint_stats else {}),
+            }
+            for key in sorted(keys)
+        },
+        "auth": dict(_auth_shapes.stats),
+    }
+
+
+class StreamRefused(Exception):
+    """The streaming run request was not accepted (non-200 status or no connection), so the
+    flow never ran and the regular run endpoint can safely be tried instead."""
+
+
+NO_OUTPUT_TEXT = "I'm here to help plan your trip, but I couldn't read a response from Langflow. Please verify your flow output."
+
 
 class LangflowClient:
     def __init__(self, base_url: Optional[str] = None, application_token: Optional[str] = None):
@@ -50,142 +592,7 @@ class LangflowClient:
             Dict containing the flow response
         """
         url = f"{self.base_url}/api/v1/run/{flow_id}"
-        
-        payload = {
-            "input_value": message,
-            "output_type": "chat",
-            "input_type": "chat",
-        }
-        
-        if tweaks:
-            payload["tweaks"] = tweaks
-            
-        if session_id:
-            payload["session_id"] = session_id
-        
-        try:
-            if not self.application_token and not auth_token:
-                # No token available for upstream request
-                raise RuntimeError("No Langflow application token available for upstream request.")
-
-            async with httpx.AsyncClient(timeout=timeout, follow_redirects=False) as client:
-                headers = self.get_headers()
-                if auth_token:
-                    headers["Authorization"] = f"Bearer {auth_token}"
-                    # Also provide common alternate header names that some hosted endpoints expect
-                    headers.setdefault("x-api-key", auth_token)
-                    headers.setdefault("x-astra-token", auth_token)
-
-                # Debug: print the outgoing headers keys and masked auth token (do not print full secret)
-                def mask(t: Optional[str]) -> str:
-                    if not t:
-                        return "<none>"
-                    try:
-                        return t[:8] + "..." + t[-8:]
-                    except Exception:
-                        return "<token>"
-
-                masked_auth = None
-                if "Authorization" in headers:
-                    val = headers["Authorization"]
-                    # Remove 'Bearer ' prefix for masking raw token
-                    raw = val.split(" ", 1)[1] if " " in val else val
-                    masked_auth = mask(raw)
-                print(f"[DEBUG] Posting to {url} with headers keys={list(headers.keys())} masked_auth={masked_auth}")
-                # Perform POST with retries for transient 5xx/504 and timeouts, preserving Authorization on redirects.
-                max_retries = int(os.getenv("LANGFLOW_MAX_RETRIES", "1"))
-                attempt = 0
-                response = None
-                current_timeout = timeout
-                # Use a shorter backoff to fail faster when upstream consistently returns 504
-                while attempt <= max_retries:
-                    try:
-                        # First request without auto-follow so we can preserve Authorization on cross-host redirects
-                        # Use per-attempt timeout so we can increase it between attempts if needed
-                        response = await client.post(url, json=payload, headers=headers, timeout=current_timeout)
-                        # If server responds with a redirect, follow it explicitly while preserving headers
-                        if response.is_redirect or response.status_code in (301, 302, 303, 307, 308):
-                            location = response.headers.get("location")
-                            if location:
-                                next_url = urljoin(url, location)
-                                print(f"[DEBUG] Redirect from {url} -> {next_url}; reposting with Authorization preserved")
-                                response = await client.post(next_url, json=payload, headers=headers, timeout=current_timeout)
-
-                        # If response is a transient server error, retry
-                        if response.status_code in (502, 503, 504):
-                            # If we still have attempts left, retry quickly. Otherwise surface a clear error.
-                            if attempt < max_retries:
-                                backoff = 0.5 * (2 ** attempt)
-                                print(f"[DEBUG] Transient {response.status_code} response, retrying after {backoff}s (attempt {attempt+1})")
-                                await asyncio.sleep(backoff)
-                                attempt += 1
-                                # increase per-attempt timeout a bit for the next try but cap it
-                                current_timeout = min(current_timeout * 1.5, 120)
-                                continue
-                            else:
-                                # No retries left — raise a clear error so the caller can return a friendly message
-                                raise Exception(f"Langflow upstream returned {response.status_code} (gateway timeout or service unavailable)")
-                        break
-                    except httpx.TimeoutException:
-                        # Timeout — retry if allowed, otherwise escalate quickly with a friendly message.
-                        if attempt < max_retries:
-                            backoff = 0.5 * (2 ** attempt)
-                            print(f"[DEBUG] Timeout on attempt {attempt+1}, retrying after {backoff}s")
-                            await asyncio.sleep(backoff)
-                            attempt += 1
-                            current_timeout = min(current_timeout * 1.5, 120)
-                            continue
-                        else:
-                            raise Exception("Langflow request timed out")
-
-                # If we get a 401 indicating missing bearer token, try a few alternate header shapes
-                if response is not None and response.status_code == 401:
-                    body_snippet = (response.text or "")[:800]
-                    print(f"[DEBUG] Initial run_flow response 401: {body_snippet}")
-                    raw_token = None
-                    if "Authorization" in headers:
-                        raw_token = headers["Authorization"].split(" ", 1)[1] if " " in headers["Authorization"] else headers["Authorization"]
-
-                    alt_attempts = []
-                    if raw_token:
-                        h1 = {**headers}
-                        h1["Authorization"] = raw_token
-                        h1.pop("x-api-key", None)
-                        h1.pop("x-astra-token", None)
-                        alt_attempts.append(("Authorization-raw", h1))
-                        h2 = {"Content-Type": "application/json", "x-api-key": raw_token}
-                        alt_attempts.append(("x-api-key", h2))
-                        h3 = {"Content-Type": "application/json", "x-astra-token": raw_token}
-                        alt_attempts.append(("x-astra-token", h3))
-
-                    for label, alt_headers in alt_attempts:
-                        try:
-                            print(f"[DEBUG] Retrying run_flow with alt headers: {label}")
-                            alt_resp = await client.post(url, json=payload, headers=alt_headers)
-                            alt_resp.raise_for_status()
-                            try:
-                                return alt_resp.json()
-                            except ValueError:
-                                return {"_raw_text": alt_resp.text}
-                        except httpx.HTTPStatusError as e:
-                            print(f"[DEBUG] Alt attempt {label} failed: {e.response.status_code}")
-
-                if response is None:
-                    raise Exception("No response from Langflow upstream")
-                response.raise_for_status()
-                try:
-                    return response.json()
-                except ValueError:
-                    # Non-JSON response (HTML or plain text). Return raw text under a key the extractor understands.
-                    return {"_raw_text": response.text}
-
-        except httpx.HTTPStatusError as e:
-            error_detail = f"HTTP {e.response.status_code}: {e.response.text}"
-            raise Exception(f"Langflow API error: {error_detail}")
-        except httpx.TimeoutException:
-            raise Exception("Langflow request timed out")
-        except Exception as e:
-            raise Exception(f"Failed to connect to Langflow: {str(e)}")
+        return await self._run(url, _build_payload(message, tweaks, session_id), timeout, auth_token)
 
     async def run_flow_url(
         self,
@@ -202,129 +609,226 @@ class LangflowClient:
         """
         if not run_url:
             raise ValueError("run_url is required")
-        payload = {
-            "input_value": message,
-            "output_type": "chat",
-            "input_type": "chat",
-        }
-        if tweaks:
-            payload["tweaks"] = tweaks
-        if session_id:
-            payload["session_id"] = session_id
+        return await self._run(run_url, _build_payload(message, tweaks, session_id), timeout, auth_token)
 
-        try:
-            if not self.application_token and not auth_token:
-                raise RuntimeError("LANGFLOW_APPLICATION_TOKEN is not set for run_flow_url.")
-            async with httpx.AsyncClient(timeout=timeout, follow_redirects=False) as client:
-                headers = self.get_headers()
-                if auth_token:
-                    headers["Authorization"] = f"Bearer {auth_token}"
-                    headers.setdefault("x-api-key", auth_token)
-                    headers.setdefault("x-astra-token", auth_token)
-
-                # Debug outgoing headers
-                def mask(t: Optional[str]) -> str:
-                    if not t:
-                        return "<none>"
-                    try:
-                        return t[:8] + "..." + t[-8:]
-                    except Exception:
-                        return "<token>"
-
-                masked_auth = None
-                if "Authorization" in headers:
-                    val = headers["Authorization"]
-                    raw = val.split(" ", 1)[1] if " " in val else val
-                    masked_auth = mask(raw)
-                print(f"[DEBUG] Posting to {run_url} with headers keys={list(headers.keys())} masked_auth={masked_auth}")
-                # Perform POST with retries for transient 5xx/504 and timeouts, preserving Authorization on redirects.
-                max_retries = int(os.getenv("LANGFLOW_MAX_RETRIES", "1"))
-                attempt = 0
-                response = None
-                current_timeout = timeout
-                while attempt <= max_retries:
-                    try:
-                        # Use per-attempt timeout so adjustments take effect
-                        response = await client.post(run_url, json=payload, headers=headers, timeout=current_timeout)
-                        # Handle redirect explicitly so Authorization header isn't stripped by client
-                        if response.is_redirect or response.status_code in (301, 302, 303, 307, 308):
-                            location = response.headers.get("location")
-                            if location:
-                                next_url = urljoin(run_url, location)
-                                print(f"[DEBUG] Redirect from {run_url} -> {next_url}; reposting with Authorization preserved")
-                                response = await client.post(next_url, json=payload, headers=headers, timeout=current_timeout)
-
-                        if response.status_code in (502, 503, 504):
-                            if attempt < max_retries:
-                                backoff = 0.5 * (2 ** attempt)
-                                print(f"[DEBUG] Transient {response.status_code} response on run_url, retrying after {backoff}s (attempt {attempt+1})")
-                                await asyncio.sleep(backoff)
-                                attempt += 1
-                                current_timeout = min(current_timeout * 1.5, 120)
-                                continue
-                            else:
-                                raise Exception(f"Langflow upstream returned {response.status_code} (gateway timeout or service unavailable)")
-                        break
-                    except httpx.TimeoutException:
-                        if attempt < max_retries:
-                            backoff = 0.5 * (2 ** attempt)
-                            print(f"[DEBUG] Timeout on run_url attempt {attempt+1}, retrying after {backoff}s")
-                            await asyncio.sleep(backoff)
-                            attempt += 1
-                            current_timeout = min(current_timeout * 1.5, 120)
-                            continue
-                        else:
-                            raise Exception("Langflow request timed out")
-                # If we get a 401 indicating missing bearer token, try a few alternate header shapes
+    async def _run(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        timeout: float,
+        auth_token: Optional[str],
+    ) -> Dict[str, Any]:
+        """
+        Shared request engine for run_flow and run_flow_url: circuit breaker, retries for
+        transient 5xx/timeouts, redirects that keep Authorization, and 401 auth-shape discovery.
+        """
+        with span("langflow.run", endpoint=_endpoint_key(url)):
+            # Fail fast while the endpoint is known to be down
+            breaker = get_circuit_breaker(url)
+            breaker.before_call()
+            try:
+                token = auth_token or self.application_token
+                if not token:
+                    # No token available for upstream request
+                    raise RuntimeError("No Langflow application token available for upstream request.")
+
+                client = get_shared_http_client()
+                # Use the header shape this endpoint accepted last time, if we've learned one
+                learned_shape = _auth_shapes.get(url, token)
+                shape = learned_shape or "bearer"
+                headers = _auth_headers(shape, token, with_alternates=bool(auth_token))
+                logger.debug(
+                    "Posting to %s with headers keys=%s masked_auth=%s", url, list(headers.keys()), _mask(token),
+                    extra={"sample_every": 10},
+                )
+                response = await self._post_with_retries(client, url, payload, headers, timeout)
+
+                # If we get a 401, the endpoint may expect the token in a different header shape.
+                # Probe the alternatives once and remember the one that works.
                 if response.status_code == 401:
                     body_snippet = (response.text or "")[:800]
-                    print(f"[DEBUG] Initial run_url response 401: {body_snippet}")
-                    # Prepare alternative header variants to try
-                    raw_token = None
-                    if "Authorization" in headers:
-                        raw_token = headers["Authorization"].split(" ", 1)[1] if " " in headers["Authorization"] else headers["Authorization"]
-
-                    alt_attempts = []
-                    if raw_token:
-                        # 1) Authorization without 'Bearer '
-                        h1 = {**headers}
-                        h1["Authorization"] = raw_token
-                        # remove alt headers that might conflict
-                        h1.pop("x-api-key", None)
-                        h1.pop("x-astra-token", None)
-                        alt_attempts.append(("Authorization-raw", h1))
-                        # 2) x-api-key only
-                        h2 = {"Content-Type": "application/json", "x-api-key": raw_token}
-                        alt_attempts.append(("x-api-key", h2))
-                        # 3) x-astra-token only
-                        h3 = {"Content-Type": "application/json", "x-astra-token": raw_token}
-                        alt_attempts.append(("x-astra-token", h3))
-
-                    for label, alt_headers in alt_attempts:
-                        try:
-                            print(f"[DEBUG] Retrying run_url with alt headers: {label}")
-                            alt_resp = await client.post(run_url, json=payload, headers=alt_headers)
-                            alt_resp.raise_for_status()
-                            try:
-                                return alt_resp.json()
-                            except ValueError:
-                                return {"_raw_text": alt_resp.text}
-                        except httpx.HTTPStatusError as e:
-                            print(f"[DEBUG] Alt attempt {label} failed: {e.response.status_code}")
+                    logger.debug("Initial run response 401 with auth shape %s: %s", shape, body_snippet)
+                    if learned_shape:
+                        _auth_shapes.forget(url, token)
+                    if _auth_shapes.rejected(url, token):
+                        # Every shape was refused recently; don't probe them all again
+                        _auth_shapes.stats["rejected_hits"] += 1
+                    else:
+                        for alt_shape in AUTH_SHAPES:
+                            if alt_shape == shape:
+                                continue
+                            _auth_shapes.stats["probes"] += 1
+                            logger.debug("Retrying run with alt headers: %s", alt_shape)
+                            with span("langflow.auth_probe", shape=alt_shape):
+                                alt_resp = await client.post(
+                                    url, json=payload, headers=_auth_headers(alt_shape, token), timeout=timeout
+                                )
+                            if alt_resp.is_success:
+                                LANGFLOW_AUTH_PROBES.inc(outcome="accepted")
+                                _auth_shapes.remember(url, token, alt_shape)
+                                return _json_or_raw(alt_resp)
+                            LANGFLOW_AUTH_PROBES.inc(outcome="rejected")
+                            logger.debug("Alt attempt %s failed: %d", alt_shape, alt_resp.status_code)
+                        _auth_shapes.remember_rejected(url, token)
+                elif response.is_success:
+                    if learned_shape:
+                        _auth_shapes.stats["learned_hits"] += 1
+                    _auth_shapes.forget_rejected(url, token)
 
                 response.raise_for_status()
-                try:
-                    return response.json()
-                except ValueError:
-                    return {"_raw_text": response.text}
-        except httpx.HTTPStatusError as e:
-            error_detail = f"HTTP {e.response.status_code}: {e.response.text}"
-            raise Exception(f"Langflow API error: {error_detail}")
-        except httpx.TimeoutException:
-            raise Exception("Langflow request timed out")
-        except Exception as e:
-            raise Exception(f"Failed to connect to Langflow: {str(e)}")
-    
+                return _json_or_raw(response)
+
+            except httpx.HTTPStatusError as e:
+                error_detail = f"HTTP {e.response.status_code}: {e.response.text}"
+                raise Exception(f"Langflow API error: {error_detail}")
+            except httpx.TimeoutException:
+                raise Exception("Langflow request timed out")
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                raise Exception(f"Failed to connect to Langflow: {str(e)}")
+            except Exception as e:
+                raise Exception(f"Failed to connect to Langflow: {str(e)}")
+            finally:
+                breaker.release_probe()
+
+    async def _post_with_retries(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        payload: Dict[str, Any],
+        headers: Dict[str, str],
+        timeout: float,
+    ) -> httpx.Response:
+        """POST with retries for transient 5xx/504 and timeouts, preserving Authorization on redirects."""
+        max_retries = int(os.getenv("LANGFLOW_MAX_RETRIES", "1"))
+        attempt = 0
+        current_timeout = timeout
+        # Use a shorter backoff to fail faster when upstream consistently returns 504
+        while True:
+            try:
+                # First request without auto-follow so we can preserve Authorization on cross-host redirects
+                # Use per-attempt timeout so we can increase it between attempts if needed
+                response = await _post(client, url, current_timeout, json=payload, headers=headers)
+                # If server responds with a redirect, follow it explicitly while preserving headers
+                if response.is_redirect or response.status_code in (301, 302, 303, 307, 308):
+                    location = response.headers.get("location")
+                    if location:
+                        next_url = urljoin(url, location)
+                        logger.debug("Redirect from %s -> %s; reposting with Authorization preserved", url, next_url)
+                        response = await client.post(next_url, json=payload, headers=headers, timeout=current_timeout)
+                _record_upstream_status(url, response.status_code)
+
+                # If response is a transient server error, retry
+                if response.status_code in (502, 503, 504):
+                    # If we still have attempts left, retry quickly. Otherwise surface a clear error.
+                    if attempt < max_retries:
+                        backoff = 0.5 * (2 ** attempt)
+                        logger.warning(
+                            "Transient %d response, retrying after %ss (attempt %d)",
+                            response.status_code, backoff, attempt + 1,
+                        )
+                        LANGFLOW_RETRIES.inc(reason=str(response.status_code))
+                        await asyncio.sleep(backoff)
+                        attempt += 1
+                        # increase per-attempt timeout a bit for the next try but cap it
+                        current_timeout = min(current_timeout * 1.5, 120)
+                        continue
+                    # No retries left — raise a clear error so the caller can return a friendly message
+                    raise Exception(f"Langflow upstream returned {response.status_code} (gateway timeout or service unavailable)")
+                return response
+            except httpx.TimeoutException:
+                _record_upstream_failure(url)
+                LANGFLOW_TIMEOUTS.inc()
+                # Timeout — retry if allowed, otherwise escalate quickly with a friendly message.
+                if attempt < max_retries:
+                    backoff = 0.5 * (2 ** attempt)
+                    logger.warning("Timeout on attempt %d, retrying after %ss", attempt + 1, backoff)
+                    LANGFLOW_RETRIES.inc(reason="timeout")
+                    await asyncio.sleep(backoff)
+                    attempt += 1
+                    current_timeout = min(current_timeout * 1.5, 120)
+                    continue
+                raise Exception("Langflow request timed out")
+
+    async def stream_run(
+        self,
+        url: str,
+        message: str,
+        on_token: Callable[[str], Awaitable[None]],
+        tweaks: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        timeout: float = 60.0,
+        auth_token: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run a flow in Langflow's streaming mode (`?stream=true`), awaiting `on_token` for every
+        token chunk as it arrives.
+
+        Args:
+            url: Full run endpoint URL (base URL + /api/v1/run/<flow-id>, or the Astra run URL)
+            on_token: Coroutine called with each text chunk
+
+        Returns:
+            The final run response (same shape as run_flow), taken from the stream's `end` event
+        """
+        payload = _build_payload(message, tweaks, session_id)
+        token = auth_token or self.application_token
+        if not token:
+            raise RuntimeError("No Langflow application token available for upstream request.")
+        headers = _auth_headers(_auth_shapes.get(url, token) or "bearer", token)
+
+        with span("langflow.stream", endpoint=_endpoint_key(url)):
+            breaker = get_circuit_breaker(url)
+            breaker.before_call()
+            client = get_shared_http_client()
+            result: Optional[Dict[str, Any]] = None
+            start = monotonic()
+            outcome = "error"
+            try:
+                async with client.stream(
+                    "POST", url, params={"stream": "true"}, json=payload, headers=headers, timeout=timeout
+                ) as response:
+                    _record_upstream_status(url, response.status_code)
+                    outcome = status_outcome(response.status_code)
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise StreamRefused(f"Langflow API error: HTTP {response.status_code}: {response.text[:800]}")
+                    # Langflow streams newline-delimited JSON events: token / add_message / end / error
+                    async for line in response.aiter_lines():
+                        line = line.strip()
+                        if line.startswith("data:"):
+                            line = line[5:].strip()
+                        if not line:
+                            continue
+                        try:
+                            event = loads(line)
+                        except ValueError:
+                            continue
+                        kind = event.get("event")
+                        data = event.get("data") or {}
+                        if kind == "token":
+                            chunk = data.get("chunk")
+                            if chunk:
+                                await on_token(chunk)
+                        elif kind == "end":
+                            result = data.get("result")
+                        elif kind == "error":
+                            raise Exception(f"Langflow stream error: {data.get('error') or data}")
+            except httpx.TransportError as e:
+                _record_upstream_failure(url)
+                if isinstance(e, httpx.TimeoutException):
+                    LANGFLOW_TIMEOUTS.inc()
+                    outcome = "timeout"
+                if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    raise StreamRefused(f"Failed to connect to Langflow: {e}") from e
+                raise
+            finally:
+                breaker.release_probe()
+                UPSTREAM_REQUEST_SECONDS.observe(monotonic() - start, upstream="langflow_stream", outcome=outcome)
+            if result is None:
+                raise Exception("Langflow stream ended without a result")
+            return result
+
     async def get_flow_info(self, flow_id: str) -> Dict[str, Any]:
         """
         Get information about a specific flow
@@ -340,13 +844,13 @@ class LangflowClient:
         try:
             if not self.is_configured:
                 raise RuntimeError("Langflow client is not configured. Set LANGFLOW_BASE_URL and LANGFLOW_APPLICATION_TOKEN.")
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                response = await client.get(url, headers=self.get_headers())
-                response.raise_for_status()
-                try:
-                    return response.json()
-                except ValueError:
-                    return {"_raw_text": response.text}
+            client = get_shared_http_client()
+            response = await client.get(url, headers=self.get_headers(), follow_redirects=True)
+            response.raise_for_status()
+            try:
+                return response.json()
+            except ValueError:
+                return {"_raw_text": response.text}
         except Exception as e:
             raise Exception(f"Failed to get flow info: {str(e)}")
     
@@ -361,63 +865,29 @@ class LangflowClient:
             Extracted text response
         """
         try:
-            # Helper to collect any 'text' fields in nested structures
-            def collect_text(obj: Union[Dict[str, Any], List[Any], Any], acc: List[str]):
-                if isinstance(obj, dict):
-                    # Common Langflow structure
-                    if "results" in obj and isinstance(obj["results"], dict):
-                        msg = obj["results"].get("message") or obj["results"].get("text")
-                        if isinstance(msg, dict):
-                            text_val = msg.get("text") or msg.get("content")
-                            if text_val:
-                                acc.append(str(text_val))
-                        elif isinstance(msg, str):
-                            acc.append(msg)
-                    # Generic 'text'
-                    if "text" in obj and isinstance(obj["text"], str):
-                        acc.append(obj["text"])
-                    for v in obj.values():
-                        collect_text(v, acc)
-                elif isinstance(obj, list):
-                    for item in obj:
-                        collect_text(item, acc)
-
-            # Try known path first
-            if "outputs" in response and response["outputs"]:
-                outputs = response["outputs"]
-                if isinstance(outputs, list) and outputs:
-                    first_output = outputs[0]
-                    if "outputs" in first_output and first_output["outputs"]:
-                        nested_outputs = first_output["outputs"]
-                        if isinstance(nested_outputs, list) and nested_outputs:
-                            maybe = nested_outputs[0].get("results", {}).get("message", {}).get("text")
-                            if maybe:
-                                return str(maybe)
+            # Known response shapes first: a few dict lookups instead of a walk over tool traces
+            text = known_shape_text(response)
+            if text:
+                return text
 
             # Fallback: deep search
-            acc: List[str] = []
-            collect_text(response, acc)
+            acc = collect_text(response)
+            if acc:
+                return "\n\n".join(acc)
             # If upstream returned raw text (non-JSON), return that verbatim
-            if not acc and isinstance(response, dict) and "_raw_text" in response:
+            if isinstance(response, dict) and "_raw_text" in response:
                 return response.get("_raw_text", "").strip()
-            acc = [s.strip() for s in acc if s and s.strip()]
-            if acc:
-                # Deduplicate while preserving order
-                seen = set()
-                ordered: List[str] = []
-                for s in acc:
-                    if s not in seen:
-                        seen.add(s)
-                        ordered.append(s)
-                return "\n\n".join(ordered)
 
-            return "I'm here to help plan your trip, but I couldn't read a response from Langflow. Please verify your flow output." 
+            return NO_OUTPUT_TEXT
 
         except Exception as e:
             return f"Error processing response: {str(e)}"
 
 
 _langflow_client: Optional[LangflowClient] = None
+_response_cache: Optional[ResponseCache] = None
+_intent_router: Optional[IntentRouter] = None
+_token_counter: Optional[TokenCounter] = None
 
 def get_langflow_client() -> Optional[LangflowClient]:
     """Get or create global Langflow client instance. Returns None if not configured."""
@@ -428,18 +898,135 @@ def get_langflow_client() -> Optional[LangflowClient]:
         _langflow_client = LangflowClient(base_url=base_url, application_token=application_token)
     return _langflow_client if _langflow_client.is_configured else None
 
-async def process_travel_query(message: str, user_id: str = None, langflow_token: Optional[str] = None) -> str:
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get the opt-in response cache (LANGFLOW_RESPONSE_CACHE=true). Returns None if disabled."""
+    global _response_cache
+    if _response_cache is None and os.getenv("LANGFLOW_RESPONSE_CACHE", "false").lower() == "true":
+        _response_cache = ResponseCache(
+            ttl=float(os.getenv("LANGFLOW_RESPONSE_CACHE_TTL_SECONDS", "3600")),
+            max_entries=int(os.getenv("LANGFLOW_RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+            similarity_threshold=float(os.getenv("LANGFLOW_RESPONSE_CACHE_SIMILARITY", "0.9")),
+            semantic=os.getenv("LANGFLOW_RESPONSE_CACHE_SIMILAR", "false").lower() == "true",
+        )
+    return _response_cache
+
+
+def get_token_counter() -> TokenCounter:
+    """Get the shared token counter (TOKENIZER, default tiktoken:cl100k_base). The app loads it
+    at startup with warm_token_counter, so this doesn't load a tokenizer on the event loop."""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = TokenCounter(os.getenv("TOKENIZER", "tiktoken:cl100k_base"))
+    return _token_counter
+
+
+async def warm_token_counter(timeout: float = 10.0) -> TokenCounter:
+    """
+    Load the shared token counter on a worker thread. tiktoken downloads its encoding on first
+    use, synchronously and without a timeout; if loading takes longer than `timeout` seconds or
+    fails, the counter estimates ~4 characters per token instead.
+    """
+    global _token_counter
+    if _token_counter is None:
+        spec = os.getenv("TOKENIZER", "tiktoken:cl100k_base")
+        try:
+            _token_counter = await asyncio.wait_for(asyncio.to_thread(TokenCounter, spec), timeout)
+        except Exception as e:
+            logger.warning(
+                "Tokenizer %s did not load within %.0fs (%s); estimating ~4 characters per token",
+                spec, timeout, type(e).__name__,
+            )
+            _token_counter = TokenCounter("heuristic")
+    return _token_counter
+
+
+def get_intent_router() -> Optional[IntentRouter]:
+    """Get the local pre-router for trivial messages (INTENT_ROUTER=true). Returns None if disabled."""
+    global _intent_router
+    if _intent_router is None and os.getenv("INTENT_ROUTER", "true").lower() == "true":
+        rules = []
+        faq_path = os.getenv("INTENT_FAQ_PATH")
+        if faq_path:
+            try:
+                rules = load_faq_rules(faq_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error("Could not load intent FAQ from %s: %s", faq_path, e)
+        classifier = None
+        classifier_spec = os.getenv("INTENT_CLASSIFIER")
+        if classifier_spec:
+            try:
+                classifier = load_classifier(classifier_spec)
+            except (ImportError, AttributeError) as e:
+                logger.error("Could not load intent classifier %s: %s", classifier_spec, e)
+        min_confidence = float(os.getenv("INTENT_CLASSIFIER_MIN_CONFIDENCE", "0.85"))
+        try:
+            # FAQ entries go first so they can override the built-in replies
+            _intent_router = IntentRouter(rules + list(BUILTIN_RULES), classifier=classifier, min_confidence=min_confidence)
+        except re.error as e:
+            logger.error("Invalid pattern in intent FAQ %s (%s); using the built-in intents only", faq_path, e)
+            _intent_router = IntentRouter(BUILTIN_RULES, classifier=classifier, min_confidence=min_confidence)
+    return _intent_router
+
+
+async def _stream_or_none(
+    client: LangflowClient,
+    url: str,
+    on_token: Callable[[str], Awaitable[None]],
+    **kwargs: Any,
+) -> Optional[Dict[str, Any]]:
+    """
+    Try a streaming run. Returns None (so the caller falls back to the regular run endpoint)
+    only if the stream request itself was refused. Once the flow has started, errors propagate:
+    it may already have run tools and written to session memory, so a second run would repeat
+    them.
+    """
+    try:
+        return await client.stream_run(url=url, on_token=on_token, **kwargs)
+    except StreamRefused as e:
+        logger.info("Streaming run unavailable, falling back to regular run: %s", e)
+        return None
+
+
+async def process_travel_query(
+    message: str,
+    user_id: str = None,
+    langflow_token: Optional[str] = None,
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+    use_cache: bool = False,
+    session_id: Optional[str] = None,
+    history: Optional[List[Dict[str, Any]]] = None,
+    on_agent_run: Optional[Callable[[], None]] = None,
+) -> str:
     """
     Process a travel query through Langflow
     
     Args:
         message: User's travel query/message
-        user_id: Optional user ID for session management
+        user_id: Optional user ID; the Langflow session when no session_id is given
+        on_token: Optional coroutine receiving token chunks; used when LANGFLOW_STREAMING=true
+        use_cache: Allow answering from the response cache. Callers pass False whenever earlier
+            conversation context could change the answer.
+        session_id: Langflow session (agent memory) to run in, normally the conversation id
+        history: Earlier messages of the session's agent memory, newest first. When given, the
+            agent only reads as many of them from memory as fit the token budget.
+        on_agent_run: Optional callback, called once Langflow has answered the message (so the
+            turn is now in the session's memory); not called for router replies, cache hits,
+            failures or turns run in a fresh session because no history fit
         
     Returns:
         AI response from Langflow
     """
     try:
+        # Greetings, thanks, help and FAQ questions are answered in-process
+        router = get_intent_router()
+        if router is not None:
+            with span("intent.route") as current:
+                match = router.route(message)
+                if current is not None:
+                    current.set(intent=match.intent if match else "agent")
+            if match is not None:
+                return match.reply
+
         client = get_langflow_client()
         # If caller provided a langflow_token (Astra token), prefer it by creating or overriding
         if langflow_token:
@@ -461,67 +1048,124 @@ async def process_travel_query(message: str, user_id: str = None, langflow_token
         # the model's tokens-per-minute or per-request limits.
         try:
             max_tokens_env = int(os.getenv("LANGFLOW_MAX_TOKENS", "8000"))
+            expected_output_tokens = int(os.getenv("LANGFLOW_EXPECTED_OUTPUT_TOKENS", "512"))
+            prompt_overhead_tokens = int(os.getenv("LANGFLOW_PROMPT_OVERHEAD_TOKENS", "1500"))
         except Exception:
-            max_tokens_env = 8000
-        # Very simple heuristic: use character count as an estimator for tokens (~4 chars/token)
-        estimated_tokens = max(1, len(message) // 4)
-        if estimated_tokens > max_tokens_env:
+            max_tokens_env, expected_output_tokens, prompt_overhead_tokens = 8000, 512, 1500
+        token_counter = get_token_counter()
+        message_tokens = token_counter.count(message)
+        if message_tokens + expected_output_tokens > max_tokens_env:
             return (
-                f"Your message is too large ({estimated_tokens} tokens estimated). Please shorten the message or split it into smaller requests. "
+                f"Your message is too large ({message_tokens} tokens). Please shorten the message or split it into smaller requests. "
                 f"Current limit is {max_tokens_env} tokens."
             )
 
+        session_id = session_id or user_id
+        # False once the turn runs outside the session, so it won't be in the session's memory
+        in_session_memory = True
+        if history:
+            # Whatever the system prompt, tool schemas, this message and the reply leave over
+            # goes to conversation memory, newest turns first
+            budget = max_tokens_env - expected_output_tokens - prompt_overhead_tokens - message_tokens
+            kept = fit_history(token_counter, history, max(0, budget))
+            agent_id = os.getenv("LANGFLOW_AGENT_COMPONENT_ID", "Agent-GHyeA")
+            if not kept:
+                # Not even the latest turn fits. n_messages=0 would mean "no limit" to Langflow,
+                # so run in a fresh session with no memory instead.
+                session_id = f"{session_id}:{uuid.uuid4().hex[:8]}"
+                in_session_memory = False
+            elif agent_id:
+                tweaks[agent_id] = {"n_messages": len(kept)}
+            logger.debug("Conversation context: kept %d of %d messages", len(kept), len(history))
+
         run_url = os.getenv('LANGFLOW_RUN_URL')
         timeout = float(os.getenv("LANGFLOW_TIMEOUT_SECONDS", "180"))
-        if run_url:
-            # Direct Astra URL path
-            if client is None:
-                client = LangflowClient(application_token=os.getenv('LANGFLOW_APPLICATION_TOKEN') or langflow_token)
-            # Prefer explicit token argument, then env var, then any provided langflow_token
-            auth_token = langflow_token or os.getenv('LANGFLOW_APPLICATION_TOKEN')
-            try:
-                response = await client.run_flow_url(
-                run_url=run_url,
-                message=message,
-                tweaks=tweaks,
-                session_id=user_id,
-                timeout=timeout,
-                auth_token=auth_token,
-            )
-            except Exception as e:
-                # If upstream returned a rate-limit or 'request too large' error, try to detect and give
-                # a helpful message to the user instead of opaque text.
-                err_text = str(e)
-                # Look for common rate-limit/request-too-large signals in the message
-                if "rate_limit_exceeded" in err_text or "Request too large" in err_text or "tokens per minute" in err_text:
+
+        cache = get_response_cache() if use_cache else None
+        cache_flow_key = run_url or os.getenv('LANGFLOW_FLOW_ID') or ""
+        if cache is not None:
+            with span("langflow.cache_lookup") as current:
+                cached = cache.get(cache_flow_key, message)
+                if current is not None:
+                    current.set(hit=cached is not None)
+            if cached is not None:
+                return cached
+
+        streaming = on_token is not None and os.getenv("LANGFLOW_STREAMING", "false").lower() == "true"
+        response = None
+        # Admission control: bounded concurrency + wait queue; raises LangflowOverloaded when full
+        async with get_admission_controller().slot():
+            if run_url:
+                # Direct Astra URL path
+                if client is None:
+                    client = LangflowClient(application_token=os.getenv('LANGFLOW_APPLICATION_TOKEN') or langflow_token)
+                # Prefer explicit token argument, then env var, then any provided langflow_token
+                auth_token = langflow_token or os.getenv('LANGFLOW_APPLICATION_TOKEN')
+                try:
+                    if streaming:
+                        response = await _stream_or_none(
+                            client, run_url, on_token,
+                            message=message, tweaks=tweaks, session_id=session_id,
+                            timeout=timeout, auth_token=auth_token,
+                        )
+                    if response is None:
+                        response = await client.run_flow_url(
+                            run_url=run_url,
+                            message=message,
+                            tweaks=tweaks,
+                            session_id=session_id,
+                            timeout=timeout,
+                            auth_token=auth_token,
+                        )
+                except Exception as e:
+                    # If upstream returned a rate-limit or 'request too large' error, try to detect and give
+                    # a helpful message to the user instead of opaque text.
+                    err_text = str(e)
+                    # Look for common rate-limit/request-too-large signals in the message
+                    if "rate_limit_exceeded" in err_text or "Request too large" in err_text or "tokens per minute" in err_text:
+                        return (
+                            "The language model rejected the request because it requested too many tokens or hit a rate limit. "
+                            "Please shorten your query or try again later. If this is a recurring need, consider using a smaller model or upgrading your service tier."
+                        )
+                    # Re-raise otherwise so higher-level handler can surface the error
+                    raise
+            else:
+                flow_id = os.getenv('LANGFLOW_FLOW_ID')
+                if not flow_id or flow_id.strip().lower() in {"", "your_flow_id_here", "<your_flow_id>"}:
                     return (
-                        "The language model rejected the request because it requested too many tokens or hit a rate limit. "
-                        "Please shorten your query or try again later. If this is a recurring need, consider using a smaller model or upgrading your service tier."
+                        "Missing 'LANGFLOW_FLOW_ID'. Please provide your Langflow flow ID to enable the trip planning agent."
                     )
-                # Re-raise otherwise so higher-level handler can surface the error
-                raise
-        else:
-            flow_id = os.getenv('LANGFLOW_FLOW_ID')
-            if not flow_id or flow_id.strip().lower() in {"", "your_flow_id_here", "<your_flow_id>"}:
-                return (
-                    "Missing 'LANGFLOW_FLOW_ID'. Please provide your Langflow flow ID to enable the trip planning agent."
-                )
-            response = await client.run_flow(
-                flow_id=flow_id,
-                message=message,
-                tweaks=tweaks,
-                session_id=user_id,  # Use user_id as session_id for conversation continuity
-                timeout=timeout,
-            )
+                if streaming:
+                    response = await _stream_or_none(
+                        client, f"{client.base_url}/api/v1/run/{flow_id}", on_token,
+                        message=message, tweaks=tweaks, session_id=session_id, timeout=timeout,
+                    )
+                if response is None:
+                    response = await client.run_flow(
+                        flow_id=flow_id,
+                        message=message,
+                        tweaks=tweaks,
+                        session_id=session_id,
+                        timeout=timeout,
+                    )
+
+        if on_agent_run is not None and in_session_memory:
+            on_agent_run()
 
         # Extract text from response
-        ai_response = client.extract_response_text(response)
+        with span("langflow.extract_response_text"):
+            ai_response = client.extract_response_text(response)
         if not ai_response:
             ai_response = "I processed your request, but didn't receive text output from the Langflow trip agent."
+        elif cache is not None and ai_response != NO_OUTPUT_TEXT and not ai_response.startswith("Error processing response"):
+            cache.set(cache_flow_key, message, ai_response)
         return ai_response
 
+    except LangflowOverloaded:
+        # Let the API layer turn this into a 503 with Retry-After
+        raise
     except Exception as e:
-        print(f"Error processing travel query: {str(e)}")
+        logger.error("Error processing travel query: %s", e)
         return f"I'm sorry, I encountered an error while processing your request: {str(e)}"
 
 
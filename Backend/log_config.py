@@ -0,0 +1,198 @@
+"""
+Queue-based structured logging for the backend.
+
+Loggers returned by `get_logger` only put records on a bounded in-memory queue; a listener
+thread does the redaction, JSON encoding and the actual write to stdout. When the queue is
+full (stdout backed up), records are dropped and counted instead of stalling the event loop.
+
+Settings (environment / .env):
+    LOG_LEVEL               DEBUG | INFO | WARNING | ERROR (default INFO)
+    LOG_FORMAT              json | text (default json)
+    LOG_QUEUE_SIZE          records buffered before dropping (default 10000)
+    LOG_DEBUG_SAMPLE_EVERY  keep the first and then every Nth record of each DEBUG message (default 1)
+
+A call site can override sampling for a noisy line with `extra={"sample_every": N}`.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from metrics import counter, gauge
+
+LOG_RECORDS_DROPPED = counter(
+    "wanderpal_log_records_dropped_total", "Log records dropped because the log queue was full."
+)
+LOG_RECORDS_SAMPLED_OUT = counter(
+    "wanderpal_log_records_sampled_out_total", "DEBUG log records skipped by per-message sampling."
+)
+
+_REDACTED = "[REDACTED]"
+_SECRET_PATTERNS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"(?i)\b(bearer)\s+[A-Za-z0-9._~+/=-]+"), r"\1 " + _REDACTED),
+    (re.compile(r"AstraCS:[A-Za-z0-9:_-]+"), "AstraCS:" + _REDACTED),
+    (re.compile(r"\beyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+"), _REDACTED),
+    (
+        re.compile(
+            r"(?i)(?<![a-z])((?:api[_-]?key|apikey|x-api-key|x-astra-token|token|password|secret|authorization)"
+            r"[\"']?\s*[=:]\s*[\"']?)[^\s\"'&,;}]+"
+        ),
+        r"\1" + _REDACTED,
+    ),
+]
+_SECRET_ENV_NAME = re.compile(r"KEY|TOKEN|SECRET|PASSWORD|MONGODB_URL", re.IGNORECASE)
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def _secret_values() -> List[str]:
+    """Values of secret-looking environment variables, longest first, to scrub verbatim."""
+    values = {v for k, v in os.environ.items() if _SECRET_ENV_NAME.search(k) and v and len(v) >= 8}
+    return sorted(values, key=len, reverse=True)
+
+
+def redact(text: str, secrets: Optional[List[str]] = None) -> str:
+    for secret in secrets or ():
+        if secret in text:
+            text = text.replace(secret, _REDACTED)
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, secrets: List[str]):
+        super().__init__()
+        self.secrets = secrets
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage(), self.secrets),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and key != "sample_every":
+                entry[key] = redact(value, self.secrets) if isinstance(value, str) else value
+        if record.exc_text:
+            entry["exc"] = redact(record.exc_text, self.secrets)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The old `[LEVEL] message` console style, with redaction."""
+
+    def __init__(self, secrets: List[str]):
+        super().__init__()
+        self.secrets = secrets
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = f"[{record.levelname}] {record.getMessage()}"
+        if record.exc_text:
+            text = f"{text}\n{record.exc_text}"
+        return redact(text, self.secrets)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps the first and then every Nth DEBUG record per (logger, message template)."""
+
+    def __init__(self, every: int = 1, max_keys: int = 2048):
+        super().__init__()
+        self.every = max(every, 1)
+        self.max_keys = max_keys
+        self._seen: Dict[Tuple[str, str], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        every = getattr(record, "sample_every", self.every)
+        if every <= 1:
+            return True
+        key = (record.name, str(record.msg))
+        if key not in self._seen and len(self._seen) >= self.max_keys:
+            self._seen.clear()
+        count = self._seen.get(key, 0)
+        self._seen[key] = count + 1
+        if count % every == 0:
+            return True
+        LOG_RECORDS_SAMPLED_OUT.inc()
+        return False
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the args here; redaction and encoding happen on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue: Optional[queue.Queue] = None
+_configured = False
+
+
+def configure_logging() -> None:
+    """Install the queue handler on the `wanderpal` logger. Safe to call more than once."""
+    global _listener, _queue, _configured
+    if _configured:
+        return
+    _configured = True
+    # Loggers are created at import time, possibly before main.py loads .env
+    load_dotenv()
+    _queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    secrets = _secret_values()
+    output = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        output.setFormatter(TextFormatter(secrets))
+    else:
+        output.setFormatter(JsonFormatter(secrets))
+
+    handler = BoundedQueueHandler(_queue)
+    handler.addFilter(SamplingFilter(int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "1"))))
+    root = logging.getLogger("wanderpal")
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(_queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    gauge("wanderpal_log_queue_depth", "Log records waiting to be written.", callback=lambda: {(): _queue.qsize()})
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except queue.Full:
+            pass  # the stop sentinel couldn't be queued; the daemon thread dies with the process
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(f"wanderpal.{name}")
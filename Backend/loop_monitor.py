@@ -0,0 +1,173 @@
+"""
+Event-loop health: a lag monitor and an on-demand sampling profiler.
+
+LoopLagMonitor runs a tiny task that asks to wake every `interval` seconds; how late it
+actually wakes is the loop's scheduling delay, recorded into a histogram and a window used
+for percentiles. A watchdog thread watches the same heartbeat, and when the loop has not
+come back for `stall_threshold` seconds it captures the loop thread's stack *while it is
+still blocked*, so the culprit (a synchronous call on the loop) is in the report.
+
+SamplingProfiler samples thread stacks from a background thread and returns them in the
+collapsed format ("frame;frame;frame count") that flamegraph.pl and speedscope read.
+"""
+import asyncio
+import sys
+import threading
+import traceback
+from collections import Counter, deque
+from time import monotonic, sleep, time
+from typing import Any, Deque, Dict, List, Optional
+
+from log_config import get_logger
+from metrics import counter, histogram
+
+logger = get_logger("loop_monitor")
+
+EVENT_LOOP_LAG_SECONDS = histogram(
+    "wanderpal_event_loop_lag_seconds",
+    "How late the event loop ran a callback scheduled for a fixed time.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+EVENT_LOOP_STALLS = counter(
+    "wanderpal_event_loop_stalls_total", "Times the event loop was blocked past the stall threshold."
+)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class LoopLagMonitor:
+    def __init__(
+        self,
+        interval: float = 0.1,
+        stall_threshold: float = 0.25,
+        window: int = 3000,
+        max_stalls: int = 20,
+    ):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self._lags: Deque[float] = deque(maxlen=window)
+        self._stalls: Deque[Dict[str, Any]] = deque(maxlen=max_stalls)
+        self._heartbeat = monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=2)
+            self._watchdog = None
+
+    async def _sample(self) -> None:
+        while True:
+            expected = monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self._lags.append(lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+    def _watch(self) -> None:
+        # Only one capture per stall: re-armed once the loop has produced a new heartbeat
+        captured_for: Optional[float] = None
+        while not self._stopping.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked_for = monotonic() - heartbeat - self.interval
+            if blocked_for < self.stall_threshold or captured_for == heartbeat:
+                continue
+            captured_for = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            self._stalls.append({
+                "detected_at": time(),
+                "blocked_ms": round(blocked_for * 1000, 1),
+                "stack": [line.rstrip() for line in stack],
+            })
+            EVENT_LOOP_STALLS.inc()
+            # Innermost frame is enough for the log line; the full stack is in the report
+            logger.warning(
+                "Event loop blocked for %.0f ms at %s",
+                blocked_for * 1000,
+                stack[-1].strip().splitlines()[0] if stack else "unknown",
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        lags = list(self._lags)
+        return {
+            "interval_ms": self.interval * 1000,
+            "stall_threshold_ms": self.stall_threshold * 1000,
+            "samples": len(lags),
+            "lag_ms": {
+                "p50": round(_percentile(lags, 0.50) * 1000, 3),
+                "p90": round(_percentile(lags, 0.90) * 1000, 3),
+                "p99": round(_percentile(lags, 0.99) * 1000, 3),
+                "max": round(max(lags, default=0.0) * 1000, 3),
+            },
+            "recent_stalls": list(self._stalls),
+        }
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is still running."""
+
+
+class SamplingProfiler:
+    """Statistical profiler over sys._current_frames(). One profile at a time; sampling
+    runs on its own thread so the loop being profiled keeps serving requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _collect(self, seconds: float, interval: float, thread_ids: Optional[List[int]]) -> str:
+        own_id = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks: Counter = Counter()
+        deadline = monotonic() + seconds
+        while monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (thread_ids and thread_id not in thread_ids):
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(frames))] += 1
+            sleep(interval)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    async def profile(self, seconds: float, interval: float = 0.005, loop_only: bool = False) -> str:
+        """Sample for `seconds` and return collapsed stacks. With `loop_only`, only the
+        event loop's thread is sampled."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            thread_ids = [threading.get_ident()] if loop_only else None
+            return await asyncio.to_thread(self._collect, seconds, interval, thread_ids)
+        finally:
+            self._lock.release()
@@ -4,15 +4,22 @@ import random
 from time import time
 import asyncio
 import uuid
+import json
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict
+from typing import Optional, Tuple
 
 import httpx
 import motor.motor_asyncio
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, InsertOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Depends, Query, Header, Request
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import random
 import requests
@@ -20,6 +27,34 @@ import requests
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 
+from langflow import (
+    close_shared_http_client,
+    get_admission_controller,
+    get_response_cache,
+    get_upstream_stats,
+    LangflowOverloaded,
+    warm_token_counter,
+)
+from trending_cache import TrendingCache, geohash_center, geohash_encode, geohash_precision_for_radius
+from ttl_cache import TTLCache
+from task_store import TaskStore, TaskStoreFull
+from task_queue import MemoryTaskBackend, MongoTaskBackend
+from message_store import BucketMessageStore, DocumentMessageStore
+from message_writer import MessageWriter, touch_conversation
+from password_hasher import PasswordHasher, PasswordHasherBusy
+from auth_cache import TokenVerifier
+from log_config import get_logger
+from loop_monitor import LoopLagMonitor, ProfilerBusy, SamplingProfiler
+from tracing import current_span, current_trace_context, get_tracer, span
+from metrics import (
+    REGISTRY,
+    UPSTREAM_REQUEST_SECONDS,
+    MongoCommandMetrics,
+    gauge,
+    histogram,
+    status_outcome,
+)
+
 # --- Load environment variables ---
 load_dotenv()
 MONGODB_URL = os.getenv("MONGODB_URL")
@@ -29,24 +64,84 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 ALLOW_ANONYMOUS_CHAT = os.getenv("ALLOW_ANONYMOUS_CHAT", "true").lower() == "true"
 
-print(f"[CONFIG] ALLOW_ANONYMOUS_CHAT={ALLOW_ANONYMOUS_CHAT}")
-print(f"[CONFIG] LANGFLOW_RUN_URL present={bool(os.getenv('LANGFLOW_RUN_URL'))}")
-print(f"[CONFIG] LANGFLOW_BASE_URL present={bool(os.getenv('LANGFLOW_BASE_URL'))}")
-print(f"[CONFIG] LANGFLOW_FLOW_ID present={bool(os.getenv('LANGFLOW_FLOW_ID'))}")
-print(f"[CONFIG] LANGFLOW_APPLICATION_TOKEN present={bool(os.getenv('LANGFLOW_APPLICATION_TOKEN'))}")
+logger = get_logger("main")
+logger.info(
+    "Config loaded",
+    extra={
+        "allow_anonymous_chat": ALLOW_ANONYMOUS_CHAT,
+        "langflow_run_url_present": bool(os.getenv("LANGFLOW_RUN_URL")),
+        "langflow_base_url_present": bool(os.getenv("LANGFLOW_BASE_URL")),
+        "langflow_flow_id_present": bool(os.getenv("LANGFLOW_FLOW_ID")),
+        "langflow_application_token_present": bool(os.getenv("LANGFLOW_APPLICATION_TOKEN")),
+    },
+)
 
 # Validate Langflow configuration on startup
 if not os.getenv('LANGFLOW_APPLICATION_TOKEN'):
-    print("[WARNING] LANGFLOW_APPLICATION_TOKEN is not set! Chat functionality will fail.")
+    logger.warning("LANGFLOW_APPLICATION_TOKEN is not set! Chat functionality will fail.")
 if not os.getenv('LANGFLOW_RUN_URL') and not (os.getenv('LANGFLOW_BASE_URL') and os.getenv('LANGFLOW_FLOW_ID')):
-    print("[WARNING] Neither LANGFLOW_RUN_URL nor (LANGFLOW_BASE_URL + LANGFLOW_FLOW_ID) are configured! Chat will fail.")
+    logger.warning("Neither LANGFLOW_RUN_URL nor (LANGFLOW_BASE_URL + LANGFLOW_FLOW_ID) are configured! Chat will fail.")
 
 # --- Constants ---
 OPENTRIPMAP_API_KEY = os.getenv("OPENTRIPMAP_API_KEY")
-OPENTRIPMAP_BASE_URL = "https://api.opentripmap.com/0.1/en/"
+OPENTRIPMAP_BASE_URL = os.getenv("OPENTRIPMAP_BASE_URL", "https://api.opentripmap.com/0.1/en/")
+TRENDING_DETAIL_CONCURRENCY = int(os.getenv("TRENDING_DETAIL_CONCURRENCY", "5"))
+TRENDING_DETAIL_TIMEOUT_SECONDS = float(os.getenv("TRENDING_DETAIL_TIMEOUT_SECONDS", "5"))
+# Coarsest cache tile; smaller radii get finer tiles (see geohash_precision_for_radius)
+TRENDING_GEOHASH_PRECISION = int(os.getenv("TRENDING_GEOHASH_PRECISION", "5"))  # ~4.9km tiles
+TRENDING_CACHE_MONGO = os.getenv("TRENDING_CACHE_MONGO", "false").lower() == "true"
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "true").lower() == "true"
+# Emails allowed to use the /admin endpoints; empty disables them
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+
+# --- OpenTripMap HTTP client (pooled, reused across /trending requests) ---
+_otm_client: Optional[httpx.AsyncClient] = None
+
+
+def get_otm_client() -> httpx.AsyncClient:
+    global _otm_client
+    if _otm_client is None or _otm_client.is_closed:
+        _otm_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=TRENDING_DETAIL_CONCURRENCY),
+        )
+    return _otm_client
+
 
 # --- App setup ---
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    try:
+        await trending_cache.ensure_indexes()
+    except Exception as e:
+        logger.error("Failed to create trending cache indexes: %s", e)
+    # Before any chat task runs: loading the tokenizer may download it, which would block the loop
+    await warm_token_counter(float(os.getenv("TOKENIZER_LOAD_TIMEOUT_SECONDS", "10")))
+    await _tasks.start(_run_langflow_task)
+    if LOOP_MONITOR:
+        await loop_monitor.start()
+    yield
+    # Shutdown: stop task workers, then release pooled upstream connections
+    await loop_monitor.stop()
+    await _tasks.stop()
+    await message_writer.close()
+    password_hasher.shutdown()
+    get_tracer().close()
+    await close_shared_http_client()
+    if _otm_client is not None:
+        await _otm_client.aclose()
+
+
+# --- Event-loop health ---
+loop_monitor = LoopLagMonitor(
+    interval=float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000,
+    stall_threshold=float(os.getenv("LOOP_STALL_THRESHOLD_MS", "250")) / 1000,
+)
+profiler = SamplingProfiler()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Change to frontend domain in production
@@ -55,20 +150,117 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+HTTP_REQUEST_SECONDS = histogram(
+    "wanderpal_http_request_duration_seconds",
+    "Time to produce a response (for streaming responses, until headers are sent), per route.",
+    ("method", "route", "status"),
+)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time()
+    status = 500
+    with span(f"{request.method} {request.url.path}") as root:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            if root is not None:
+                response.headers["X-Trace-Id"] = root.trace_id
+            return response
+        finally:
+            # Label by route template, not raw path, so ids don't explode the series count
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(
+                time() - start,
+                method=request.method,
+                route=route,
+                status=str(status),
+            )
+            if root is not None:
+                root.name = f"{request.method} {route}"
+                root.set(status=status)
+
+
 # --- Database connection ---
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URL)
+client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URL, event_listeners=[MongoCommandMetrics()])
 db = client[DB_NAME]
 
+# "documents" keeps one document per message; "buckets" packs each conversation's messages
+# into bucket documents (see migrate_messages.py to move existing data across)
+MESSAGE_STORAGE = os.getenv("MESSAGE_STORAGE", "documents").lower()
+if MESSAGE_STORAGE == "buckets":
+    message_store = BucketMessageStore(
+        db["message_buckets"], bucket_size=int(os.getenv("MESSAGE_BUCKET_SIZE", "100"))
+    )
+else:
+    message_store = DocumentMessageStore(db["messages"])
+
+# Chat messages and conversation bumps from concurrent requests are flushed together
+message_writer = MessageWriter(
+    message_store,
+    db["conversations"],
+    max_batch=int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("MESSAGE_WRITE_FLUSH_MS", "5")) / 1000,
+)
+
+async def ensure_indexes():
+    """Create the indexes the hot read paths rely on. Safe to run on every startup."""
+    indexes = [
+        ("conversations", [("user_email", ASCENDING), ("last_modified", DESCENDING), ("_id", DESCENDING)], {}),
+        ("users", [("email", ASCENDING)], {"unique": True}),
+        ("trips", [("user_email", ASCENDING), ("_id", DESCENDING)], {}),
+    ]
+    for collection, keys, options in indexes:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            # e.g. duplicate emails already present; the app still works without the index
+            logger.error("Failed to create index on %s %s: %s", collection, keys, e)
+    try:
+        await message_store.ensure_indexes()
+    except Exception as e:
+        logger.error("Failed to create message store indexes: %s", e)
+
+
+# --- OpenTripMap response cache (in-process LRU, optionally shared through MongoDB) ---
+trending_cache = TrendingCache(
+    radius_ttl=float(os.getenv("TRENDING_RADIUS_TTL_SECONDS", "600")),
+    detail_ttl=float(os.getenv("TRENDING_DETAIL_TTL_SECONDS", "86400")),
+    max_entries=int(os.getenv("TRENDING_CACHE_MAX_ENTRIES", "2048")),
+    max_bytes=int(os.getenv("TRENDING_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    collection=db["otm_cache"] if TRENDING_CACHE_MONGO else None,
+)
+
 # --- Security setup (Password hashing) ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Raising BCRYPT_ROUNDS makes existing hashes "need update"; they are rehashed on next sign-in
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+)
+password_hasher = PasswordHasher(
+    pwd_context,
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32")),
+)
+
 
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Returns (matches, new_hash); new_hash is set when the stored hash should be upgraded."""
+    return await password_hasher.verify_and_update(plain_password, hashed_password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
 
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+
+def _password_busy(e: PasswordHasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many sign-in requests right now. Please try again shortly.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -82,6 +274,18 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 # --- Auth dependency ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="signin")
 
+# Verified claims are cached per token (until the token's own expiry), so the frequent
+# /chat/result and /chat/history calls don't re-verify the same JWT every time
+token_verifier = TokenVerifier(
+    SECRET_KEY, [ALGORITHM], max_entries=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+)
+
+
+def decode_user_token(token: str) -> dict:
+    """Claims of a valid user JWT. Raises JWTError if the token is invalid or expired.
+    The returned dict is shared with the cache and must not be modified."""
+    return token_verifier.verify(token)
+
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     """FastAPI dependency to get the currently authenticated user from a JWT Bearer token."""
@@ -91,7 +295,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_user_token(token)
         sub = payload.get("sub")
         if sub is None:
             raise credentials_error
@@ -100,6 +304,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
         raise credentials_error
 
 
+async def require_admin(user: dict = Depends(get_current_user)) -> dict:
+    """FastAPI dependency for operator endpoints: the caller's email must be in ADMIN_EMAILS."""
+    if user["sub"].lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+
 async def parse_bearer_token(authorization: Optional[str] = Header(None)) -> Optional[str]:
     """Extract Bearer token from the Authorization header if present; return None if absent."""
     if not authorization:
@@ -143,8 +354,18 @@ async def signin(data: SignInRequest):
     user = await db["users"].find_one({"email": data.email})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if not verify_password(data.password, user.get("password")):
+    try:
+        matches, new_hash = await verify_password(data.password, user.get("password"))
+    except PasswordHasherBusy as e:
+        raise _password_busy(e)
+    if not matches:
         raise HTTPException(status_code=400, detail="Wrong password")
+    if new_hash:
+        # Transparent upgrade of hashes made with older settings
+        try:
+            await db["users"].update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
+        except Exception as e:
+            logger.error("Failed to store rehashed password: %s", e)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user["email"]}, expires_delta=access_token_expires
@@ -160,7 +381,10 @@ async def signup(data: SignUpRequest):
     if existing:
         raise HTTPException(status_code=400, detail="User already exists")
 
-    hashed_password = get_password_hash(data.password)
+    try:
+        hashed_password = await get_password_hash(data.password)
+    except PasswordHasherBusy as e:
+        raise _password_busy(e)
     user = data.dict()
     user["password"] = hashed_password
     user["notifications"] = {
@@ -180,115 +404,285 @@ async def signup(data: SignUpRequest):
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+# --- Keyset pagination helpers ---
+# Cursors are "<iso timestamp>|<_id>" of the last item on the previous page, so each page is an
+# index range scan instead of a skip over everything before it.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(timestamp: datetime, item_id) -> str:
+    return f"{timestamp.isoformat()}|{item_id}"
+
+
+def _decode_cursor(cursor: str, object_id: bool = False):
+    try:
+        ts_text, item_id = cursor.split("|", 1)
+        timestamp = datetime.fromisoformat(ts_text)
+        return timestamp, (ObjectId(item_id) if object_id else item_id)
+    except (ValueError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid 'before' cursor")
+
+
+def _decode_object_id(value: str):
+    """Trip ids are normally ObjectIds, but fall back to the raw string for imported data."""
+    try:
+        return ObjectId(value)
+    except InvalidId:
+        return value
+
+
+def _before_filter(field: str, cursor: str, object_id: bool = False) -> dict:
+    timestamp, item_id = _decode_cursor(cursor, object_id)
+    return {"$or": [
+        {field: {"$lt": timestamp}},
+        {field: timestamp, "_id": {"$lt": item_id}},
+    ]}
+
+
+# --- User profile / trips cache (optional, read-through, per process) ---
+USER_PROFILE_CACHE = os.getenv("USER_PROFILE_CACHE", "false").lower() == "true"
+USER_PROFILE_CACHE_TTL_SECONDS = float(os.getenv("USER_PROFILE_CACHE_TTL_SECONDS", "60"))
+profile_cache = TTLCache(max_entries=int(os.getenv("USER_PROFILE_CACHE_MAX_ENTRIES", "5000"))) if USER_PROFILE_CACHE else None
+
+
+async def load_user_profile(email: str) -> Optional[dict]:
+    """The user's profile without password or _id, read through the profile cache if enabled.
+    Callers get their own copy, so they may modify it."""
+    if profile_cache is not None:
+        cached = profile_cache.get(email)
+        if cached is not None:
+            return dict(cached)
+    user = await db["users"].find_one({"email": email}, {"password": 0, "_id": 0})
+    if user and profile_cache is not None:
+        profile_cache.set(email, user, USER_PROFILE_CACHE_TTL_SECONDS)
+    return dict(user) if user else None
+
+
+def invalidate_user_profile(email: str) -> None:
+    if profile_cache is not None:
+        profile_cache.delete(email)
+
+
+def _trips_cache_key(email: str) -> str:
+    # One entry per user holding the first page for each page size, so a write can drop them all
+    return f"trips\x00{email}"
+
+
+def invalidate_user_trips(email: str) -> None:
+    if profile_cache is not None:
+        profile_cache.delete(_trips_cache_key(email))
+
+
 @app.get("/profile/{email}")
 async def get_user(email: str):
     """Fetch user profile by email"""
-    user = await db["users"].find_one({"email": email})
+    user = await load_user_profile(email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-
-    user.pop("password", None)
-    user.pop("_id", None)
     return user
 
 
 @app.put("/profile/{email}")
 async def update_user(email: str, data: UserUpdateRequest):
-    user = await db["users"].find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
     update_data = {k: v for k, v in data.dict().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No valid fields to update")
-    await db["users"].update_one({"email": email}, {"$set": update_data})
+    # One round trip: the update doubles as the existence check and returns the new profile
+    try:
+        user = await db["users"].find_one_and_update(
+            {"email": email},
+            {"$set": update_data},
+            projection={"password": 0, "_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # The unique email index rejects changing to an address another account uses
+        raise HTTPException(status_code=409, detail="Email is already in use")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user_profile(email)
+    # The trips listing tells "no trips" from "no user" by the profile, so it is stale too
+    invalidate_user_trips(email)
+    invalidate_user_trips(user["email"])
+    if profile_cache is not None:
+        profile_cache.set(user["email"], user, USER_PROFILE_CACHE_TTL_SECONDS)
     return {"message": "User updated successfully", "email": email}
 
 
 @app.get("/users/{email}/trips")
-async def get_user_trips(email: str):
-    """Fetch trips for a user"""
-    user = await db["users"].find_one({"email": email})
-    if not user:
+async def get_user_trips(
+    email: str,
+    before: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """
+    Fetch trips for a user, newest first. Pass the returned `next_before` as `?before=` to
+    load the next page.
+    """
+    cache_key = _trips_cache_key(email)
+    if profile_cache is not None and not before:
+        cached = (profile_cache.get(cache_key) or {}).get(limit)
+        if cached is not None:
+            return cached
+
+    query = {"user_email": email}
+    if before:
+        query["_id"] = {"$lt": _decode_object_id(before)}
+    trips = await db["trips"].find(query).sort("_id", DESCENDING).limit(limit + 1).to_list(length=limit + 1)
+
+    # Only an empty first page needs the (cached) user lookup to tell "no trips" from "no user"
+    if not trips and not before and not await load_user_profile(email):
         raise HTTPException(status_code=404, detail="User not found")
 
-    trips = await db["trips"].find({"user_email": email}).to_list(length=None)
+    next_before = None
+    if len(trips) > limit:
+        trips = trips[:limit]
+        next_before = str(trips[-1]["_id"])
     for trip in trips:
         trip.pop("_id", None)
-    return {"trips": trips}
+    page = {"trips": trips, "next_before": next_before}
+    if profile_cache is not None and not before:
+        pages = dict(profile_cache.get(cache_key) or {})
+        pages[limit] = page
+        profile_cache.set(cache_key, pages, USER_PROFILE_CACHE_TTL_SECONDS)
+    return page
+
+
+async def _otm_get(client: httpx.AsyncClient, url: str, upstream: str, **kwargs) -> httpx.Response:
+    """GET from OpenTripMap, recording the call in the upstream latency histogram."""
+    start = time()
+    outcome = "error"
+    try:
+        response = await client.get(url, **kwargs)
+        outcome = status_outcome(response.status_code)
+        return response
+    except httpx.TimeoutException:
+        outcome = "timeout"
+        raise
+    finally:
+        UPSTREAM_REQUEST_SECONDS.observe(time() - start, upstream=upstream, outcome=outcome)
+
+
+async def _fetch_place_detail(client: httpx.AsyncClient, xid: str, semaphore: asyncio.Semaphore) -> Optional[dict]:
+    """Fetch a single OpenTripMap place detail. Returns None on any failure so one slow or
+    broken xid never holds up (or breaks) the rest of the trending list."""
+    cached = await trending_cache.get_detail(xid)
+    if cached is not None:
+        return cached
+    detail_url = f"{OPENTRIPMAP_BASE_URL}places/xid/{xid}"
+    try:
+        async with semaphore:
+            detail_resp = await _otm_get(
+                client,
+                detail_url,
+                "opentripmap_xid",
+                params={"apikey": OPENTRIPMAP_API_KEY},
+                timeout=TRENDING_DETAIL_TIMEOUT_SECONDS,
+            )
+    except httpx.HTTPError as e:
+        logger.debug("Detail %s failed: %s", xid, type(e).__name__)
+        return None
+    logger.debug("Detail %s status: %d", xid, detail_resp.status_code, extra={"sample_every": 20})
+    if detail_resp.status_code != 200:
+        return None
+    try:
+        detail = detail_resp.json()
+    except ValueError:
+        return None
+    place = {
+        "name": detail.get("name"),
+        "kinds": detail.get("kinds"),
+        "address": detail.get("address", {}),
+        "preview": detail.get("preview", {}).get("source"),
+        "wikipedia_extracts": detail.get("wikipedia_extracts", {}).get("text"),
+        "otm": detail.get("otm"),
+        "xid": xid
+    }
+    await trending_cache.set_detail(xid, place)
+    return place
 
 
 @app.get("/trending")
 async def trending(lat: float, lon: float, radius: int = 30000):
-    print(f"[DEBUG] Using OPENTRIPMAP_API_KEY: {OPENTRIPMAP_API_KEY}")
-    url = f"{OPENTRIPMAP_BASE_URL}places/radius"
-    params = {
-        "apikey": OPENTRIPMAP_API_KEY,
-        "radius": radius,
-        "lon": lon,
-        "lat": lat,
-        "rate": 3,
-        "format": "geojson",
-        "limit": 10,
-    }
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, params=params)
-        print(f"[DEBUG] OpenTripMap /places/radius status: {resp.status_code}")
-        print(f"[DEBUG] Response: {resp.text[:300]}")
+    client = get_otm_client()
+    # Nearby users share one cache entry: snap the query to the centre of its geohash tile.
+    # The tile is sized from the radius, so the snap stays within a fifth of the radius.
+    tile = geohash_encode(lat, lon, geohash_precision_for_radius(radius, TRENDING_GEOHASH_PRECISION))
+    features = await trending_cache.get_radius(tile, radius)
+    if features is None:
+        tile_lat, tile_lon = geohash_center(tile)
+        url = f"{OPENTRIPMAP_BASE_URL}places/radius"
+        params = {
+            "apikey": OPENTRIPMAP_API_KEY,
+            "radius": radius,
+            "lon": tile_lon,
+            "lat": tile_lat,
+            "rate": 3,
+            "format": "geojson",
+            "limit": 10,
+        }
+        resp = await _otm_get(client, url, "opentripmap_radius", params=params)
+        logger.debug("OpenTripMap /places/radius status: %d (%d bytes)", resp.status_code, len(resp.content))
         if resp.status_code != 200:
             raise HTTPException(status_code=502, detail=f"OpenTripMap error: {resp.status_code} {resp.text[:200]}")
         data = resp.json()
-    features = data.get("features")
+        features = data.get("features") or []
+        await trending_cache.set_radius(tile, radius, features)
     if not features:
         return {"trending": [], "message": "No trending places found for this location."}
-    trending = []
-    async with httpx.AsyncClient() as client:
-        for feat in features:
-            prop = feat.get("properties", {})
-            xid = prop.get("xid")
-            if not xid:
-                continue
-            detail_url = f"{OPENTRIPMAP_BASE_URL}places/xid/{xid}"
-            detail_resp = await client.get(detail_url, params={"apikey": OPENTRIPMAP_API_KEY})
-            print(f"[DEBUG] Detail {xid} status: {detail_resp.status_code}")
-            if detail_resp.status_code != 200:
-                continue
-            detail = detail_resp.json()
-            trending.append({
-                "name": detail.get("name"),
-                "kinds": detail.get("kinds"),
-                "address": detail.get("address", {}),
-                "preview": detail.get("preview", {}).get("source"),
-                "wikipedia_extracts": detail.get("wikipedia_extracts", {}).get("text"),
-                "otm": detail.get("otm"),
-                "xid": xid
-            })
-    return {"trending": trending}
+
+    xids = [feat.get("properties", {}).get("xid") for feat in features]
+    xids = [xid for xid in xids if xid]
+    # Fetch all details concurrently (bounded by the semaphore); latency now tracks the
+    # slowest single detail call rather than the sum of all of them.
+    semaphore = asyncio.Semaphore(TRENDING_DETAIL_CONCURRENCY)
+    places = await asyncio.gather(*(_fetch_place_detail(client, xid, semaphore) for xid in xids))
+    return {"trending": [place for place in places if place is not None]}
+
+
+@app.get("/trending/cache/stats")
+async def trending_cache_stats(_: dict = Depends(require_admin)):
+    """Hit/miss counters and size of the OpenTripMap response cache."""
+    return trending_cache.snapshot()
 
 @app.get("/chat/history/{conversation_id}")
-async def get_chat_history(conversation_id: str, user: dict = Depends(get_current_user)):
+async def get_chat_history(
+    conversation_id: str,
+    before: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE * 2, ge=1, le=MAX_PAGE_SIZE),
+    user: dict = Depends(get_current_user),
+):
     """
     Fetches the message history for a specific conversation ID.
     Ensures the conversation belongs to the authenticated user.
+    Returns the most recent `limit` messages (oldest first); pass the returned `next_before`
+    as `?before=` to load the page of older messages.
     """
     user_email = user.get("sub")
     if not user_email:
         raise HTTPException(status_code=403, detail="Invalid user token")
 
     # Security Check: First, make sure this conversation belongs to this user
-    convo = await db["conversations"].find_one({
-        "_id": conversation_id,
-        "user_email": user_email
-    })
+    convo = await db["conversations"].find_one(
+        {"_id": conversation_id, "user_email": user_email},
+        {"_id": 1},
+    )
     if not convo:
         raise HTTPException(status_code=404, detail="Conversation not found or access denied")
 
-    # Now, get all messages for that conversation, sorted oldest first
-    history_cursor = db["messages"].find({
-        "conversation_id": conversation_id
-    }).sort("timestamp", 1)  # 1 = ascending order
-    
+    # Newest first so the limit keeps the latest messages; one extra row tells us if there's more
+    messages = await message_store.history(
+        conversation_id, _decode_cursor(before, object_id=True) if before else None, limit + 1
+    )
+
+    next_before = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_before = _encode_cursor(messages[-1]["timestamp"], messages[-1]["_id"])
+
     history_list = []
-    async for message in history_cursor:
+    for message in reversed(messages):  # oldest first for display
         history_list.append({
             "id": str(message["_id"]),
             "role": message["role"],
@@ -296,7 +690,7 @@ async def get_chat_history(conversation_id: str, user: dict = Depends(get_curren
             "timestamp": message["timestamp"].isoformat()
         })
         
-    return {"history": history_list}
+    return {"history": history_list, "next_before": next_before}
 
 
 # --- Chat Models ---
@@ -323,55 +717,112 @@ class TaskResult(BaseModel):
     error: Optional[str] = None
 
 
-# --- Async task queue (in-memory, ephemeral) ---
+# --- Async task queue ---
 # This avoids holding the HTTP request open while upstream may take a long time.
-_tasks: Dict[str, Dict] = {}
-_tasks_lock = asyncio.Lock()
+# TASK_BACKEND=memory (default) keeps tasks in this process, bounded: finished tasks are evicted
+# after TASK_RESULT_TTL_SECONDS or when MAX_TASKS is reached. TASK_BACKEND=mongo queues them in
+# the `tasks` collection so any worker can run them and any worker can answer /chat/result.
+TASK_BACKEND = os.getenv("TASK_BACKEND", "memory").lower()
+TASK_WORKER_CONCURRENCY = int(os.getenv("TASK_WORKER_CONCURRENCY", "8"))
+TASK_RESULT_TTL_SECONDS = float(os.getenv("TASK_RESULT_TTL_SECONDS", "900"))
+
+if TASK_BACKEND == "mongo":
+    _tasks = MongoTaskBackend(
+        db["tasks"],
+        concurrency=TASK_WORKER_CONCURRENCY,
+        lease_seconds=float(os.getenv("TASK_LEASE_SECONDS", "60")),
+        result_ttl=TASK_RESULT_TTL_SECONDS,
+    )
+else:
+    _tasks = MemoryTaskBackend(
+        TaskStore(max_tasks=int(os.getenv("MAX_TASKS", "10000")), finished_ttl=TASK_RESULT_TTL_SECONDS),
+        concurrency=TASK_WORKER_CONCURRENCY,
+    )
 
 
-# === REPLACE your old _run_langflow_task WITH THIS NEW VERSION ===
-async def _run_langflow_task(
-    task_id: str, 
-    message: str, 
-    user_id: Optional[str], 
-    langflow_token: Optional[str],
-    conversation_id: str  # <-- ADDED PARAMETER
-):
-    """Runs the Langflow query and saves the AI response to the DB."""
+# Upper bound on earlier messages read per run; the token budget usually trims further
+LANGFLOW_CONTEXT_MAX_MESSAGES = int(os.getenv("LANGFLOW_CONTEXT_MAX_MESSAGES", "100"))
+
+
+async def load_conversation_context(conversation_id: str, message: str) -> Optional[list]:
+    """Earlier messages of the conversation that are in its Langflow session's memory, newest
+    first, for trimming that memory to the token budget. None (no trimming) if they can't be read."""
     try:
-        # 1. Get the result from the agent
-        result = await process_travel_query(message=message, user_id=user_id, langflow_token=langflow_token) 
+        history = await message_store.history(conversation_id, None, LANGFLOW_CONTEXT_MAX_MESSAGES + 1)
+    except Exception as e:
+        logger.error("Failed to load conversation context: %s", e)
+        return None
+    # The message being answered is already stored; Langflow gets it as the input instead
+    if history and history[0].get("role") == "user" and history[0].get("content") == message:
+        history = history[1:]
+    history = history[:LANGFLOW_CONTEXT_MAX_MESSAGES]
+    # Langflow only remembers the turns its agent answered. Router replies, cached answers and
+    # failed runs never reached it, so they must not count towards the n_messages it reads back.
+    return [
+        message for newer, message in zip([None] + history, history)
+        if message.get("via_agent")
+        or (message.get("role") == "user" and newer is not None and newer.get("via_agent"))
+    ]
+
+
+async def _run_langflow_task(task_id: str, payload: dict) -> str:
+    """Runs the Langflow query for a queued chat task, saves the AI response to the DB and
+    returns it. The task backend records the result (or the raised error) for the task."""
+    message = payload["message"]
+    user_id = payload.get("user_id")
+    conversation_id = payload["conversation_id"]
+    # The Langflow token is read from the environment rather than stored in the task payload
+    langflow_token = os.getenv("LANGFLOW_APPLICATION_TOKEN")
+
+    async def relay_token(chunk: str):
+        _tasks.append_partial(task_id, chunk)
+
+    agent_ran = False
+
+    def mark_agent_run():
+        nonlocal agent_ran
+        agent_ran = True
+
+    # Continue the trace of the /chat/async request that queued this task
+    with span("task.run", parent=payload.get("trace"), task_id=task_id, conversation_id=conversation_id):
+        # A new conversation has no earlier turns to read
+        history = [] if payload.get("cacheable") else await load_conversation_context(conversation_id, message)
+
+        # 1. Get the result from the agent (tokens are relayed to stream subscribers as they arrive)
+        result = await process_travel_query(
+            message=message,
+            user_id=user_id,
+            langflow_token=langflow_token,
+            on_token=relay_token,
+            use_cache=payload.get("cacheable", False),
+            # One agent memory per conversation, not one per user across all their chats
+            session_id=conversation_id,
+            history=history,
+            on_agent_run=mark_agent_run,
+        )
 
-        # 2. Save the AI's response to the correct conversation in the DB
+        # 2. Save the AI's response to the correct conversation in the DB, together with the
+        #    "last_modified" bump. Awaiting the flush means the message is stored before the task
+        #    is reported done; if it can't be stored, the task fails instead.
+        now = datetime.now(timezone.utc)
+        ai_message_doc = {
+            "user_email": user_id,  # The email, or None for an anonymous conversation
+            "conversation_id": conversation_id,
+            "role": "ai",
+            "content": result,
+            "timestamp": now
+        }
+        if agent_ran:
+            # This turn is in the Langflow session's memory; see load_conversation_context
+            ai_message_doc["via_agent"] = True
         try:
-            if user_id:  # user_id is the user's email
-                ai_message_doc = {
-                    "user_email": user_id,
-                    "conversation_id": conversation_id, # <-- ADD THIS FIELD
-                    "role": "ai",
-                    "content": result,
-                    "timestamp": datetime.now(timezone.utc)
-                }
-                await db["messages"].insert_one(ai_message_doc)
-            
-            # Also update the "last_modified" time for this conversation
-            await db["conversations"].update_one(
-                {"_id": conversation_id},
-                {"$set": {"last_modified": datetime.now(timezone.utc)}}
-            )
-
+            with span("task.persist_ai_message"):
+                await message_writer.write(ai_message_doc, touch_conversation(conversation_id, now))
         except Exception as e:
-            print(f"[ERROR] Failed to save AI message to DB: {e}")
-
-        # 3. Mark the polling task as "done"
-        async with _tasks_lock: 
-            _tasks[task_id]["status"] = "done" 
-            _tasks[task_id]["result"] = result 
+            logger.error("Failed to save AI message to DB: %s", e)
+            raise RuntimeError("The reply could not be saved. Please try again.") from e
 
-    except Exception as e: 
-        async with _tasks_lock: 
-            _tasks[task_id]["status"] = "error" 
-            _tasks[task_id]["error"] = str(e)
+    return result
 
 
 # === REPLACE your old /chat/async function (lines 335-467) WITH THIS NEW VERSION ===
@@ -397,7 +848,7 @@ async def chat_with_ai_async(request: ChatRequest, token: Optional[str] = Depend
     if token:
         # A token was provided. It MUST be a valid user JWT.
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            payload = decode_user_token(token)
             user_email = payload.get("sub") or payload.get("email")
             if user_email is None:
                 # Token is valid but doesn't contain the user email in 'sub'
@@ -416,7 +867,7 @@ async def chat_with_ai_async(request: ChatRequest, token: Optional[str] = Depend
     if env_langflow_token:
         langflow_api_token = env_langflow_token
     else:
-        print("[ERROR] LANGFLOW_APPLICATION_TOKEN is not set in .env file!")
+        logger.error("LANGFLOW_APPLICATION_TOKEN is not set in .env file!")
         # This is a critical server misconfiguration.
         raise HTTPException(status_code=500, detail="Chat service is not configured.")
 
@@ -428,12 +879,29 @@ async def chat_with_ai_async(request: ChatRequest, token: Optional[str] = Depend
              raise HTTPException(status_code=401, detail="Authentication required to chat.")
         else:
             # Anonymous chat is allowed. We proceed with user_email = None
-             print("[DEBUG] No token provided. Proceeding with anonymous chat.")
+             logger.debug("No token provided. Proceeding with anonymous chat.")
+
+    # Admission control: fail fast while the Langflow queue is full instead of piling up tasks.
+    # Queued tasks only reach the controller once a task worker picks them up, so they count too.
+    admission = get_admission_controller()
+    backlog = await _tasks.backlog()
+    if not admission.has_capacity(backlog):
+        raise HTTPException(
+            status_code=503,
+            detail="The travel assistant is busy right now. Please try again shortly.",
+            headers={"Retry-After": str(admission.retry_after(backlog))},
+        )
 
     # --- From this point on, the logic is the same ---
 
     now = datetime.now(timezone.utc)
     convo_id = request.conversation_id
+    if convo_id:
+        # The id comes from the client and becomes the Langflow session, so it must be one of
+        # the caller's own conversations (an anonymous caller can only reach anonymous ones)
+        convo = await db["conversations"].find_one({"_id": convo_id, "user_email": user_email}, {"_id": 1})
+        if not convo:
+            raise HTTPException(status_code=404, detail="Conversation not found or access denied")
     simple_greetings = ["hi", "hello", "hey", "yo", "good morning", "good afternoon", "howdy"]
 
     try:
@@ -453,25 +921,19 @@ async def chat_with_ai_async(request: ChatRequest, token: Optional[str] = Depend
                 "created_at": now,
                 "last_modified": now
             }
-            await db["conversations"].insert_one(new_convo_doc)
+            convo_op = InsertOne(new_convo_doc)
         
         else:
             # === THIS IS AN EXISTING CHAT ===
-            convo = await db["conversations"].find_one({"_id": convo_id})
+            # The title is only replaced if it is still "New Chat"; that check happens inside
+            # the update itself, so there is no separate read
             new_title = None
-            
-            if convo and convo.get("title") == "New Chat":
-                prompt_message = request.message.lower().strip(" .!?")
-                if prompt_message not in simple_greetings and len(prompt_message) > 10:
-                    new_title = request.message[:50] + ("..." if len(request.message) > 50 else "")
-
-            update_query = {"$set": {"last_modified": now}}
-            if new_title:
-                update_query["$set"]["title"] = new_title
-
-            await db["conversations"].update_one({"_id": convo_id}, update_query)
+            prompt_message = request.message.lower().strip(" .!?")
+            if prompt_message not in simple_greetings and len(prompt_message) > 10:
+                new_title = request.message[:50] + ("..." if len(request.message) > 50 else "")
+            convo_op = touch_conversation(convo_id, now, new_title)
         
-        # Save the user message (whether anonymous or not)
+        # Save the user message (whether anonymous or not) in the same flush as the conversation write
         message_doc_to_save = {
             "user_email": user_email,
             "conversation_id": convo_id,
@@ -479,82 +941,266 @@ async def chat_with_ai_async(request: ChatRequest, token: Optional[str] = Depend
             "content": request.message,
             "timestamp": now
         }
-        await db["messages"].insert_one(message_doc_to_save)
+        with span("chat.persist_user_message"):
+            await message_writer.write(message_doc_to_save, convo_op)
 
     except Exception as e:
-        print(f"[ERROR] Failed to save message/convo to DB: {e}")
+        logger.error("Failed to save message/convo to DB: %s", e)
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
 
-    # Now, create and schedule the background task
-    task_id = str(uuid.uuid4())
-    async with _tasks_lock:
-        _tasks[task_id] = {"status": "pending", "result": None, "error": None}
+    # Now, queue the background task
+    try:
+        task_id = await _tasks.enqueue({
+            "message": request.message,
+            "user_id": user_email,  # The email (or None) for the task runner
+            "conversation_id": convo_id,
+            # Only the first message of a conversation has no prior context, so only it may be
+            # answered from the response cache
+            "cacheable": request.conversation_id is None,
+            "trace": current_trace_context(),
+        })
+    except TaskStoreFull:
+        raise HTTPException(status_code=503, detail="Too many chat requests in progress. Please try again shortly.")
 
-    asyncio.create_task(_run_langflow_task(
-        task_id=task_id, 
-        message=request.message, 
-        user_id=user_email, # Pass the email (or None) to the task runner
-        langflow_token=langflow_api_token,
-        conversation_id=convo_id
-    ))
+    request_span = current_span()
+    if request_span is not None:
+        request_span.set(task_id=task_id, conversation_id=convo_id)
 
     return TaskCreated(task_id=task_id, conversation_id=convo_id)
 
 @app.get("/chat/result/{task_id}", response_model=TaskResult)
-async def get_task_result(task_id: str):
+async def get_task_result(task_id: str, wait: float = Query(0, ge=0, le=30)):
     """
     Returns the status of a background chat task.
-    Used by the frontend to poll for completion.
+    Used by the frontend to poll for completion. With `?wait=N` the request long-polls,
+    returning as soon as the task finishes or after N seconds.
     """
-    async with _tasks_lock:
-        if task_id not in _tasks:
-            raise HTTPException(status_code=404, detail="Task not found")
-        
-        task = _tasks[task_id]
-        return TaskResult(
-            task_id=task_id,
-            status=task["status"],
-            result=task.get("result"),
-            error=task.get("error")
-        )
-    
+    task = await _tasks.wait(task_id, timeout=wait) if wait else await _tasks.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return TaskResult(
+        task_id=task_id,
+        status=task.status,
+        result=task.result,
+        error=task.error
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/chat/stream/{task_id}")
+async def stream_task_result(task_id: str, request: Request):
+    """
+    Server-sent events for a background chat task. Emits `status` first, then `token`
+    chunks (when Langflow streaming is enabled) and finally a single `done` or `error` event.
+    Replaces polling /chat/result.
+    """
+    # For tasks running in this process, subscribing happens without yielding to the loop,
+    # so no event can slip in between reading state and subscribing
+    task, queue = await _tasks.subscribe(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    status, result, error, partial = task.status, task.result, task.error, task.partial
+
+    async def event_stream():
+        nonlocal status, result, error
+        try:
+            yield _sse("status", {"task_id": task_id, "status": status})
+            if queue is None:
+                # Running on another worker: no token relay, just wait for the outcome
+                while status == "pending":
+                    current = await _tasks.wait(task_id, timeout=15)
+                    if current is None:
+                        yield _sse("error", {"task_id": task_id, "status": "error", "error": "Task not found"})
+                        return
+                    status, result, error = current.status, current.result, current.error
+                    if status == "pending":
+                        if await request.is_disconnected():
+                            return
+                        yield ": keep-alive\n\n"
+                # Finished: send the final event straight away
+                if status == "done":
+                    yield _sse("done", {"task_id": task_id, "status": "done", "result": result})
+                else:
+                    yield _sse("error", {"task_id": task_id, "status": "error", "error": error})
+                return
+            if partial:
+                # Catch a late subscriber up on tokens that were relayed before it connected
+                yield _sse("token", {"chunk": partial})
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event, data)
+                if event in ("done", "error"):
+                    return
+        finally:
+            if queue is not None:
+                _tasks.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/chat/cache/stats")
+async def chat_cache_stats(_: dict = Depends(require_admin)):
+    """Hit/miss counters for the travel-query response cache (empty when it is disabled)."""
+    cache = get_response_cache()
+    return cache.snapshot() if cache is not None else {"enabled": False}
+
+
+@app.get("/chat/persistence/stats")
+async def chat_persistence_stats(_: dict = Depends(require_admin)):
+    """Write-coalescing counters: writes accepted vs. flushes and database round trips issued."""
+    return message_writer.snapshot()
+
+
+@app.get("/auth/cache/stats")
+async def auth_cache_stats(_: dict = Depends(require_admin)):
+    """Hit/miss counters of the verified-token cache."""
+    return token_verifier.snapshot()
+
+
+# --- Metrics ---
+gauge(
+    "wanderpal_chat_tasks",
+    "Chat tasks known to this process, by status.",
+    ("status",),
+    callback=lambda: {(status,): count for status, count in _tasks.counts().items()},
+)
+gauge(
+    "wanderpal_chat_tasks_active",
+    "Chat task handlers currently executing in this process.",
+    callback=lambda: {(): _tasks.active()},
+)
+gauge(
+    "wanderpal_langflow_admission",
+    "Langflow admission control: concurrency limit, calls in flight and calls waiting.",
+    ("kind",),
+    callback=lambda: {
+        ("limit",): get_admission_controller().current_limit,
+        ("in_flight",): get_admission_controller().in_flight,
+        ("waiting",): get_admission_controller().waiting,
+    },
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of request, upstream, MongoDB and task-queue metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/traces/slowest")
+async def slowest_traces(limit: int = Query(10, ge=1, le=100), _: dict = Depends(require_admin)):
+    """The slowest recent traces (request plus the background task it queued), with their spans."""
+    return get_tracer().slowest(limit)
+
+
+@app.get("/debug/loop")
+async def event_loop_stats(_: dict = Depends(require_admin)):
+    """Event-loop scheduling delay percentiles and the stacks captured during recent stalls."""
+    return loop_monitor.snapshot()
+
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(5, gt=0),
+    loop_only: bool = False,
+    _: dict = Depends(require_admin),
+):
+    """
+    Samples this worker's thread stacks for `seconds` and returns them as collapsed stacks
+    (one "frame;frame;... count" line each), ready for flamegraph.pl or speedscope.
+    With `loop_only=true` only the event-loop thread is sampled.
+    """
+    try:
+        collapsed = await profiler.profile(min(seconds, PROFILE_MAX_SECONDS), loop_only=loop_only)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running on this worker.")
+    return PlainTextResponse(collapsed, headers={"Content-Disposition": 'attachment; filename="profile.folded"'})
+
+
+@app.get("/chat/upstream/stats")
+async def chat_upstream_stats(_: dict = Depends(require_admin)):
+    """Circuit breaker state and hedged-request counters per Langflow endpoint."""
+    return get_upstream_stats()
+
+
 @app.get("/conversations")
-async def get_all_conversations(user: dict = Depends(get_current_user)):
+async def get_all_conversations(
+    before: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user: dict = Depends(get_current_user),
+):
     """
-    Fetches the list of all conversations for the sidebar for the authenticated user.
+    Fetches the list of conversations for the sidebar for the authenticated user, most
+    recent first. Pass the returned `next_before` as `?before=` to load the next page.
     """
     user_email = user.get("sub")
     if not user_email:
         raise HTTPException(status_code=403, detail="Invalid user token")
 
-    # Find all conversations for this user, sort by the last modified (most recent first)
+    query = {"user_email": user_email}
+    if before:
+        query.update(_before_filter("last_modified", before))
+    # Sort by the last modified (most recent first), with _id as a tiebreaker for stable pages
     convo_cursor = db["conversations"].find(
-        {"user_email": user_email}
-    ).sort("last_modified", -1)  # -1 = descending order
+        query, {"title": 1, "created_at": 1, "last_modified": 1}
+    ).sort([("last_modified", DESCENDING), ("_id", DESCENDING)]).limit(limit + 1)
+    convos = await convo_cursor.to_list(length=limit + 1)
+
+    next_before = None
+    if len(convos) > limit:
+        convos = convos[:limit]
+        next_before = _encode_cursor(convos[-1]["last_modified"], convos[-1]["_id"])
 
     convo_list = []
-    async for convo in convo_cursor:
+    for convo in convos:
         convo_list.append({
             "id": str(convo["_id"]),
             "title": convo.get("title", "New Chat"),
             "created_at": convo.get("created_at")
         })
         
-    return {"conversations": convo_list}
+    return {"conversations": convo_list, "next_before": next_before}
 
 
 # --- Langflow integration ---
-async def process_travel_query(message: str, user_id: Optional[str] = None, langflow_token: Optional[str] = None) -> str:
+async def process_travel_query(
+    message: str,
+    user_id: Optional[str] = None,
+    langflow_token: Optional[str] = None,
+    on_token=None,
+    use_cache: bool = False,
+    session_id: Optional[str] = None,
+    history: Optional[list] = None,
+    on_agent_run=None,
+) -> str:
     """Process travel query using Langflow client - delegates to langflow.py for proper handling"""
     # Import the function from langflow.py which has proper error handling and retry logic
     from langflow import process_travel_query as langflow_process_query
     
     try:
-        result = await langflow_process_query(message=message, user_id=user_id, langflow_token=langflow_token)
+        result = await langflow_process_query(
+            message=message, user_id=user_id, langflow_token=langflow_token, on_token=on_token,
+            use_cache=use_cache, session_id=session_id, history=history, on_agent_run=on_agent_run,
+        )
         return result
+    except LangflowOverloaded:
+        raise
     except Exception as e:
-        print(f"[ERROR] Langflow processing failed: {str(e)}")
+        logger.error("Langflow processing failed: %s", e)
         return f"I'm sorry, I'm having trouble processing your request right now. Error: {str(e)}"
 
 @app.post("/chat", response_model=ChatResponse)
@@ -567,7 +1213,7 @@ async def chat_with_ai(request: ChatRequest, token: Optional[str] = Depends(pars
     if token:
         try:
             # Try to decode as JWT first
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            payload = decode_user_token(token)
             user_email = payload.get("sub") or payload.get("email")
         except JWTError:
             # If JWT decode fails, check if it's a Langflow API token
@@ -575,7 +1221,7 @@ async def chat_with_ai(request: ChatRequest, token: Optional[str] = Depends(pars
             if raw.startswith("AstraCS:") or raw.lower().startswith("astracs:"):
                 langflow_api_token = raw
             else:
-                print("[DEBUG] Token failed JWT decode and is not an Astra token; using configured application token for Langflow")
+                logger.debug("Token failed JWT decode and is not an Astra token; using configured application token for Langflow")
     elif not ALLOW_ANONYMOUS_CHAT:
         raise HTTPException(status_code=401, detail="Authentication required")
     
@@ -593,7 +1239,13 @@ async def chat_with_ai(request: ChatRequest, token: Optional[str] = Depends(pars
         )
         
         return ChatResponse(response=response_text, user_id=request.user_id or user_email)
-        
+
+    except LangflowOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail="The travel assistant is busy right now. Please try again shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
-        print(f"[ERROR] Chat processing error: {str(e)}")
+        logger.error("Chat processing error: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to process chat message: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,127 @@
+from datetime import datetime
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+# (timestamp, message _id) of the last message on the previous page
+HistoryCursor = Tuple[datetime, ObjectId]
+
+_HISTORY_FIELDS = ("_id", "role", "content", "timestamp", "via_agent")
+
+
+class MessageStore:
+    """
+    Where chat messages are persisted and read back from.
+
+    Messages handed to `insert_many` are plain dicts (user_email, conversation_id, role,
+    content, timestamp, and via_agent on agent replies); `history` returns them newest first,
+    each with an `_id`.
+    """
+
+    async def ensure_indexes(self) -> None:
+        raise NotImplementedError
+
+    async def insert_many(self, messages: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    async def history(
+        self, conversation_id: str, before: Optional[HistoryCursor], limit: int
+    ) -> List[Dict[str, Any]]:
+        """Up to `limit` messages of a conversation older than `before`, newest first."""
+        raise NotImplementedError
+
+
+class DocumentMessageStore(MessageStore):
+    """One document per message in the `messages` collection (the original layout)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index(
+            [("conversation_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)]
+        )
+
+    async def insert_many(self, messages: List[Dict[str, Any]]) -> None:
+        await self.collection.insert_many(messages, ordered=False)
+
+    async def history(
+        self, conversation_id: str, before: Optional[HistoryCursor], limit: int
+    ) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"conversation_id": conversation_id}
+        if before:
+            timestamp, message_id = before
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": message_id}},
+            ]
+        cursor = self.collection.find(query, {field: 1 for field in _HISTORY_FIELDS}).sort(
+            [("timestamp", DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit)
+        return await cursor.to_list(length=limit)
+
+
+class BucketMessageStore(MessageStore):
+    """
+    Bucket pattern: each conversation's messages are appended with $push into bucket
+    documents of at most about `bucket_size` messages in the `message_buckets` collection.
+
+    Bucket shape: {conversation_id, count, first_ts, last_ts, messages: [...]}. Recent history
+    is read from the newest one or two buckets instead of one document per message.
+    """
+
+    def __init__(self, collection, bucket_size: int = 100):
+        self.collection = collection
+        self.bucket_size = bucket_size
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("conversation_id", ASCENDING), ("first_ts", DESCENDING)])
+        # Lets the append find the open (not yet full) bucket without scanning full ones
+        await self.collection.create_index([("conversation_id", ASCENDING), ("count", ASCENDING)])
+
+    def bucket_ops(self, messages: List[Dict[str, Any]]) -> List[UpdateOne]:
+        """One $push per conversation, appending to its open bucket or creating one."""
+        ops = []
+        keyed = sorted(messages, key=lambda m: (m["conversation_id"], m["timestamp"]))
+        for conversation_id, group in groupby(keyed, key=lambda m: m["conversation_id"]):
+            entries = []
+            for message in group:
+                message.setdefault("_id", ObjectId())
+                entries.append({k: v for k, v in message.items() if k != "conversation_id"})
+            ops.append(UpdateOne(
+                {"conversation_id": conversation_id, "count": {"$lt": self.bucket_size}},
+                {
+                    "$push": {"messages": {"$each": entries}},
+                    "$inc": {"count": len(entries)},
+                    "$min": {"first_ts": entries[0]["timestamp"]},
+                    "$max": {"last_ts": entries[-1]["timestamp"]},
+                },
+                upsert=True,
+            ))
+        return ops
+
+    async def insert_many(self, messages: List[Dict[str, Any]]) -> None:
+        await self.collection.bulk_write(self.bucket_ops(messages), ordered=False)
+
+    async def history(
+        self, conversation_id: str, before: Optional[HistoryCursor], limit: int
+    ) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"conversation_id": conversation_id}
+        if before:
+            query["first_ts"] = {"$lte": before[0]}
+        cursor = self.collection.find(query, {"messages": 1, "last_ts": 1}).sort("first_ts", DESCENDING)
+        cursor = cursor.batch_size(2)
+        collected: List[Dict[str, Any]] = []
+        async for bucket in cursor:
+            # Buckets fill in time order: once a full page is collected, a bucket whose newest
+            # message is older than the page's oldest can't contribute, nor can older buckets
+            if len(collected) >= limit and bucket["last_ts"] < collected[-1]["timestamp"]:
+                break
+            for message in bucket.get("messages", []):
+                if before is None or (message["timestamp"], message["_id"]) < before:
+                    collected.append({field: message.get(field) for field in _HISTORY_FIELDS})
+            collected.sort(key=lambda m: (m["timestamp"], m["_id"]), reverse=True)
+            del collected[limit:]
+        return collected
@@ -0,0 +1,107 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+from pymongo import UpdateOne
+
+from log_config import get_logger
+from message_store import MessageStore
+
+logger = get_logger("message_writer")
+
+
+class MessageWriter:
+    """
+    Coalesces chat persistence writes into bulk flushes.
+
+    Callers hand over a message document and/or a conversation write (a pymongo bulk op such
+    as InsertOne/UpdateOne) and await `write()`. Writes from concurrent requests are buffered
+    and flushed together, as one batched write to the MessageStore and one `bulk_write` on
+    conversations issued in parallel, when `max_batch` writes are buffered or `flush_interval`
+    seconds after the first one arrived. `write()` returns only once its flush has been
+    acknowledged by MongoDB, and raises if that flush failed (every write in a failed flush
+    gets the error, since unordered bulk errors aren't mapped back to individual callers).
+    """
+
+    def __init__(self, store: MessageStore, conversations, max_batch: int = 100, flush_interval: float = 0.005):
+        self.store = store
+        self.conversations = conversations
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._message_docs: List[Dict[str, Any]] = []
+        self._conversation_ops: List[Any] = []
+        self._waiters: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Task] = set()
+        self.stats: Dict[str, int] = {"writes": 0, "flushes": 0, "db_ops": 0, "errors": 0}
+
+    async def write(self, message: Optional[Dict[str, Any]] = None, conversation_op=None) -> None:
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        if message is not None:
+            self._message_docs.append(message)
+        if conversation_op is not None:
+            self._conversation_ops.append(conversation_op)
+        self._waiters.append(waiter)
+        self.stats["writes"] += 1
+        if len(self._waiters) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._flush_now)
+        # Shielded so a caller that goes away doesn't cancel the shared flush result
+        await asyncio.shield(waiter)
+
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._waiters:
+            return
+        batch = (self._message_docs, self._conversation_ops, self._waiters)
+        self._message_docs, self._conversation_ops, self._waiters = [], [], []
+        task = asyncio.create_task(self._flush(*batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, message_docs, conversation_ops, waiters) -> None:
+        ops = []
+        if message_docs:
+            ops.append(self.store.insert_many(message_docs))
+        if conversation_ops:
+            ops.append(self.conversations.bulk_write(conversation_ops, ordered=False))
+        self.stats["flushes"] += 1
+        self.stats["db_ops"] += len(ops)
+        try:
+            await asyncio.gather(*ops)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error("Message flush of %d writes failed: %s", len(waiters), e)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def close(self) -> None:
+        """Flush anything still buffered and wait for in-flight flushes to finish."""
+        self._flush_now()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "buffered": len(self._waiters)}
+
+
+def touch_conversation(conversation_id: str, now, title: Optional[str] = None) -> UpdateOne:
+    """
+    Bump a conversation's last_modified. If `title` is given it replaces the title only while
+    the conversation is still called "New Chat", decided server-side by a pipeline update so
+    no read is needed first.
+    """
+    if title is None:
+        return UpdateOne({"_id": conversation_id}, {"$set": {"last_modified": now}})
+    return UpdateOne({"_id": conversation_id}, [{"$set": {
+        "last_modified": now,
+        "title": {"$cond": [{"$eq": ["$title", "New Chat"]}, {"$literal": title}, "$title"]},
+    }}])
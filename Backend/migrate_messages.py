@@ -0,0 +1,183 @@
+"""
+Offline tools for the bucketed message layout (MESSAGE_STORAGE=buckets).
+
+    python migrate_messages.py migrate [--bucket-size 100] [--drop-target]
+        Copy every document in `messages` into bucket documents in `message_buckets`.
+        Run it with the app stopped (or still on MESSAGE_STORAGE=documents), then switch
+        MESSAGE_STORAGE to buckets. The `messages` collection is left untouched.
+
+    python migrate_messages.py benchmark [--messages 1000000] [--conversations 10000]
+        Generate the same synthetic dataset in both layouts (in scratch `bench_*`
+        collections), time recent-history reads through each store and print latency and
+        storage figures. The scratch collections are dropped afterwards unless --keep is given.
+
+Uses MONGODB_URL and DB_NAME from the environment / .env, like the app.
+"""
+import argparse
+import asyncio
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Any, Dict, List
+
+import motor.motor_asyncio
+from bson import ObjectId
+from dotenv import load_dotenv
+
+from message_store import BucketMessageStore, DocumentMessageStore
+
+
+def _bucket_doc(conversation_id: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "conversation_id": conversation_id,
+        "count": len(messages),
+        "first_ts": messages[0]["timestamp"],
+        "last_ts": messages[-1]["timestamp"],
+        "messages": [{k: v for k, v in m.items() if k != "conversation_id"} for m in messages],
+    }
+
+
+async def _write_buckets(source, target, bucket_size: int, batch_size: int) -> int:
+    """Stream `source` in (conversation, time) order and insert full bucket documents."""
+    cursor = source.find({}).sort([("conversation_id", 1), ("timestamp", 1), ("_id", 1)])
+    cursor = cursor.batch_size(batch_size)
+    pending: List[Dict[str, Any]] = []
+    current_id, current = None, []
+    written = 0
+
+    async def flush_pending():
+        nonlocal written
+        if pending:
+            await target.insert_many(pending, ordered=False)
+            written += len(pending)
+            pending.clear()
+
+    async for message in cursor:
+        conversation_id = message.get("conversation_id")
+        if conversation_id != current_id or len(current) >= bucket_size:
+            if current:
+                pending.append(_bucket_doc(current_id, current))
+            current_id, current = conversation_id, []
+        current.append(message)
+        if len(pending) * bucket_size >= batch_size:
+            await flush_pending()
+    if current:
+        pending.append(_bucket_doc(current_id, current))
+    await flush_pending()
+    return written
+
+
+async def migrate(db, bucket_size: int, batch_size: int, drop_target: bool) -> None:
+    source, target = db["messages"], db["message_buckets"]
+    if drop_target:
+        await target.drop()
+    elif await target.estimated_document_count():
+        raise SystemExit("message_buckets is not empty; pass --drop-target to rebuild it")
+
+    total = await source.estimated_document_count()
+    print(f"Migrating ~{total} messages into buckets of {bucket_size}")
+    started = perf_counter()
+    buckets = await _write_buckets(source, target, bucket_size, batch_size)
+    await BucketMessageStore(target, bucket_size).ensure_indexes()
+    print(f"Wrote {buckets} buckets in {perf_counter() - started:.1f}s")
+
+
+async def _generate(collection, messages: int, conversations: int, batch_size: int) -> List[str]:
+    conversation_ids = [str(uuid.uuid4()) for _ in range(conversations)]
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    per_conversation = max(messages // conversations, 1)
+    batch: List[Dict[str, Any]] = []
+    for conversation_id in conversation_ids:
+        ts = start + timedelta(seconds=random.randint(0, 86400))
+        for i in range(per_conversation):
+            ts += timedelta(seconds=random.randint(5, 120))
+            batch.append({
+                "_id": ObjectId(),
+                "user_email": "bench@example.com",
+                "conversation_id": conversation_id,
+                "role": "user" if i % 2 == 0 else "ai",
+                "content": "Plan a 3 day trip to Jaipur with a mid-range budget. " * random.randint(1, 6),
+                "timestamp": ts,
+            })
+            if len(batch) >= batch_size:
+                await collection.insert_many(batch, ordered=False)
+                batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+    return conversation_ids
+
+
+async def _time_reads(store, conversation_ids: List[str], reads: int, limit: int) -> List[float]:
+    timings = []
+    for _ in range(reads):
+        conversation_id = random.choice(conversation_ids)
+        started = perf_counter()
+        await store.history(conversation_id, None, limit)
+        timings.append((perf_counter() - started) * 1000)
+    timings.sort()
+    return timings
+
+
+async def benchmark(db, messages: int, conversations: int, reads: int, limit: int,
+                    bucket_size: int, batch_size: int, keep: bool) -> None:
+    documents, buckets = db["bench_messages"], db["bench_message_buckets"]
+    await documents.drop()
+    await buckets.drop()
+    try:
+        print(f"Generating {messages} messages across {conversations} conversations")
+        document_store = DocumentMessageStore(documents)
+        await document_store.ensure_indexes()
+        conversation_ids = await _generate(documents, messages, conversations, batch_size)
+        await _write_buckets(documents, buckets, bucket_size, batch_size)
+        bucket_store = BucketMessageStore(buckets, bucket_size)
+        await bucket_store.ensure_indexes()
+
+        for name, store, collection in (("documents", document_store, documents), ("buckets", bucket_store, buckets)):
+            timings = await _time_reads(store, conversation_ids, reads, limit)
+            stats = await db.command("collStats", collection.name)
+            print(
+                f"{name:>9}: p50={timings[len(timings) // 2]:.2f}ms "
+                f"p95={timings[int(len(timings) * 0.95)]:.2f}ms "
+                f"docs={stats['count']} data={stats['size'] / 2**20:.1f}MiB "
+                f"indexes={stats['totalIndexSize'] / 2**20:.1f}MiB"
+            )
+    finally:
+        if not keep:
+            await documents.drop()
+            await buckets.drop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = sub.add_parser("migrate", help="copy messages into bucket documents")
+    migrate_parser.add_argument("--drop-target", action="store_true", help="rebuild message_buckets from scratch")
+
+    bench_parser = sub.add_parser("benchmark", help="compare both layouts on generated data")
+    bench_parser.add_argument("--messages", type=int, default=1_000_000)
+    bench_parser.add_argument("--conversations", type=int, default=10_000)
+    bench_parser.add_argument("--reads", type=int, default=2_000)
+    bench_parser.add_argument("--limit", type=int, default=100, help="messages per history page")
+    bench_parser.add_argument("--keep", action="store_true", help="keep the bench_* collections")
+
+    for p in (migrate_parser, bench_parser):
+        p.add_argument("--bucket-size", type=int, default=int(os.getenv("MESSAGE_BUCKET_SIZE", "100")))
+        p.add_argument("--batch-size", type=int, default=5_000)
+
+    args = parser.parse_args()
+    load_dotenv()
+    db = motor.motor_asyncio.AsyncIOMotorClient(os.getenv("MONGODB_URL"))[os.getenv("DB_NAME")]
+    if args.command == "migrate":
+        asyncio.run(migrate(db, args.bucket_size, args.batch_size, args.drop_target))
+    else:
+        asyncio.run(benchmark(
+            db, args.messages, args.conversations, args.reads, args.limit,
+            args.bucket_size, args.batch_size, args.keep,
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password pool and its queue are full; carries a Retry-After hint."""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Password hashing pool is saturated")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Runs passlib hashing and verification on a dedicated thread pool so bcrypt's
+    100-300 ms of CPU never blocks the event loop (bcrypt releases the GIL while hashing).
+
+    At most `workers` hashes run at once and at most `max_queue` more may wait; beyond that
+    callers get PasswordHasherBusy straight away instead of queueing without bound.
+    """
+
+    def __init__(self, context: CryptContext, workers: int = 2, max_queue: int = 32):
+        self.context = context
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._pending = 0
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.workers + self.max_queue:
+            raise PasswordHasherBusy()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Verify a password; if it matches but the stored hash is outdated (e.g. fewer rounds
+        than configured), also return a fresh hash to store."""
+        if not hashed:
+            return False, None
+        return await self._run(self.context.verify_and_update, password, hashed)
+
+    def snapshot(self) -> dict:
+        return {"workers": self.workers, "max_queue": self.max_queue, "pending": self._pending}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,153 @@
+import math
+import re
+from collections import Counter, OrderedDict
+from time import monotonic
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from ttl_cache import TTLCache
+
+_PUNCT = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize_query(message: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key."""
+    return _SPACES.sub(" ", _PUNCT.sub(" ", message.lower())).strip()
+
+
+# Filler words dropped before comparing, so "what is the best time to visit jaipur" and
+# "best time to visit jaipur please" land on the same vector.
+_FILLER_WORDS = frozenset(
+    "a an the please for me some what is are can you i any show find tell about of".split()
+)
+
+
+def _content_words(normalized: str) -> List[str]:
+    return [w for w in normalized.split() if w not in _FILLER_WORDS]
+
+
+def _features(words: List[str]) -> Counter:
+    """Character trigrams plus weighted word bigrams. The bigrams keep word order significant,
+    so "delhi to mumbai" and "mumbai to delhi" don't match."""
+    padded = f"  {' '.join(words)} "
+    features = Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+    for first, second in zip(words, words[1:]):
+        features[f"\x01{first} {second}"] += 2
+    return features
+
+
+def _inflection(a: str, b: str) -> bool:
+    """True for inflections of one word such as "hotel"/"hotels" or "day"/"days"."""
+    short, long = (a, b) if len(a) <= len(b) else (b, a)
+    return len(short) >= 3 and not short.isdigit() and long.startswith(short) and len(long) - len(short) <= 2
+
+
+def _same_words(a: FrozenSet[str], b: FrozenSet[str]) -> bool:
+    """Every content word of each query appears in the other, possibly inflected. A word with no
+    counterpart ("non", "without", "luxury") may change what is being asked, however high the
+    overall similarity."""
+    only_a, only_b = a - b, b - a
+    return (
+        all(any(_inflection(x, y) for y in only_b) for x in only_a)
+        and all(any(_inflection(y, x) for x in only_a) for y in only_b)
+    )
+
+
+def _cosine(a: Counter, a_norm: float, b: Counter, b_norm: float) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(count * b.get(gram, 0) for gram, count in a.items())
+    return dot / (a_norm * b_norm) if a_norm and b_norm else 0.0
+
+
+class ResponseCache:
+    """
+    Two-tier cache of agent answers for repeated travel queries.
+
+    Tier 1 matches the normalized query text exactly (per flow). Tier 2 (off unless `semantic`)
+    keeps a small trigram/bigram index and answers when cosine similarity clears
+    `similarity_threshold`; queries that mention different numbers (dates, budgets, party
+    sizes) or differ in any content word other than its inflection never match.
+    Both tiers expire entries after `ttl` seconds and evict least-recently-used entries.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600,
+        max_entries: int = 1024,
+        similarity_threshold: float = 0.9,
+        semantic: bool = False,
+        max_semantic_entries: int = 512,
+    ):
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.semantic = semantic
+        self.max_semantic_entries = max_semantic_entries
+        self._exact = TTLCache(max_entries=max_entries)
+        # key -> (expires_at, feature vector, vector norm, digits, content words, response)
+        self._index: "OrderedDict[str, Tuple[float, Counter, float, Tuple[str, ...], FrozenSet[str], str]]" = OrderedDict()
+        self.stats: Dict[str, int] = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(flow_key: str, normalized: str) -> str:
+        return f"{flow_key}\x00{normalized}"
+
+    def get(self, flow_key: str, message: str) -> Optional[str]:
+        normalized = normalize_query(message)
+        cached = self._exact.get(self._key(flow_key, normalized))
+        if cached is not None:
+            self.stats["exact_hits"] += 1
+            return cached
+        if self.semantic:
+            cached = self._similar(flow_key, normalized)
+            if cached is not None:
+                self.stats["similar_hits"] += 1
+                return cached
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, flow_key: str, message: str, response: str) -> None:
+        normalized = normalize_query(message)
+        key = self._key(flow_key, normalized)
+        self._exact.set(key, response, self.ttl)
+        if not self.semantic:
+            return
+        words = _content_words(normalized)
+        vector = _features(words)
+        norm = math.sqrt(sum(c * c for c in vector.values()))
+        self._index.pop(key, None)
+        self._index[key] = (
+            monotonic() + self.ttl, vector, norm, tuple(_DIGITS.findall(normalized)), frozenset(words), response,
+        )
+        while len(self._index) > self.max_semantic_entries:
+            self._index.popitem(last=False)
+
+    def _similar(self, flow_key: str, normalized: str) -> Optional[str]:
+        words = _content_words(normalized)
+        vector = _features(words)
+        norm = math.sqrt(sum(c * c for c in vector.values()))
+        digits = tuple(_DIGITS.findall(normalized))
+        word_set = frozenset(words)
+        prefix = f"{flow_key}\x00"
+        now = monotonic()
+        best_key, best_score = None, self.similarity_threshold
+        expired = []
+        for key, (expires_at, other, other_norm, other_digits, other_words, _) in self._index.items():
+            if expires_at <= now:
+                expired.append(key)
+                continue
+            if not key.startswith(prefix) or other_digits != digits or not _same_words(word_set, other_words):
+                continue
+            score = _cosine(vector, norm, other, other_norm)
+            if score >= best_score:
+                best_key, best_score = key, score
+        for key in expired:
+            del self._index[key]
+        if best_key is None:
+            return None
+        self._index.move_to_end(best_key)
+        return self._index[best_key][5]
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "exact_entries": len(self._exact), "similar_entries": len(self._index)}
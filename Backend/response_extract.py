@@ -0,0 +1,113 @@
+"""
+Pulling the answer text out of Langflow run responses.
+
+Agent flows return the answer alongside tool traces and intermediate steps, so a response
+can be megabytes of nested JSON. The known Langflow/Astra shapes are tried first as fixed
+key paths (a handful of dict lookups); only unrecognised shapes fall back to walking the
+tree, iteratively and within a depth and node budget.
+"""
+import json
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+# Where each known response shape keeps the final message text
+PathKey = Union[str, int]
+KNOWN_TEXT_PATHS: Tuple[Tuple[PathKey, ...], ...] = (
+    ("outputs", 0, "outputs", 0, "results", "message", "text"),
+    ("outputs", 0, "outputs", 0, "results", "message", "data", "text"),
+    ("outputs", 0, "outputs", 0, "outputs", "message", "message"),
+    ("outputs", 0, "outputs", 0, "artifacts", "message"),
+)
+
+MAX_WALK_DEPTH = 64
+MAX_WALK_NODES = 200_000
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """json.loads, through orjson when it is installed. Raises ValueError on invalid JSON."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter (NaN, integers beyond 64 bits); let json have the final say
+            pass
+    return json.loads(data)
+
+
+def follow(obj: Any, path: Sequence[PathKey]) -> Any:
+    """The value at `path` (dict keys and list indexes), or None if any step is missing."""
+    for key in path:
+        if isinstance(key, int):
+            if not isinstance(obj, list) or len(obj) <= key:
+                return None
+        elif not isinstance(obj, dict):
+            return None
+        obj = obj[key] if isinstance(key, int) else obj.get(key)
+        if obj is None:
+            return None
+    return obj
+
+
+def known_shape_text(response: Dict[str, Any]) -> Optional[str]:
+    for path in KNOWN_TEXT_PATHS:
+        value = follow(response, path)
+        if value and isinstance(value, (str, int, float)):
+            return str(value)
+    return None
+
+
+def collect_text(
+    response: Any, max_depth: int = MAX_WALK_DEPTH, max_nodes: int = MAX_WALK_NODES
+) -> List[str]:
+    """
+    Every `text` string and `results.message` text in the tree, in document order, stripped
+    and deduplicated. Walks with an explicit stack, so deep nesting can't hit the recursion
+    limit; stops descending below `max_depth` and stops altogether after `max_nodes`
+    containers.
+    """
+    found: List[str] = []
+    seen = set()
+
+    def add(value: Any) -> None:
+        text = str(value).strip()
+        if text and text not in seen:
+            seen.add(text)
+            found.append(text)
+
+    # One iterator per open container: the stack depth is the nesting depth, and children
+    # come out in document order without copying them onto the stack
+    stack: List[Iterator[Any]] = [iter((response,))]
+    visited = 0
+    while stack:
+        for obj in stack[-1]:
+            if obj.__class__ is dict:
+                results = obj.get("results")
+                if isinstance(results, dict):
+                    msg = results.get("message") or results.get("text")
+                    if isinstance(msg, dict):
+                        text_val = msg.get("text") or msg.get("content")
+                        if text_val:
+                            add(text_val)
+                    elif isinstance(msg, str):
+                        add(msg)
+                text = obj.get("text")
+                if isinstance(text, str):
+                    add(text)
+                children = obj.values()
+            elif obj.__class__ is list:
+                children = obj
+            else:
+                continue
+            visited += 1
+            if visited >= max_nodes:
+                return found
+            if len(stack) <= max_depth:
+                stack.append(iter(children))
+                break
+        else:
+            stack.pop()
+    return found
@@ -0,0 +1,318 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+
+from log_config import get_logger
+from task_store import TaskRecord, TaskStore
+
+logger = get_logger("task_queue")
+
+# handler(task_id, payload) -> result text. Raising marks the task as failed.
+TaskHandler = Callable[[str, Dict[str, Any]], Awaitable[str]]
+
+
+class TaskBackend:
+    """
+    Interface for where chat tasks are queued, executed and their results kept.
+
+    Task records returned to callers always use the public status values
+    pending | done | error, whatever the backend stores internally.
+    """
+
+    async def start(self, handler: TaskHandler) -> None:
+        raise NotImplementedError
+
+    async def stop(self) -> None:
+        raise NotImplementedError
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    async def get(self, task_id: str) -> Optional[TaskRecord]:
+        raise NotImplementedError
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None) -> Optional[TaskRecord]:
+        raise NotImplementedError
+
+    async def subscribe(self, task_id: str) -> Tuple[Optional[TaskRecord], Optional[asyncio.Queue]]:
+        """Return the task and an event queue if its events can be streamed from this process."""
+        raise NotImplementedError
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue) -> None:
+        raise NotImplementedError
+
+    def append_partial(self, task_id: str, chunk: str) -> None:
+        """Relay a token chunk from a task running in this process to its stream subscribers."""
+        raise NotImplementedError
+
+    def counts(self) -> Dict[str, int]:
+        """Task counts by status, as seen by this process."""
+        raise NotImplementedError
+
+    def active(self) -> int:
+        """Number of task handlers executing in this process right now."""
+        raise NotImplementedError
+
+    async def backlog(self) -> int:
+        """Number of accepted tasks still waiting for a handler to start them."""
+        raise NotImplementedError
+
+
+class MemoryTaskBackend(TaskBackend):
+    """Single-process backend: tasks live in a TaskStore and run as local asyncio tasks."""
+
+    def __init__(self, store: TaskStore, concurrency: int = 8):
+        self.store = store
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._handler: Optional[TaskHandler] = None
+        self._running: Set[asyncio.Task] = set()
+        self._active = 0
+
+    async def start(self, handler: TaskHandler) -> None:
+        self._handler = handler
+
+    async def stop(self) -> None:
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        if self._handler is None:
+            raise RuntimeError("Task backend has not been started")
+        task_id = self.store.create()
+        task = asyncio.create_task(self._execute(task_id, payload))
+        # Keep a reference so the task isn't garbage collected mid-flight
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task_id
+
+    async def _execute(self, task_id: str, payload: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            self._active += 1
+            try:
+                result = await self._handler(task_id, payload)
+                self.store.complete(task_id, result)
+            except Exception as e:
+                self.store.fail(task_id, str(e))
+            finally:
+                self._active -= 1
+
+    async def get(self, task_id: str) -> Optional[TaskRecord]:
+        return self.store.get(task_id)
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None) -> Optional[TaskRecord]:
+        return await self.store.wait(task_id, timeout)
+
+    async def subscribe(self, task_id: str) -> Tuple[Optional[TaskRecord], Optional[asyncio.Queue]]:
+        return self.store.subscribe(task_id)
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue) -> None:
+        self.store.unsubscribe(task_id, queue)
+
+    def append_partial(self, task_id: str, chunk: str) -> None:
+        self.store.append_partial(task_id, chunk)
+
+    def counts(self) -> Dict[str, int]:
+        return self.store.counts()
+
+    def active(self) -> int:
+        return self._active
+
+    async def backlog(self) -> int:
+        return self.store.pending - self._active
+
+
+def _record_from_doc(doc: Dict[str, Any]) -> TaskRecord:
+    record = TaskRecord()
+    status = doc.get("status")
+    record.status = status if status in ("done", "error") else "pending"
+    record.result = doc.get("result")
+    record.error = doc.get("error")
+    return record
+
+
+class MongoTaskBackend(TaskBackend):
+    """
+    Multi-worker backend on a MongoDB `tasks` collection.
+
+    Any worker can enqueue or look up a task. Workers claim queued tasks with
+    find_one_and_update and hold a lease that they renew while the task runs; if a worker
+    dies, the lease expires and another worker reclaims the task (up to `max_attempts`).
+    Tasks running in this process are mirrored in a local TaskStore so that waiters and
+    stream subscribers here are woken immediately and receive relayed tokens.
+    """
+
+    def __init__(
+        self,
+        collection,
+        concurrency: int = 8,
+        lease_seconds: float = 60,
+        poll_interval: float = 1.0,
+        max_attempts: int = 3,
+        result_ttl: float = 900,
+    ):
+        self.collection = collection
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.local = TaskStore(max_tasks=max(concurrency * 4, 100), finished_ttl=result_ttl)
+        self._handler: Optional[TaskHandler] = None
+        self._workers: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    async def start(self, handler: TaskHandler) -> None:
+        self._handler = handler
+        await self.collection.create_index([("status", 1), ("created_at", 1)])
+        await self.collection.create_index("finished_at", expireAfterSeconds=int(self.result_ttl))
+        self._stopping = False
+        for _ in range(self.concurrency):
+            self._workers.add(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        task_id = str(uuid.uuid4())
+        await self.collection.insert_one({
+            "_id": task_id,
+            "status": "queued",
+            "payload": payload,
+            "attempts": 0,
+            "created_at": datetime.now(timezone.utc),
+        })
+        self._wakeup.set()
+        return task_id
+
+    async def get(self, task_id: str) -> Optional[TaskRecord]:
+        local = self.local.get(task_id)
+        if local is not None:
+            return local
+        doc = await self.collection.find_one({"_id": task_id}, {"status": 1, "result": 1, "error": 1})
+        return _record_from_doc(doc) if doc else None
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None) -> Optional[TaskRecord]:
+        if self.local.get(task_id) is not None:
+            return await self.local.wait(task_id, timeout)
+        loop = asyncio.get_running_loop()
+        # No timeout waits until the task finishes, as MemoryTaskBackend.wait does
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            record = await self.get(task_id)
+            if record is None or record.finished or (deadline is not None and loop.time() >= deadline):
+                return record
+            delay = self.poll_interval if deadline is None else min(self.poll_interval, max(deadline - loop.time(), 0))
+            await asyncio.sleep(delay)
+
+    async def subscribe(self, task_id: str) -> Tuple[Optional[TaskRecord], Optional[asyncio.Queue]]:
+        if self.local.get(task_id) is not None:
+            return self.local.subscribe(task_id)
+        return await self.get(task_id), None
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue) -> None:
+        self.local.unsubscribe(task_id, queue)
+
+    def append_partial(self, task_id: str, chunk: str) -> None:
+        self.local.append_partial(task_id, chunk)
+
+    def counts(self) -> Dict[str, int]:
+        return self.local.counts()
+
+    def active(self) -> int:
+        return self.local.pending
+
+    async def backlog(self) -> int:
+        # The queue is shared, so this counts tasks waiting for any worker, not just this one
+        return await self.collection.count_documents({"status": "queued"})
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_expires": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_owner": self.worker_id,
+                    "lease_expires": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                doc = await self._claim()
+            except Exception as e:
+                logger.error("Task claim failed: %s", e)
+                doc = None
+            if doc is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._execute(doc)
+            except Exception as e:
+                logger.error("Task %s could not be recorded: %s", doc.get("_id"), e)
+
+    async def _renew_lease(self, task_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.collection.update_one(
+                    {"_id": task_id, "lease_owner": self.worker_id},
+                    {"$set": {"lease_expires": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}},
+                )
+            except Exception as e:
+                # The lease still has two renewal periods left: keep trying rather than let it
+                # lapse and have another worker run the task a second time
+                logger.error("Lease renewal for task %s failed: %s", task_id, e)
+
+    async def _finish(self, task_id: str, fields: Dict[str, Any]) -> None:
+        # Only the current lease holder may record the outcome
+        await self.collection.update_one(
+            {"_id": task_id, "lease_owner": self.worker_id},
+            {"$set": {**fields, "finished_at": datetime.now(timezone.utc), "lease_owner": None}},
+        )
+
+    async def _execute(self, doc: Dict[str, Any]) -> None:
+        task_id = doc["_id"]
+        if doc.get("attempts", 0) > self.max_attempts:
+            await self._finish(task_id, {"status": "error", "error": "Task abandoned after repeated worker failures"})
+            return
+        self.local.create(task_id)
+        renew = asyncio.create_task(self._renew_lease(task_id))
+        try:
+            result = await self._handler(task_id, doc.get("payload") or {})
+        except Exception as e:
+            renew.cancel()
+            await self._finish(task_id, {"status": "error", "error": str(e)})
+            self.local.fail(task_id, str(e))
+            return
+        finally:
+            # Also when the handler is cancelled at shutdown, so the renew loop doesn't outlive it
+            renew.cancel()
+        # Persist before waking local waiters so every worker sees the result first
+        await self._finish(task_id, {"status": "done", "result": result})
+        self.local.complete(task_id, result)
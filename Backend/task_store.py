@@ -0,0 +1,164 @@
+import asyncio
+import uuid
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+
+class TaskStoreFull(Exception):
+    """Raised when the store is at capacity and holds no finished task that can be evicted."""
+
+
+class TaskRecord:
+    __slots__ = ("status", "result", "error", "partial", "finished_at", "_event", "_subscribers")
+
+    def __init__(self):
+        self.status = "pending"  # pending | done | error
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.partial: Optional[str] = None
+        self.finished_at: Optional[float] = None
+        # Created lazily so idle tasks don't each carry an Event / list
+        self._event: Optional[asyncio.Event] = None
+        self._subscribers: Optional[List[asyncio.Queue]] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status != "pending"
+
+
+class TaskStore:
+    """
+    Bounded in-memory store for background chat tasks.
+
+    All mutations are synchronous (no awaits), so on a single event loop they are atomic and
+    reads need no lock. Finished tasks are evicted after `finished_ttl` seconds, or earlier
+    (oldest first) when the store reaches `max_tasks`. Waiters block on a per-task Event and
+    stream subscribers receive (event, data) tuples on their own queue.
+    """
+
+    def __init__(self, max_tasks: int = 10000, finished_ttl: float = 900):
+        self.max_tasks = max_tasks
+        self.finished_ttl = finished_ttl
+        self._tasks: Dict[str, TaskRecord] = {}
+        # Finished task ids in completion order, so TTL eviction only ever looks at the front
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._pending_count = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    @property
+    def pending(self) -> int:
+        return self._pending_count
+
+    def counts(self) -> Dict[str, int]:
+        done = sum(1 for tid in self._finished if self._tasks[tid].status == "done")
+        return {
+            "pending": self._pending_count,
+            "done": done,
+            "error": len(self._finished) - done,
+        }
+
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        task = self._tasks.get(task_id)
+        if task is not None and task.finished and monotonic() - task.finished_at > self.finished_ttl:
+            self._evict(task_id)
+            return None
+        return task
+
+    def create(self, task_id: Optional[str] = None) -> str:
+        self.evict_expired()
+        if len(self._tasks) >= self.max_tasks:
+            if not self._finished:
+                raise TaskStoreFull(f"Task store is full ({self.max_tasks} pending tasks)")
+            oldest = next(iter(self._finished))
+            self._evict(oldest)
+        task_id = task_id or str(uuid.uuid4())
+        self._tasks[task_id] = TaskRecord()
+        self._pending_count += 1
+        return task_id
+
+    def append_partial(self, task_id: str, chunk: str) -> None:
+        task = self._tasks.get(task_id)
+        if task is None or task.finished:
+            return
+        task.partial = (task.partial or "") + chunk
+        self._publish(task, "token", {"chunk": chunk})
+
+    def complete(self, task_id: str, result: str) -> None:
+        task = self._tasks.get(task_id)
+        if task is None or task.finished:
+            return
+        task.status = "done"
+        task.result = result
+        self._finish(task_id, task, {"task_id": task_id, "status": "done", "result": result})
+
+    def fail(self, task_id: str, error: str) -> None:
+        task = self._tasks.get(task_id)
+        if task is None or task.finished:
+            return
+        task.status = "error"
+        task.error = error
+        self._finish(task_id, task, {"task_id": task_id, "status": "error", "error": error})
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None) -> Optional[TaskRecord]:
+        """Wait until the task finishes (or the timeout passes) and return its record."""
+        task = self.get(task_id)
+        if task is None or task.finished:
+            return task
+        if task._event is None:
+            task._event = asyncio.Event()
+        try:
+            await asyncio.wait_for(task._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return task
+
+    def subscribe(self, task_id: str) -> Tuple[Optional[TaskRecord], Optional[asyncio.Queue]]:
+        """Return the task and, if it is still pending, a queue that will receive its events."""
+        task = self.get(task_id)
+        if task is None or task.finished:
+            return task, None
+        queue: asyncio.Queue = asyncio.Queue()
+        if task._subscribers is None:
+            task._subscribers = []
+        task._subscribers.append(queue)
+        return task, queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue) -> None:
+        task = self._tasks.get(task_id)
+        if task is not None and task._subscribers and queue in task._subscribers:
+            task._subscribers.remove(queue)
+
+    def evict_expired(self) -> None:
+        cutoff = monotonic() - self.finished_ttl
+        while self._finished:
+            task_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff:
+                break
+            self._evict(task_id)
+
+    def _finish(self, task_id: str, task: TaskRecord, data: dict) -> None:
+        task.finished_at = monotonic()
+        task.partial = None
+        self._pending_count -= 1
+        self._finished[task_id] = task.finished_at
+        self._publish(task, task.status, data)
+        task._subscribers = None
+        if task._event is not None:
+            task._event.set()
+
+    def _publish(self, task: TaskRecord, event: str, data: dict) -> None:
+        if task._subscribers:
+            for queue in task._subscribers:
+                queue.put_nowait((event, data))
+
+    def _evict(self, task_id: str) -> None:
+        task = self._tasks.pop(task_id, None)
+        self._finished.pop(task_id, None)
+        if task is not None and not task.finished:
+            self._pending_count -= 1
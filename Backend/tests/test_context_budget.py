@@ -0,0 +1,59 @@
+"""process_travel_query: how much conversation memory the agent reads, and which turns count as agent turns."""
+import asyncio
+
+import langflow
+from langflow import LangflowClient
+from token_counter import TokenCounter
+
+REPLY = {"outputs": [{"outputs": [{"results": {"message": {"text": "Here is your plan."}}}]}]}
+
+
+def _run(monkeypatch, history, max_tokens):
+    """Run one turn against a fake flow; returns (reply, session_id and tweaks sent, agent_ran)."""
+    monkeypatch.setenv("LANGFLOW_FLOW_ID", "trip-flow")
+    monkeypatch.setenv("LANGFLOW_MAX_TOKENS", str(max_tokens))
+    monkeypatch.setenv("LANGFLOW_EXPECTED_OUTPUT_TOKENS", "10")
+    monkeypatch.setenv("LANGFLOW_PROMPT_OVERHEAD_TOKENS", "10")
+    monkeypatch.setenv("LANGFLOW_AGENT_COMPONENT_ID", "Agent-1")
+    monkeypatch.setenv("INTENT_ROUTER", "false")
+    monkeypatch.setattr(langflow, "_intent_router", None)
+    monkeypatch.setattr(langflow, "_token_counter", TokenCounter("heuristic"))
+    client = LangflowClient(base_url="http://langflow.test", application_token="test-token")
+    monkeypatch.setattr(langflow, "_langflow_client", client)
+    sent = {}
+
+    async def run_flow(flow_id, message, tweaks=None, session_id=None, **kwargs):
+        sent.update(session_id=session_id, tweaks=tweaks)
+        return REPLY
+
+    monkeypatch.setattr(client, "run_flow", run_flow)
+    agent_ran = []
+    reply = asyncio.run(langflow.process_travel_query(
+        "Plan 3 days in Jaipur", session_id="conv-1", history=history,
+        on_agent_run=lambda: agent_ran.append(True),
+    ))
+    return reply, sent, bool(agent_ran)
+
+
+HISTORY = [
+    {"role": "ai", "content": "Jaipur is lovely in winter. " * 4, "via_agent": True},
+    {"role": "user", "content": "When should I visit Jaipur?"},
+]
+
+
+def test_history_that_fits_is_read_from_the_session(monkeypatch):
+    reply, sent, agent_ran = _run(monkeypatch, HISTORY, max_tokens=1000)
+
+    assert reply == "Here is your plan."
+    assert sent == {"session_id": "conv-1", "tweaks": {"Agent-1": {"n_messages": 2}}}
+    assert agent_ran
+
+
+def test_turn_in_a_fresh_session_is_not_an_agent_turn(monkeypatch):
+    # Room for the message and the reply, but not for the latest earlier turn
+    reply, sent, agent_ran = _run(monkeypatch, HISTORY, max_tokens=40)
+
+    assert reply == "Here is your plan."
+    assert sent["session_id"].startswith("conv-1:")
+    assert sent["tweaks"] == {}
+    assert not agent_ran
@@ -0,0 +1,86 @@
+"""_post_hedged: the hedge race, and cleanup of both requests when the caller goes away."""
+import asyncio
+
+import httpx
+
+import langflow
+from langflow import _post_hedged
+
+URL = "http://langflow.test/api/v1/run/flow"
+
+
+def _client(delays, started, cancelled):
+    """A client whose n-th request answers after delays[n] seconds."""
+
+    async def handler(request):
+        n = len(started)
+        started.append(n)
+        try:
+            await asyncio.sleep(delays[n])
+        except asyncio.CancelledError:
+            cancelled.append(n)
+            raise
+        return httpx.Response(200, json={"request": n})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def _hedged(monkeypatch):
+    monkeypatch.setenv("LANGFLOW_HEDGE_PATHS", "/api/v1/run/flow")
+    monkeypatch.setenv("LANGFLOW_HEDGE_DELAY_SECONDS", "0.05")
+    monkeypatch.setattr(langflow, "_endpoint_stats", {})
+
+
+def test_hedge_wins_and_the_slow_primary_is_cancelled(monkeypatch):
+    _hedged(monkeypatch)
+    started, cancelled = [], []
+
+    async def scenario():
+        async with _client([1.0, 0.01], started, cancelled) as client:
+            response = await _post_hedged(client, URL, timeout=5)
+            await asyncio.sleep(0.01)
+            return response, list(cancelled)
+
+    response, cancelled_then = asyncio.run(scenario())
+    assert response.json() == {"request": 1}
+    assert cancelled_then == [0]
+
+
+def test_cancelling_the_caller_cancels_both_requests(monkeypatch):
+    _hedged(monkeypatch)
+    started, cancelled = [], []
+
+    async def scenario():
+        async with _client([1.0, 1.0], started, cancelled) as client:
+            call = asyncio.create_task(_post_hedged(client, URL, timeout=5))
+            while len(started) < 2:
+                await asyncio.sleep(0.01)
+            call.cancel()
+            try:
+                await call
+            except asyncio.CancelledError:
+                pass
+            await asyncio.sleep(0.01)
+            # Checked before asyncio.run's own cleanup cancels whatever is left
+            return sorted(cancelled)
+
+    assert asyncio.run(scenario()) == [0, 1]
+
+
+def test_error_from_one_request_waits_for_the_other(monkeypatch):
+    _hedged(monkeypatch)
+    started, cancelled = [], []
+
+    async def handler(request):
+        n = len(started)
+        started.append(n)
+        await asyncio.sleep(0.1 if n == 0 else 0.01)
+        if n == 1:
+            raise httpx.ConnectError("refused")
+        return httpx.Response(200, json={"request": n})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await _post_hedged(client, URL, timeout=5)
+
+    assert asyncio.run(scenario()).json() == {"request": 0}
@@ -0,0 +1,53 @@
+"""IntentRouter matching, and the router staying usable when its FAQ or classifier is broken."""
+import json
+
+import langflow
+from intent_router import IntentRouter
+
+
+def test_acknowledgements_only_count_as_thanks_with_a_thanks():
+    router = IntentRouter()
+
+    assert router.route("ok") is None
+    assert router.route("Perfect!") is None
+    assert router.route("ok thanks").intent == "thanks"
+    assert router.route("Great, thank you!").intent == "thanks"
+
+
+def test_patterns_must_cover_the_whole_message():
+    router = IntentRouter()
+
+    assert router.route("Hi there!").intent == "greeting"
+    assert router.route("hi, plan 3 days in Goa") is None
+
+
+def test_classifier_error_sends_the_message_to_the_agent():
+    def classifier(text):
+        raise RuntimeError("model not loaded")
+
+    router = IntentRouter(classifier=classifier)
+
+    assert router.route("what is this app") is None
+    assert router.route("hello").intent == "greeting"
+
+
+def test_invalid_faq_pattern_falls_back_to_the_builtin_intents(tmp_path, monkeypatch):
+    faq = tmp_path / "faq.json"
+    faq.write_text(json.dumps([{"name": "refunds", "patterns": ["refund (policy"], "reply": "..."}]))
+    monkeypatch.setenv("INTENT_FAQ_PATH", str(faq))
+    monkeypatch.setattr(langflow, "_intent_router", None)
+
+    router = langflow.get_intent_router()
+
+    assert router is langflow.get_intent_router()
+    assert router.route("thanks").intent == "thanks"
+    assert router.route("refund policy") is None
+
+
+def test_faq_entries_override_the_builtin_replies(tmp_path, monkeypatch):
+    faq = tmp_path / "faq.json"
+    faq.write_text(json.dumps([{"name": "hello", "patterns": ["hello"], "reply": "Namaste!"}]))
+    monkeypatch.setenv("INTENT_FAQ_PATH", str(faq))
+    monkeypatch.setattr(langflow, "_intent_router", None)
+
+    assert langflow.get_intent_router().route("Hello").reply == "Namaste!"
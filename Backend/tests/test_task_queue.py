@@ -0,0 +1,245 @@
+"""MongoTaskBackend lease handling against an in-memory stand-in for the tasks collection."""
+import asyncio
+import copy
+from datetime import datetime, timedelta, timezone
+
+from task_queue import MongoTaskBackend
+
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+        elif isinstance(cond, dict) and "$lt" in cond:
+            if key not in doc or doc[key] is None or not doc[key] < cond["$lt"]:
+                return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+def _apply(doc, update):
+    doc.update(update.get("$set", {}))
+    for key, amount in update.get("$inc", {}).items():
+        doc[key] = doc.get(key, 0) + amount
+
+
+class FakeTasks:
+    """The subset of the Motor collection API MongoTaskBackend uses."""
+
+    def __init__(self):
+        self.docs = {}
+        self.renewals = 0
+        self.fail_renewals = 0
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+    async def insert_one(self, doc):
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    async def find_one(self, query, projection=None):
+        doc = next((d for d in self.docs.values() if _matches(d, query)), None)
+        return copy.deepcopy(doc)
+
+    async def find_one_and_update(self, query, update, sort=None, return_document=None):
+        candidates = sorted((d for d in self.docs.values() if _matches(d, query)), key=lambda d: d["created_at"])
+        if not candidates:
+            return None
+        _apply(candidates[0], update)
+        return copy.deepcopy(candidates[0])
+
+    async def update_one(self, query, update):
+        if set(update.get("$set", {})) == {"lease_expires"}:
+            self.renewals += 1
+            if self.fail_renewals:
+                self.fail_renewals -= 1
+                raise ConnectionError("primary stepped down")
+        doc = next((d for d in self.docs.values() if _matches(d, query)), None)
+        if doc is not None:
+            _apply(doc, update)
+
+    async def count_documents(self, query):
+        return sum(1 for d in self.docs.values() if _matches(d, query))
+
+
+def _backend(collection, **kwargs):
+    options = {"concurrency": 1, "lease_seconds": 0.15, "poll_interval": 0.01}
+    options.update(kwargs)
+    return MongoTaskBackend(collection, **options)
+
+
+async def _wait_for(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached in time"
+        await asyncio.sleep(0.01)
+
+
+def test_lease_is_renewed_while_the_handler_runs():
+    async def scenario():
+        tasks = FakeTasks()
+        backend = _backend(tasks)
+        calls = []
+
+        async def handler(task_id, payload):
+            calls.append(task_id)
+            await asyncio.sleep(0.4)  # well past one lease period
+            return "done"
+
+        await backend.start(handler)
+        task_id = await backend.enqueue({"message": "hi"})
+        record = await backend.wait(task_id, timeout=2)
+        await backend.stop()
+        return tasks, task_id, record, calls
+
+    tasks, task_id, record, calls = asyncio.run(scenario())
+    assert record.status == "done" and record.result == "done"
+    assert tasks.renewals >= 2
+    assert calls == [task_id]
+    assert tasks.docs[task_id]["attempts"] == 1
+
+
+def test_renewal_keeps_going_after_a_transient_error():
+    async def scenario():
+        tasks = FakeTasks()
+        tasks.fail_renewals = 1
+        backend = _backend(tasks)
+        other_worker = _backend(tasks)
+        calls = []
+
+        async def handler(task_id, payload):
+            calls.append(task_id)
+            await asyncio.sleep(0.4)
+            return "done"
+
+        await backend.start(handler)
+        task_id = await backend.enqueue({"message": "hi"})
+        await _wait_for(lambda: calls)
+        # A second worker polls the whole time; it must never find the lease expired
+        await other_worker.start(handler)
+        record = await backend.wait(task_id, timeout=2)
+        await other_worker.stop()
+        await backend.stop()
+        return tasks, record, calls
+
+    tasks, record, calls = asyncio.run(scenario())
+    assert record.status == "done"
+    assert tasks.renewals >= 2
+    assert len(calls) == 1
+
+
+def test_expired_lease_is_taken_over_by_another_worker():
+    async def scenario():
+        tasks = FakeTasks()
+        now = datetime.now(timezone.utc)
+        await tasks.insert_one({
+            "_id": "t1", "status": "running", "payload": {"message": "hi"}, "attempts": 1,
+            "lease_owner": "dead-worker", "lease_expires": now - timedelta(seconds=1), "created_at": now,
+        })
+        backend = _backend(tasks)
+
+        async def handler(task_id, payload):
+            return f"answered {payload['message']}"
+
+        await backend.start(handler)
+        await _wait_for(lambda: tasks.docs["t1"]["status"] == "done")
+        await backend.stop()
+        return tasks.docs["t1"], backend.worker_id
+
+    doc, worker_id = asyncio.run(scenario())
+    assert doc["result"] == "answered hi"
+    assert doc["attempts"] == 2
+    assert doc["lease_owner"] is None
+
+
+def test_unexpired_lease_is_left_alone():
+    async def scenario():
+        tasks = FakeTasks()
+        now = datetime.now(timezone.utc)
+        await tasks.insert_one({
+            "_id": "t1", "status": "running", "payload": {}, "attempts": 1,
+            "lease_owner": "busy-worker", "lease_expires": now + timedelta(seconds=60), "created_at": now,
+        })
+        backend = _backend(tasks)
+        calls = []
+
+        async def handler(task_id, payload):
+            calls.append(task_id)
+            return "done"
+
+        await backend.start(handler)
+        await asyncio.sleep(0.1)
+        await backend.stop()
+        return tasks.docs["t1"], calls
+
+    doc, calls = asyncio.run(scenario())
+    assert calls == []
+    assert doc["status"] == "running" and doc["lease_owner"] == "busy-worker"
+
+
+def test_task_is_abandoned_after_max_attempts():
+    async def scenario():
+        tasks = FakeTasks()
+        now = datetime.now(timezone.utc)
+        await tasks.insert_one({
+            "_id": "t1", "status": "running", "payload": {}, "attempts": 3,
+            "lease_owner": "dead-worker", "lease_expires": now - timedelta(seconds=1), "created_at": now,
+        })
+        backend = _backend(tasks, max_attempts=3)
+        calls = []
+
+        async def handler(task_id, payload):
+            calls.append(task_id)
+            return "done"
+
+        await backend.start(handler)
+        await _wait_for(lambda: tasks.docs["t1"]["status"] == "error")
+        record = await backend.get("t1")
+        await backend.stop()
+        return record, calls
+
+    record, calls = asyncio.run(scenario())
+    assert calls == []
+    assert record.status == "error"
+    assert "abandoned" in record.error
+
+
+def test_stop_cancels_the_renew_loop_of_a_running_task():
+    async def scenario():
+        tasks = FakeTasks()
+        backend = _backend(tasks)
+        started = asyncio.Event()
+
+        async def handler(task_id, payload):
+            started.set()
+            await asyncio.sleep(3600)
+
+        await backend.start(handler)
+        await backend.enqueue({})
+        await started.wait()
+        await backend.stop()
+        await asyncio.sleep(0)
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_wait_without_timeout_blocks_until_the_task_finishes():
+    async def scenario():
+        tasks = FakeTasks()
+        backend = _backend(tasks)  # not started: the task stays queued until finished below
+        task_id = await backend.enqueue({})
+
+        async def finish_later():
+            await asyncio.sleep(0.1)
+            tasks.docs[task_id].update(status="done", result="late answer")
+
+        finisher = asyncio.create_task(finish_later())
+        record = await backend.wait(task_id)
+        await finisher
+        return record
+
+    record = asyncio.run(scenario())
+    assert record.status == "done" and record.result == "late answer"
@@ -0,0 +1,78 @@
+"""TokenCounter caching and budget fitting, and loading the shared counter off the event loop."""
+import asyncio
+import threading
+import time
+
+import langflow
+from token_counter import MESSAGE_OVERHEAD_TOKENS, TokenCounter, fit_history
+
+
+def test_counts_are_cached_by_digest():
+    counter = TokenCounter("heuristic")
+
+    assert counter.count("Plan 3 days in Jaipur") == counter.count("Plan 3 days in Jaipur")
+    assert counter.snapshot()["hits"] == 1
+    assert all(isinstance(key, bytes) and len(key) == 16 for key in counter._cache)
+
+
+def test_fit_history_keeps_the_newest_turns_that_fit():
+    counter = TokenCounter("heuristic")
+    history = [{"content": "x" * 40}, {"content": "y" * 40}, {"content": "z" * 40}]  # newest first
+    per_message = 10 + MESSAGE_OVERHEAD_TOKENS
+
+    assert fit_history(counter, history, per_message * 2) == history[:2]
+    assert fit_history(counter, history, per_message - 1) == []
+
+
+class _SlowTokenCounter(TokenCounter):
+    """Blocks like a tokenizer download until released, except for the heuristic fallback."""
+
+    release = threading.Event()
+
+    def __init__(self, spec="tiktoken:cl100k_base", **kwargs):
+        if spec != "heuristic":
+            self.release.wait(5)
+        super().__init__("heuristic", **kwargs)
+        self.backend = spec
+
+
+def test_slow_tokenizer_load_falls_back_without_blocking_the_loop(monkeypatch):
+    monkeypatch.setattr(langflow, "TokenCounter", _SlowTokenCounter)
+    monkeypatch.setattr(langflow, "_token_counter", None)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        running = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        counter = await langflow.warm_token_counter(timeout=0.2)
+        elapsed = time.perf_counter() - started
+        running.cancel()
+        return counter, elapsed, ticks
+
+    try:
+        counter, elapsed, ticks = asyncio.run(scenario())
+    finally:
+        _SlowTokenCounter.release.set()
+    assert counter.backend == "heuristic"
+    assert langflow.get_token_counter() is counter
+    assert elapsed < 1
+    assert ticks >= 5  # the loop kept running while the load was stuck
+
+
+def test_tokenizer_load_error_falls_back(monkeypatch):
+    def broken(spec):
+        raise RuntimeError("corrupt encoding file")
+
+    monkeypatch.setattr(langflow, "TokenCounter", lambda spec="heuristic": TokenCounter("heuristic") if spec == "heuristic" else broken(spec))
+    monkeypatch.setattr(langflow, "_token_counter", None)
+
+    counter = asyncio.run(langflow.warm_token_counter(timeout=1))
+
+    assert counter.backend == "heuristic"
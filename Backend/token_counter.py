@@ -0,0 +1,92 @@
+"""
+Local token counting for request budgets.
+
+The backend is chosen by a spec string:
+    tiktoken:<encoding>     OpenAI BPE via the `tiktoken` package (default cl100k_base)
+    hf:<tokenizer.json>     the model's own tokenizer via the optional `tokenizers` package;
+                            exact for the deployed model (e.g. Qwen's tokenizer.json)
+    heuristic               ~4 characters per token
+If the requested backend can't be loaded, counting falls back to the heuristic.
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Sequence
+
+from log_config import get_logger
+
+logger = get_logger("token_counter")
+
+# Role/formatting tokens a chat template adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _heuristic(text: str) -> int:
+    return max(1, -(-len(text) // 4))
+
+
+def _load_encoder(spec: str) -> Callable[[str], int]:
+    kind, _, arg = spec.partition(":")
+    if kind == "tiktoken":
+        import tiktoken
+
+        encoding = tiktoken.get_encoding(arg or "cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    if kind == "hf":
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(arg)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+    if kind == "heuristic":
+        return _heuristic
+    raise ValueError(f"Unknown tokenizer spec {spec!r}")
+
+
+class TokenCounter:
+    """Counts tokens with a local tokenizer. Counts are memoized in a bounded LRU, since the
+    same conversation turns are re-counted before every run of that conversation; entries are
+    keyed by a digest of the text, so the cache doesn't hold on to the messages themselves."""
+
+    def __init__(self, spec: str = "tiktoken:cl100k_base", max_entries: int = 4096):
+        try:
+            self._encode = _load_encoder(spec)
+            self.backend = spec
+        except (ImportError, OSError, ValueError) as e:
+            logger.warning("Tokenizer %s unavailable (%s); estimating ~4 characters per token", spec, e)
+            self._encode = _heuristic
+            self.backend = "heuristic"
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return cached
+        self.stats["misses"] += 1
+        tokens = self._encode(text)
+        self._cache[key] = tokens
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.backend, **self.stats, "entries": len(self._cache)}
+
+
+def fit_history(counter: TokenCounter, history: Sequence[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """The longest run of the newest messages (history is newest first) whose tokens fit in
+    `budget`. Older turns beyond that are dropped, never a turn from the middle."""
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for message in history:
+        cost = counter.count(str(message.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        used += cost
+        kept.append(message)
+    return kept
@@ -0,0 +1,234 @@
+"""
+Lightweight in-process tracing.
+
+`span(name, **attributes)` times a block and nests under whatever span is current in the
+async context (contextvars follow awaits and asyncio tasks). Work that hops through a queue
+carries `current_trace_context()` in its payload and passes it back as `span(..., parent=...)`.
+Finished spans go to an exporter (none by default, or a size-capped JSONL file) and are
+grouped per trace in a bounded in-memory window so the slowest recent traces can be inspected.
+
+Settings (environment):
+    TRACING                 true | false (default true)
+    TRACE_EXPORTER          jsonl | none (default none)
+    TRACE_EXPORT_PATH       JSONL file for finished spans (default traces.jsonl)
+    TRACE_EXPORT_MAX_BYTES  size at which the file is rotated to <path>.1 (default 50 MiB)
+    TRACE_RECENT_TRACES     traces kept in memory for /debug/traces/slowest (default 500)
+"""
+import json
+import os
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter, time
+from typing import Any, Dict, List, Optional
+
+from log_config import get_logger
+
+logger = get_logger("tracing")
+
+MAX_SPANS_PER_TRACE = 200
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "_t0", "duration", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time()
+        self._t0 = perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class SpanExporter:
+    def export(self, span: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class NullSpanExporter(SpanExporter):
+    def export(self, span: Dict[str, Any]) -> None:
+        pass
+
+
+class JsonlSpanExporter(SpanExporter):
+    """Appends one JSON line per span. Writes happen on a background thread; if it falls
+    behind, spans are dropped rather than blocking the caller. Once the file reaches
+    `max_bytes` it is renamed to `<path>.1` (replacing any older one) and a new file is started,
+    so at most twice `max_bytes` is kept on disk."""
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, max_queue: int = 10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        # Opened here so a bad path fails at startup rather than silently on the thread
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        fh = self._file
+        size = fh.tell()
+        try:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    break
+                line = json.dumps(span, default=str) + "\n"
+                fh.write(line)
+                size += len(line)
+                if size >= self.max_bytes:
+                    fh.close()
+                    os.replace(self.path, self.path + ".1")
+                    fh = open(self.path, "a", encoding="utf-8")
+                    size = 0
+                elif self._queue.empty():
+                    fh.flush()
+        except OSError as e:
+            logger.error("Trace export to %s stopped: %s", self.path, e)
+        finally:
+            fh.close()
+
+    def close(self) -> None:
+        try:
+            self._queue.put(None, timeout=1)
+        except queue.Full:
+            return
+        self._thread.join(timeout=5)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, exporter: SpanExporter, max_traces: int = 500, enabled: bool = True):
+        self.exporter = exporter
+        self.max_traces = max_traces
+        self.enabled = enabled
+        # trace_id -> finished span dicts, most recently touched last
+        self._traces: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Dict[str, str]] = None, **attributes: Any):
+        """Time the block as a span. `parent` (from current_trace_context) overrides the
+        span that is current in this context."""
+        if not self.enabled:
+            yield None
+            return
+        current = _current_span.get()
+        if parent:
+            trace_id, parent_id = parent["trace_id"], parent.get("span_id")
+        elif current is not None:
+            trace_id, parent_id = current.trace_id, current.span_id
+        else:
+            trace_id, parent_id = uuid.uuid4().hex, None
+        span = Span(trace_id, parent_id, name, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = perf_counter() - span._t0
+            self._record(span.to_dict())
+
+    def _record(self, span: Dict[str, Any]) -> None:
+        self.exporter.export(span)
+        spans = self._traces.get(span["trace_id"])
+        if spans is None:
+            spans = self._traces[span["trace_id"]] = []
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        else:
+            self._traces.move_to_end(span["trace_id"])
+        if len(spans) < MAX_SPANS_PER_TRACE:
+            spans.append(span)
+
+    def slowest(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """The slowest traces in the recent window, each with its spans in start order."""
+        summaries = []
+        for trace_id, spans in self._traces.items():
+            start = min(s["start"] for s in spans)
+            end = max(s["start"] + s["duration_ms"] / 1000 for s in spans)
+            summaries.append({
+                "trace_id": trace_id,
+                "duration_ms": round((end - start) * 1000, 3),
+                "root": next((s["name"] for s in spans if s["parent_id"] is None), spans[0]["name"]),
+                "spans": spans,
+            })
+        summaries.sort(key=lambda t: t["duration_ms"], reverse=True)
+        for summary in summaries[:limit]:
+            summary["spans"] = sorted(summary["spans"], key=lambda s: s["start"])
+        return summaries[:limit]
+
+    def close(self) -> None:
+        self.exporter.close()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        enabled = os.getenv("TRACING", "true").lower() == "true"
+        exporter: SpanExporter = NullSpanExporter()
+        if enabled and os.getenv("TRACE_EXPORTER", "none").lower() == "jsonl":
+            path = os.getenv("TRACE_EXPORT_PATH", "traces.jsonl")
+            try:
+                exporter = JsonlSpanExporter(
+                    path, max_bytes=int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+                )
+            except OSError as e:
+                logger.error("Cannot open trace export file %s: %s", path, e)
+        _tracer = Tracer(exporter, max_traces=int(os.getenv("TRACE_RECENT_TRACES", "500")), enabled=enabled)
+    return _tracer
+
+
+def span(name: str, parent: Optional[Dict[str, str]] = None, **attributes: Any):
+    return get_tracer().span(name, parent=parent, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_context() -> Optional[Dict[str, str]]:
+    """Serializable reference to the current span, for passing through task payloads."""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return {"trace_id": current.trace_id, "span_id": current.span_id}
@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from log_config import get_logger
+from ttl_cache import TTLCache
+
+logger = get_logger("trending_cache")
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 5) -> str:
+    """Encode a coordinate into a geohash string of the given precision."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, val = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if val >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+# Largest side of a geohash tile, in metres, by precision (1-9), at the equator
+GEOHASH_TILE_METRES = (5_000_000, 1_250_000, 156_000, 39_100, 4_890, 1_220, 153, 38.2, 4.77)
+
+
+def geohash_precision_for_radius(radius: float, min_precision: int = 1, tile_fraction: float = 0.2) -> int:
+    """The coarsest precision whose tiles are at most `tile_fraction` of `radius` across, so
+    snapping a query to its tile centre moves it by a small part of the search radius."""
+    for precision, size in enumerate(GEOHASH_TILE_METRES, start=1):
+        if precision >= min_precision and size <= radius * tile_fraction:
+            return precision
+    return len(GEOHASH_TILE_METRES)
+
+
+def geohash_center(geohash: str) -> Tuple[float, float]:
+    """Return the (lat, lon) centre of a geohash tile."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for ch in geohash:
+        cd = _GEOHASH_BASE32.index(ch)
+        for mask in (16, 8, 4, 2, 1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if cd & mask:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+class TrendingCache:
+    """
+    Two-tier cache for OpenTripMap responses used by /trending.
+
+    Tier 1 is a per-process TTLCache. Tier 2 (optional) is a MongoDB collection with a TTL
+    index so that all workers share results. Radius queries are keyed by geohash tile + radius;
+    place details are keyed by xid.
+    """
+
+    def __init__(
+        self,
+        radius_ttl: float = 600,
+        detail_ttl: float = 86400,
+        max_entries: int = 2048,
+        max_bytes: int = 16 * 1024 * 1024,
+        collection=None,
+    ):
+        self.radius_ttl = radius_ttl
+        self.detail_ttl = detail_ttl
+        self.local = TTLCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.collection = collection
+        self.stats: Dict[str, int] = {
+            "radius_hits": 0,
+            "radius_misses": 0,
+            "detail_hits": 0,
+            "detail_misses": 0,
+            "shared_hits": 0,
+        }
+
+    async def ensure_indexes(self) -> None:
+        if self.collection is not None:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def _get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        if self.collection is None:
+            return None
+        try:
+            doc = await self.collection.find_one(
+                {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+            )
+        except Exception as e:
+            logger.error("Trending cache shared tier read failed: %s", e)
+            return None
+        if not doc:
+            return None
+        self.stats["shared_hits"] += 1
+        remaining = (doc["expires_at"].replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)).total_seconds()
+        self.local.set(key, doc["value"], max(remaining, 1))
+        return doc["value"]
+
+    async def _set(self, key: str, value: Any, ttl: float) -> None:
+        self.local.set(key, value, ttl)
+        if self.collection is None:
+            return
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {"value": value, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.error("Trending cache shared tier write failed: %s", e)
+
+    @staticmethod
+    def radius_key(tile: str, radius: int) -> str:
+        return f"radius:{tile}:{radius}"
+
+    @staticmethod
+    def detail_key(xid: str) -> str:
+        return f"xid:{xid}"
+
+    async def get_radius(self, tile: str, radius: int) -> Optional[Any]:
+        value = await self._get(self.radius_key(tile, radius))
+        self.stats["radius_hits" if value is not None else "radius_misses"] += 1
+        return value
+
+    async def set_radius(self, tile: str, radius: int, value: Any) -> None:
+        await self._set(self.radius_key(tile, radius), value, self.radius_ttl)
+
+    async def get_detail(self, xid: str) -> Optional[Any]:
+        value = await self._get(self.detail_key(xid))
+        self.stats["detail_hits" if value is not None else "detail_misses"] += 1
+        return value
+
+    async def set_detail(self, xid: str, value: Any) -> None:
+        await self._set(self.detail_key(xid), value, self.detail_ttl)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "entries": len(self.local),
+            "bytes": self.local.size_bytes,
+            "shared_tier": self.collection is not None,
+        }
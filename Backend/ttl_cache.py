@@ -0,0 +1,60 @@
+import json
+import sys
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Optional, Tuple
+
+
+def _approx_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+class TTLCache:
+    """In-process LRU cache with per-entry TTL, bounded by entry count and approximate bytes."""
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, _, value = entry
+        if expires_at <= monotonic():
+            self._pop(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        size = _approx_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._pop(key)
+        self._data[key] = (monotonic() + ttl, size, value)
+        self._bytes += size
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._pop(oldest)
+
+    def delete(self, key: str) -> None:
+        if key in self._data:
+            self._pop(key)
+
+    def _pop(self, key: str) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
@@ -0,0 +1,254 @@
+"""
+Hotel Finder and Transport Finder against a local SerpApi stub.
+
+The components' code is loaded out of wanderpal_agent.json and executed as Langflow does,
+against minimal stand-ins for the few Langflow base classes it imports (so Langflow itself
+isn't needed), with SERPAPI_BASE_URL pointing at an HTTP server started by the test:
+
+    python -m pytest langflow_flow/tests
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import types
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+FLOW_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "wanderpal_agent.json")
+API_KEY = "test-serpapi-key"
+
+HOTELS = {"properties": [
+    {"name": "Sea Breeze", "rate_per_night": {"lowest": "4,200"}, "overall_rating": 4.4},
+    {"name": "Palm Court", "rate_per_night": {"lowest": "3,100"}, "overall_rating": 4.1},
+]}
+FLIGHTS = {"flight_results": [{"airline": "IndiGo", "price": "₹5,400", "duration": "1h 10m", "departure_time": "07:05"}]}
+ORGANIC = {"organic_results": [
+    {"title": "Shatabdi Express train - IRCTC", "snippet": "Rs 765 departs 06:10 from New Delhi"},
+    {"title": "Volvo AC bus - RedBus", "snippet": "Rs 650 departs 22:00 from Kashmere Gate"},
+]}
+
+
+class SerpApiStub:
+    """Answers /search like SerpApi for the engines the tools use, and records each query."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.status = 200
+        self.queries = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+                stub.queries.append(params)
+                sleep(stub.delay)
+                if stub.status != 200:
+                    body = json.dumps({"error": "Internal error"}).encode()
+                elif params.get("engine") == "google_hotels":
+                    body = json.dumps(HOTELS).encode()
+                elif params.get("q", "").startswith("flight"):
+                    body = json.dumps(FLIGHTS).encode()
+                else:
+                    body = json.dumps(ORGANIC).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def serpapi(monkeypatch):
+    stub = SerpApiStub()
+    monkeypatch.setenv("SERPAPI_BASE_URL", stub.url)
+    monkeypatch.setenv("SERPAPI_API_KEY", API_KEY)
+    # Fresh HTTP client and caches for every test
+    monkeypatch.delitem(sys.modules, "wanderpal_tool_state", raising=False)
+    yield stub
+    stub.close()
+
+
+class Component:
+    """Stand-in for langflow.custom.Component: input values become attributes, defaults
+    first and then the keyword arguments, as Langflow sets them before building."""
+
+    inputs = []
+
+    def __init__(self, **values):
+        self.status = None
+        for field in self.inputs:
+            setattr(self, field.name, field.value)
+        for name, value in values.items():
+            setattr(self, name, value)
+
+
+class MessageTextInput:
+    def __init__(self, name, value=None, **options):
+        self.name = name
+        self.value = value
+
+
+class Output:
+    def __init__(self, **options):
+        self.options = options
+
+
+class Data:
+    def __init__(self, value=None):
+        self.value = value
+
+
+@contextmanager
+def langflow_stubs():
+    """Make `langflow.custom`, `langflow.io` and `langflow.schema` importable for the
+    component code, then put back whatever those names referred to before."""
+    modules = {
+        "langflow": types.ModuleType("langflow"),
+        "langflow.custom": types.ModuleType("langflow.custom"),
+        "langflow.io": types.ModuleType("langflow.io"),
+        "langflow.schema": types.ModuleType("langflow.schema"),
+    }
+    modules["langflow"].__path__ = []
+    modules["langflow.custom"].Component = Component
+    modules["langflow.io"].MessageTextInput = MessageTextInput
+    modules["langflow.io"].Output = Output
+    modules["langflow.schema"].Data = Data
+    saved = {name: sys.modules.get(name) for name in modules}
+    sys.modules.update(modules)
+    try:
+        yield
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+
+def load_component(class_name: str):
+    """Execute the component's code from the flow JSON and return its class."""
+    with open(FLOW_PATH, encoding="utf-8") as fh:
+        flow = json.load(fh)
+    for node in flow["data"]["nodes"]:
+        code = node["data"]["node"]["template"].get("code", {}).get("value", "")
+        if f"class {class_name}(" in code:
+            namespace = {"__name__": f"flow_{class_name}"}
+            with langflow_stubs():
+                exec(compile(code, f"<{class_name}>", "exec"), namespace)
+            return namespace[class_name]
+    raise LookupError(f"{class_name} is not in {FLOW_PATH}")
+
+
+def find_hotels(city="Goa", check_in="2026-12-20", check_out="2026-12-23"):
+    hotel_finder = load_component("HotelFinder")
+    return asyncio.run(hotel_finder(city=city, check_in=check_in, check_out=check_out).build_output()).value
+
+
+def find_transport(mode, origin="Delhi", destination="Jaipur", travel_date="2026-12-20"):
+    transport_finder = load_component("TransportFinder")
+    component = transport_finder(
+        origin=origin, destination=destination, mode=mode, travel_date=travel_date, passengers="2"
+    )
+    return asyncio.run(component.build_output()).value
+
+
+def test_hotels_are_formatted_from_the_search(serpapi):
+    result = find_hotels()
+
+    assert result.startswith("Here are some hotels I found:")
+    assert "1. Sea Breeze (₹4,200/night, 4.4⭐)" in result
+    assert serpapi.queries[0]["q"] == "hotels in Goa"
+    assert serpapi.queries[0]["api_key"] == API_KEY
+
+
+def test_repeat_hotel_search_is_cached_across_code_reloads(serpapi):
+    # Each call re-executes the component code, as Langflow does on every graph build
+    first = find_hotels(city="Goa")
+    second = find_hotels(city=" goa ")
+
+    assert first == second
+    assert len(serpapi.queries) == 1
+
+
+def test_failed_search_is_not_cached_and_hides_the_key(serpapi):
+    serpapi.status = 500
+    failed = find_hotels()
+    serpapi.status = 200
+    recovered = find_hotels()
+
+    assert failed.startswith("Error 500")
+    assert API_KEY not in failed
+    assert recovered.startswith("Here are some hotels I found:")
+    assert len(serpapi.queries) == 2
+
+
+def test_unreachable_serpapi_error_hides_the_key(serpapi):
+    serpapi.close()
+
+    result = find_hotels()
+
+    assert result.startswith("Error: hotel search failed")
+    assert API_KEY not in result
+
+
+def test_any_mode_queries_every_mode_concurrently(serpapi):
+    serpapi.delay = 0.3
+
+    started = perf_counter()
+    result = find_transport("any")
+    elapsed = perf_counter() - started
+
+    assert sorted(q["q"].split()[0] for q in serpapi.queries) == ["bus", "flight", "train"]
+    assert "flight options from Delhi to Jaipur" in result
+    assert "train options from Delhi to Jaipur" in result
+    assert "bus options from Delhi to Jaipur" in result
+    assert elapsed < 0.3 * 2
+
+
+def test_transport_results_are_cached_per_mode(serpapi):
+    find_transport("any")
+    find_transport("train")
+
+    assert len(serpapi.queries) == 3
+
+
+def test_client_from_another_event_loop_is_closed(serpapi):
+    state_client = lambda: sys.modules["wanderpal_tool_state"].client  # noqa: E731
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        hotel_finder = load_component("HotelFinder")
+        asyncio.run_coroutine_threadsafe(hotel_finder(city="Goa").build_output(), loop).result(timeout=5)
+        old_client = state_client()
+
+        find_hotels(city="Pune")
+        # The old client is closed on its own loop
+        for _ in range(50):
+            if old_client.is_closed:
+                break
+            sleep(0.02)
+
+        assert state_client() is not old_client
+        assert old_client.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
@@ -79,6 +79,12 @@ const Chat = () => {
   ]);
   
   const [conversations, setConversations] = useState<Conversation[]>([]);
+  // Cursors for the next page of older items; null when everything has been loaded
+  const [conversationsCursor, setConversationsCursor] = useState<string | null>(null);
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
+  // Set while older messages are prepended, so the view doesn't jump to the bottom
+  const skipScrollRef = useRef(false);
 // This automatically loads the last active chat ID from the browser's storage
   const [currentConversationId, setCurrentConversationId] = useState<string | null>(
     () => localStorage.getItem("lastActiveChatId")
@@ -157,19 +163,25 @@ const Chat = () => {
   useEffect(() => {
     // Only scroll if we are not loading. This stops the page from jumping
     // while the user is trying to read the newly loaded history.
+    if (skipScrollRef.current) {
+      skipScrollRef.current = false;
+      return;
+    }
     if (!isLoading) {
       messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
     }
   }, [messages, isLoading]); // Dependency array updated
 
 // function to fetch the list of conversations for the sidebar
-  const fetchConversations = useCallback(async () => {
+  // Without `before` this (re)loads the newest page; with it, the next older page is appended.
+  const fetchConversations = useCallback(async (before?: string) => {
     const token = localStorage.getItem('token');
     if (!token) return; // Not logged in, can't fetch convos
 
     try {
       // Calls your new GET /conversations endpoint
-      const response = await fetch('http://localhost:8000/conversations', {
+      const query = before ? `?before=${encodeURIComponent(before)}` : '';
+      const response = await fetch(`http://localhost:8000/conversations${query}`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       if (!response.ok) {
@@ -177,7 +189,9 @@ const Chat = () => {
         return;
       }
       const data = await response.json();
-      setConversations(data.conversations || []); // Saves the list to our new state
+      const page: Conversation[] = data.conversations || [];
+      setConversations(prev => (before ? [...prev, ...page] : page)); // Saves the list to our new state
+      setConversationsCursor(data.next_before || null);
     } catch (err) {
       console.error('Failed to fetch conversations:', err);
     }
@@ -191,12 +205,47 @@ const Chat = () => {
     }
   }, [fetchConversations]); // Runs once on mount
 
+  const toMessages = (history: any[]): Message[] =>
+    history.map((msg: any) => ({
+      id: msg.id,
+      type: msg.role,
+      content: msg.content,
+      timestamp: new Date(msg.timestamp)
+    }));
+
+  // Prepend the page of messages before the oldest one shown
+  const loadOlderMessages = async () => {
+    const token = localStorage.getItem('token');
+    if (!token || !currentConversationId || !historyCursor) return;
+
+    setIsLoadingOlder(true);
+    try {
+      const response = await fetch(
+        `http://localhost:8000/chat/history/${currentConversationId}?before=${encodeURIComponent(historyCursor)}`,
+        { headers: { 'Authorization': `Bearer ${token}` } }
+      );
+      if (!response.ok) {
+        console.error('Could not fetch older messages');
+        return;
+      }
+      const data = await response.json();
+      skipScrollRef.current = true;
+      setMessages(prev => [...toMessages(data.history || []), ...prev]);
+      setHistoryCursor(data.next_before || null);
+    } catch (err) {
+      console.error('Error fetching older messages:', err);
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  };
+
   useEffect(() => {
     const fetchHistory = async (convoId: string) => {
       const token = localStorage.getItem('token');
       if (!token) return;
 
       setIsLoading(true); // Show loader while fetching this chat's history
+      setHistoryCursor(null);
       try {
         // Calls your new GET /chat/history/{id} endpoint
         const response = await fetch(`http://localhost:8000/chat/history/${convoId}`, {
@@ -212,13 +261,8 @@ const Chat = () => {
         const data = await response.json();
         if (data.history && data.history.length > 0) {
           // Format the DB data into the React Message interface
-          const loadedMessages: Message[] = data.history.map((msg: any) => ({
-            id: msg.id,
-            type: msg.role,
-            content: msg.content,
-            timestamp: new Date(msg.timestamp)
-          }));
-          setMessages(loadedMessages); // Load the messages into the window
+          setMessages(toMessages(data.history)); // Load the messages into the window
+          setHistoryCursor(data.next_before || null);
         } else {
           // This chat is empty, just show the welcome message
           setMessages([DEFAULT_WELCOME_MESSAGE]);
@@ -236,6 +280,7 @@ const Chat = () => {
     } else {
       // If user clicked "New Chat" (so the ID is null), just reset the messages
       setMessages([DEFAULT_WELCOME_MESSAGE]);
+      setHistoryCursor(null);
     }
   }, [currentConversationId]); // This is the key: it re-runs ANY time currentConversationId changes
 
@@ -334,6 +379,57 @@ const Chat = () => {
     }, 3000); // Poll every 3 seconds
   };
 
+  // Subscribe to server-sent events for a task: token chunks are appended to a live AI
+  // message and the final result replaces it. Falls back to polling if the stream can't open.
+  const streamResult = (taskId: string, token: string | null) => {
+    const source = new EventSource(`http://localhost:8000/chat/stream/${taskId}`);
+    const aiMessageId = (Date.now() + 1).toString();
+    let received = false;
+    let streamed = '';
+
+    const upsertAiMessage = (content: string) => {
+      setMessages(prev => {
+        const exists = prev.some(m => m.id === aiMessageId);
+        if (exists) {
+          return prev.map(m => (m.id === aiMessageId ? { ...m, content } : m));
+        }
+        return [...prev, { id: aiMessageId, type: 'ai', content, timestamp: new Date() }];
+      });
+    };
+
+    source.addEventListener('status', () => {
+      received = true;
+    });
+
+    source.addEventListener('token', (event) => {
+      received = true;
+      streamed += JSON.parse((event as MessageEvent).data).chunk;
+      upsertAiMessage(streamed);
+    });
+
+    source.addEventListener('done', (event) => {
+      source.close();
+      upsertAiMessage(JSON.parse((event as MessageEvent).data).result);
+      setIsLoading(false);
+    });
+
+    source.addEventListener('error', (event) => {
+      source.close();
+      const data = (event as MessageEvent).data;
+      if (data) {
+        // Server-sent task error
+        upsertAiMessage(`I'm sorry, I encountered an error: ${JSON.parse(data).error}`);
+        setIsLoading(false);
+      } else if (!received) {
+        // The stream never opened (e.g. a proxy that buffers SSE); poll instead
+        pollForResult(taskId, token);
+      } else {
+        upsertAiMessage("I'm sorry, I lost connection while waiting for the response.");
+        setIsLoading(false);
+      }
+    });
+  };
+
 // Message handler
   const handleSendMessage = async () => {
     if (!inputValue.trim()) return;
@@ -391,8 +487,8 @@ const Chat = () => {
         fetchConversations(); // <-- This refreshes the sidebar to show the new chat
       }
 
-      // 4. Start polling for the result as normal.
-      pollForResult(task_id, token);
+      // 4. Listen for the result (streamed over SSE, with polling as a fallback).
+      streamResult(task_id, token);
 
     } catch (err) {
       console.error('Failed to start chat task:', err);
@@ -536,6 +632,15 @@ return (
                 <span className="truncate">{convo.title}</span>
               </Button>
             ))}
+            {conversationsCursor && (
+              <Button
+                variant="ghost"
+                className="w-full text-sm text-muted-foreground"
+                onClick={() => fetchConversations(conversationsCursor)}
+              >
+                Load more
+              </Button>
+            )}
           </div>
         </div>
       </nav>
@@ -561,6 +666,14 @@ return (
         {}
         <div className="flex-1 overflow-y-auto">
           <div className="max-w-4xl mx-auto px-4 py-6 space-y-6">
+            {historyCursor && (
+              <div className="flex justify-center">
+                <Button variant="ghost" size="sm" onClick={loadOlderMessages} disabled={isLoadingOlder}>
+                  {isLoadingOlder && <Loader2 className="h-4 w-4 mr-2 animate-spin" />}
+                  Load earlier messages
+                </Button>
+              </div>
+            )}
             {}
             {messages.map((message) => (
               <div